@@ -51,7 +51,7 @@ autodoc_default_options = {
     'show-inheritance': True,
 }
 autodoc_mock_imports = ["pynq", "xrfclk", "xrfdc","tqdm","bitfile_path",
-                        "parserdemo","streamerdemo","qick_asmdemo","helpersdemo","json","collections",
+                        "parserdemo","streamerdemo","qick_asmdemo","helpersdemo","emulatordemo","json","collections",
                         "numpy","os","time","multiprocessing","queue","re","qickdemo"]
 
 
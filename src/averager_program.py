@@ -1,9 +1,78 @@
 """
 Several helper classes for writing qubit experiments.
 """
+from collections import namedtuple
 from tqdm.notebook import tqdm
 import numpy as np
 from qick_asmdemo import QickProgram
+from streamerdemo import DataStreamer
+
+StreamingEstimate = namedtuple('StreamingEstimate', ['count_cycles', 'count_us', 'rate', 'buffer', 'stride',
+                                                     'keeps_up', 'min_count_cycles', 'extra_delay', 'min_stride'])
+
+
+def analyze_streaming(prog, throughput=None, reads_per_count=1, counter_addr=1, margin=0.5):
+    """
+    Predict whether the streaming readout (see DataStreamer) will keep up with a program, before running it.
+
+    The tProc time per counter increment is estimated from the program's loops (see QickProgram.cost_report()):
+    it is the time per repetition of the innermost loop which writes the counter to the data memory, plus its share of the enclosing loop's time outside it (e.g. the update() of a RAveragerProgram).
+    With the transfer speeds measured by DataStreamer.measure_throughput(), this gives the rate at which the streamer can drain the average buffers, transferring one stride at a time.
+    The program is safe if it fills the buffers at no more than the given fraction of that rate.
+
+    :param prog: Program, typically an AveragerProgram or RAveragerProgram
+    :type prog: QickProgram
+    :param throughput: Transfer speeds, as returned by DataStreamer.measure_throughput() (if None, only the timing is estimated)
+    :type throughput: dict
+    :param reads_per_count: Number of data points per counter increment
+    :type reads_per_count: int
+    :param counter_addr: Data memory address for the loop counter
+    :type counter_addr: int
+    :param margin: Fraction of the streamer's capacity that the program may use
+    :type margin: float
+    :return: Estimated tProc cycles and time (us) per counter increment, and data rate (samples per second per channel);
+        buffer length and stride; whether streaming keeps up, the minimum safe tProc cycles per counter increment, the extra delay (cycles) that needs to be added to the loop body, and the minimum safe stride
+    :rtype: StreamingEstimate
+    """
+    soccfg = prog.soccfg
+    store = prog.prog_list
+    writes = [ii for ii in range(len(store)) if store.get_name(ii) == 'memwi' and store.get_args(ii)[2] == counter_addr]
+    loops = prog.cost_report().loops
+    counting = [loop for loop in loops if any([loop.start <= ii <= loop.end for ii in writes])]
+    if not counting:
+        raise RuntimeError("no loop writes the counter to data memory address %d" % (counter_addr))
+    inner = min(counting, key=lambda x: x.end - x.start)
+    count_cycles = inner.cycles
+    outer = [loop for loop in counting if loop is not inner and loop.start <= inner.start and inner.end <= loop.end]
+    if outer and inner.reps:
+        outer = min(outer, key=lambda x: x.end - x.start)
+        count_cycles += max(outer.cycles - inner.reps*inner.cycles, 0)/inner.reps
+
+    count_us = soccfg.cycles2us(count_cycles)
+    rate = reads_per_count/(count_us*1e-6)
+    ro_chs = list(prog.ro_chs) or [0]
+    buffer = min([soccfg['readouts'][ch]['avg_maxlen'] for ch in ro_chs])
+    stride = int(DataStreamer.STRIDE_FRACTION * soccfg['readouts'][0]['avg_maxlen'])
+    if throughput is None:
+        return StreamingEstimate(count_cycles, count_us, rate, buffer, stride, None, None, None, None)
+
+    # time for one pass of the readout loop, which transfers L samples from each channel
+    def transfer_time(L):
+        return throughput['poll'] + len(ro_chs)*(throughput['overhead'] + L/throughput['rate'])
+    capacity = stride/transfer_time(stride)
+    keeps_up = rate <= margin*capacity
+    min_count_cycles = int(np.ceil(reads_per_count/(margin*capacity)*1e6*soccfg['fs_proc']))
+    extra_delay = max(min_count_cycles - int(np.ceil(count_cycles)), 0)
+
+    # smallest stride L with rate*transfer_time(L) <= margin*L
+    min_stride = None
+    spare = margin - rate*len(ro_chs)/throughput['rate']
+    if spare > 0:
+        L = int(np.ceil(rate*(throughput['poll'] + len(ro_chs)*throughput['overhead'])/spare))
+        L += L % 2
+        if L < buffer:
+            min_stride = L
+    return StreamingEstimate(count_cycles, count_us, rate, buffer, stride, keeps_up, min_count_cycles, extra_delay, min_stride)
 
 
 class AveragerProgram(QickProgram):
@@ -0,0 +1,87 @@
+"""
+Timing benchmarks for the QICK software library.
+"""
+import time
+import numpy as np
+
+
+def _time_calls(func, n):
+    """
+    Call a function repeatedly and return the per-call times.
+
+    :param func: Function to call (no arguments)
+    :type func: function
+    :param n: Number of calls
+    :type n: int
+    :return: Per-call times (in seconds)
+    :rtype: numpy.ndarray
+    """
+    times = np.zeros(n)
+    for i in range(n):
+        t0 = time.perf_counter()
+        func()
+        times[i] = time.perf_counter() - t0
+    return times
+
+
+def bench_pmem_write(tproc, binprog, n=10):
+    """
+    Compare the time to write a program image to the tProc program memory with word-by-word writes and with a bulk copy.
+    The program memory is overwritten, and the tProc's record of the loaded program is invalidated.
+
+    :param tproc: tProc driver
+    :type tproc: AxisTProc64x32_x8
+    :param binprog: Program as a list or array of 64-bit ints
+    :type binprog: list or numpy.ndarray
+    :param n: Number of repetitions
+    :type n: int
+    :return: Median time (in seconds) for each write method
+    :rtype: dict
+    """
+    binprog = np.asarray(binprog, dtype=np.uint64)
+    results = {}
+    results['words'] = np.median(_time_calls(lambda: tproc._write_pmem_words(binprog), n))
+    results['bulk'] = np.median(_time_calls(lambda: tproc.write_pmem(binprog), n))
+    tproc.verify_pmem(binprog)
+    tproc.invalidate_program()
+    return results
+
+
+def bench_program_build(soccfg, ch=0, n_pulses=1000, n=5):
+    """
+    Time building and compiling a QickProgram which plays a sequence of constant pulses on one generator.
+    Each pulse sets the pulse registers, so this mostly measures the cost of appending instructions.
+
+    :param soccfg: QICK firmware configuration
+    :type soccfg: QickConfig
+    :param ch: DAC channel (index in 'gens' list), should be a full-speed or interpolated generator
+    :type ch: int
+    :param n_pulses: Number of pulses in the program
+    :type n_pulses: int
+    :param n: Number of repetitions
+    :type n: int
+    :return: Median time (in seconds) to build and to compile the program, and the number of instructions
+    :rtype: dict
+    """
+    from qick_asmdemo import QickProgram
+
+    def build():
+        prog = QickProgram(soccfg)
+        for i in range(n_pulses):
+            prog.set_pulse_registers(ch=ch, style="const", freq=prog.freq2reg(100+i, gen_ch=ch),
+                                     phase=prog.deg2reg(i, gen_ch=ch), gain=1000+i, length=10)
+            prog.pulse(ch=ch, t='auto')
+        prog.end()
+        return prog
+
+    results = {}
+    results['build'] = np.median(_time_calls(build, n))
+    prog = build()
+    def compile():
+        # clear the cached image, so the program is really compiled
+        prog._image_cache = None
+        prog.compile_image()
+
+    results['compile'] = np.median(_time_calls(compile, n))
+    results['instructions'] = len(prog)
+    return results
@@ -0,0 +1,332 @@
+"""
+Offline emulator for the tProcessor, which runs compiled programs without a QICK board.
+"""
+from collections import namedtuple
+import numpy as np
+from qick_asmdemo import QickProgram
+
+TProcEvent = namedtuple('TProcEvent', ['time', 'clock', 'kind', 'ch', 'values'])
+
+# Small integer codes for the instructions, in the order of the dispatch in TProcEmulator.run().
+_op_numbers = {name: i for i, name in enumerate(['regwi', 'set', 'mathi', 'bitwi', 'synci', 'loopnz', 'seti', 'waiti',
+                                                 'memwi', 'memri', 'math', 'bitw', 'memr', 'memw', 'condj', 'sync',
+                                                 'wait', 'read', 'pushi', 'popi', 'setbi', 'setb', 'end'])}
+
+_MASK = 0xffffffff
+
+
+def _signed(x):
+    """
+    Interpret a 32-bit register value as a signed integer.
+
+    :param x: Register value
+    :type x: int
+    :return: Signed value
+    :rtype: int
+    """
+    return ((x & _MASK) ^ 0x80000000) - 0x80000000
+
+
+def _alu(op, a, b):
+    """
+    Apply a math or bitwise op to two register values.
+
+    :param op: Op string
+    :type op: str
+    :param a: First operand
+    :type a: int
+    :param b: Second operand
+    :type b: int
+    :return: Result, as an unsigned 32-bit value
+    :rtype: int
+    """
+    if op == "+":
+        return (a + b) & _MASK
+    if op == "-":
+        return (a - b) & _MASK
+    if op == "*":
+        return (_signed(a) * _signed(b)) & _MASK
+    if op == "&":
+        return a & b
+    if op == "|":
+        return a | b
+    if op == "^":
+        return a ^ b
+    if op == "~":
+        return ~b & _MASK
+    if op == "<<":
+        return (a << (b & 31)) & _MASK
+    if op == ">>":
+        return a >> (b & 31)
+    raise RuntimeError("unknown op %s" % (op))
+
+
+_compare = {">": lambda a, b: a > b, ">=": lambda a, b: a >= b, "<": lambda a, b: a < b,
+            "<=": lambda a, b: a <= b, "==": lambda a, b: a == b, "!=": lambda a, b: a != b}
+
+
+class TProcEmulator():
+    """
+    Emulates the AxisTProc64x32_x8 tProcessor, running a program image (the output of QickProgram.compile()) and logging the outputs it schedules.
+
+    The emulated machine has 8 pages of 32 registers (register 0 always reads 0), the data memory, the stack, and the 8 input ports read by the read instruction (set them in the inputs list).
+    Immediate values are sign-extended from 31 bits, like the hardware, which is why safe_regwi() splits large values.
+    Times follow the tProc's two clocks: the tProc clock advances by inst_cycles for each instruction, and waiti/wait stall it until the time reference plus the wait time;
+    synci/sync advance the time reference, and set/seti/setb/setbi schedule an output at the time reference plus the instruction's time.
+    An output scheduled at a time the tProc clock has already passed would be late on the hardware: such events can be found by comparing the event's time and clock.
+    A data memory address out of range, or a stack overflow or underflow, raises RuntimeError with the index of the instruction.
+
+    :param dmem_size: Number of words in the data memory
+    :type dmem_size: int
+    :param inst_cycles: tProc clock cycles per instruction
+    :type inst_cycles: int
+    :param stack_size: Maximum depth of the stack
+    :type stack_size: int
+    """
+    def __init__(self, dmem_size=4096, inst_cycles=1, stack_size=256):
+        """
+        Constructor method
+        """
+        self.dmem_size = dmem_size
+        self.inst_cycles = inst_cycles
+        self.stack_size = stack_size
+        self.inputs = [0]*8
+        self.prog = []
+        self.reset()
+
+    @classmethod
+    def from_soccfg(cls, soccfg, **kwargs):
+        """
+        Create an emulator with the data memory size of a QICK configuration, if it gives one.
+
+        :param soccfg: QICK firmware configuration
+        :type soccfg: QickConfig
+        :return: Emulator
+        :rtype: TProcEmulator
+        """
+        dmem_size = soccfg['tprocs'][0].get('dmem_size')
+        if dmem_size is not None:
+            kwargs.setdefault('dmem_size', dmem_size)
+        return cls(**kwargs)
+
+    def reset(self):
+        """
+        Clear the registers, data memory, stack, clocks and event log.
+        """
+        self.regs = [0]*256
+        self.dmem = [0]*self.dmem_size
+        self.stack = []
+        self.clock = 0
+        self.tref = 0
+        self.pc = 0
+        self.steps = 0
+        self.events = []
+
+    def load_bin_program(self, binprog):
+        """
+        Load a program image, decoding it once so run() only dispatches.
+
+        :param binprog: Program as a list or array of 64-bit ints
+        :type binprog: list or numpy.ndarray
+        """
+        codes, nargs, args = QickProgram._decode(binprog)
+        names = list(QickProgram.instructions.keys())
+        # sign-extend 31-bit immediates
+        for code in np.unique(codes).tolist():
+            idef = QickProgram.instructions[names[code]]
+            iImm = [iArg for iArg, pos in idef['fmt'] if pos == 0]
+            if idef['type'] == "I" and iImm:
+                iImm = iImm[0]
+                group = codes == code
+                args[group, iImm] = np.where(args[group, iImm] >= 2**30, args[group, iImm] - 2**31, args[group, iImm])
+
+        self.prog = []
+        for code, row in zip(codes.tolist(), args.tolist()):
+            name = names[code]
+            iOp = QickProgram.op_args.get(name)
+            if iOp is not None:
+                row[iOp] = {QickProgram.op_codes[op]: op for op in QickProgram.op_names[name]}[row[iOp]]
+            self.prog.append(self._prepare(name, row))
+
+    def load_program(self, prog):
+        """
+        Load a QickProgram.
+
+        :param prog: Program
+        :type prog: QickProgram
+        """
+        self.load_bin_program(prog.compile_image())
+
+    def _prepare(self, name, a):
+        """
+        Convert a decoded instruction to the tuple that run() dispatches on, with registers given as indices into the flat register file.
+
+        :param name: Instruction name
+        :type name: str
+        :param a: Instruction arguments, as in QickProgram
+        :type a: list
+        :return: Op number and operands
+        :rtype: tuple
+        """
+        op = _op_numbers[name]
+        if name in ['regwi', 'memri', 'memwi', 'popi']:
+            return (op, 32*a[0] + a[1], a[2] if len(a) > 2 else 0)
+        if name in ['mathi', 'bitwi']:
+            return (op, 32*a[0] + a[1], 32*a[0] + a[2], a[3], a[4])
+        if name in ['math', 'bitw']:
+            return (op, 32*a[0] + a[1], 32*a[0] + a[2], a[3], 32*a[0] + a[4])
+        if name in ['memr', 'memw']:
+            return (op, 32*a[0] + a[1], 32*a[0] + a[2])
+        if name == 'set':
+            return (op, a[0], [32*a[1] + r for r in a[2:7]], 32*a[1] + a[7])
+        if name == 'seti':
+            return (op, a[0], 32*a[1] + a[2], a[3])
+        if name == 'synci':
+            return (op, a[0])
+        if name == 'waiti':
+            return (op, a[0], a[1])
+        if name in ['sync', 'wait']:
+            return (op, 32*a[0] + a[1])
+        if name == 'loopnz':
+            return (op, 32*a[0] + a[1], a[2])
+        if name == 'condj':
+            return (op, 32*a[0] + a[1], _compare[a[2]], 32*a[0] + a[3], a[4])
+        if name == 'read':
+            return (op, a[0], a[2], 32*a[1] + a[3])
+        if name == 'pushi':
+            return (op, 32*a[0] + a[1], 32*a[0] + a[2], a[3])
+        if name == 'setbi':
+            return (op, 32*a[0] + a[1], a[2])
+        if name == 'setb':
+            return (op, 32*a[0] + a[1], 32*a[0] + a[2])
+        return (op,)
+
+    def run(self, max_steps=10**8):
+        """
+        Run the program from the current state until the end instruction.
+
+        :param max_steps: Maximum number of instructions to execute, to catch programs that never end
+        :type max_steps: int
+        :return: Event log, one TProcEvent per scheduled output (kind is the instruction name, values are the register values written)
+        :rtype: list
+        """
+        prog = self.prog
+        regs = self.regs
+        dmem = self.dmem
+        dmem_size = len(dmem)
+        stack = self.stack
+        events = self.events
+        dt = self.inst_cycles
+        clock = self.clock
+        tref = self.tref
+        pc = self.pc
+        steps = 0
+        n = len(prog)
+
+        while True:
+            if pc >= n:
+                raise RuntimeError("program ran past its end (no end instruction)")
+            if steps >= max_steps:
+                self.clock, self.tref, self.pc, self.steps = clock, tref, pc, self.steps + steps
+                raise RuntimeError("program didn't end after %d instructions" % (max_steps))
+            inst = prog[pc]
+            op = inst[0]
+            pc += 1
+            steps += 1
+            clock += dt
+            if op == 0:  # regwi
+                if inst[1] & 31:
+                    regs[inst[1]] = inst[2] & _MASK
+            elif op == 1:  # set
+                events.append(TProcEvent(tref + _signed(regs[inst[3]]), clock, 'set', inst[1], tuple([regs[r] for r in inst[2]])))
+            elif op == 2 or op == 3:  # mathi, bitwi
+                if inst[1] & 31:
+                    regs[inst[1]] = _alu(inst[3], regs[inst[2]], inst[4] & _MASK)
+            elif op == 4:  # synci
+                tref += inst[1]
+            elif op == 5:  # loopnz
+                if regs[inst[1]] != 0:
+                    if inst[1] & 31:
+                        regs[inst[1]] = (regs[inst[1]] - 1) & _MASK
+                    pc = inst[2]
+            elif op == 6:  # seti
+                events.append(TProcEvent(tref + inst[3], clock, 'seti', inst[1], (regs[inst[2]],)))
+            elif op == 7:  # waiti
+                clock = max(clock, tref + inst[2])
+            elif op == 8:  # memwi
+                if not 0 <= inst[2] < dmem_size:
+                    raise RuntimeError("instruction %d (memwi): data memory address %d out of range" % (pc-1, inst[2]))
+                dmem[inst[2]] = regs[inst[1]]
+            elif op == 9:  # memri
+                if not 0 <= inst[2] < dmem_size:
+                    raise RuntimeError("instruction %d (memri): data memory address %d out of range" % (pc-1, inst[2]))
+                if inst[1] & 31:
+                    regs[inst[1]] = dmem[inst[2]]
+            elif op == 10 or op == 11:  # math, bitw
+                if inst[1] & 31:
+                    regs[inst[1]] = _alu(inst[3], regs[inst[2]], regs[inst[4]])
+            elif op == 12:  # memr
+                if regs[inst[2]] >= dmem_size:
+                    raise RuntimeError("instruction %d (memr): data memory address %d out of range" % (pc-1, regs[inst[2]]))
+                if inst[1] & 31:
+                    regs[inst[1]] = dmem[regs[inst[2]]]
+            elif op == 13:  # memw
+                if regs[inst[2]] >= dmem_size:
+                    raise RuntimeError("instruction %d (memw): data memory address %d out of range" % (pc-1, regs[inst[2]]))
+                dmem[regs[inst[2]]] = regs[inst[1]]
+            elif op == 14:  # condj
+                if inst[2](_signed(regs[inst[1]]), _signed(regs[inst[3]])):
+                    pc = inst[4]
+            elif op == 15:  # sync
+                tref += _signed(regs[inst[1]])
+            elif op == 16:  # wait
+                clock = max(clock, tref + _signed(regs[inst[1]]))
+            elif op == 17:  # read
+                value = self.inputs[inst[1]]
+                if inst[3] & 31:
+                    regs[inst[3]] = (value >> 32) & _MASK if inst[2] == "upper" else value & _MASK
+            elif op == 18:  # pushi
+                if len(stack) >= self.stack_size:
+                    raise RuntimeError("instruction %d (pushi): stack overflow" % (pc-1))
+                stack.append(regs[inst[2]])
+                if inst[1] & 31:
+                    regs[inst[1]] = inst[3] & _MASK
+            elif op == 19:  # popi
+                if not stack:
+                    raise RuntimeError("instruction %d (popi): stack underflow" % (pc-1))
+                value = stack.pop()
+                if inst[1] & 31:
+                    regs[inst[1]] = value
+            elif op == 20:  # setbi
+                events.append(TProcEvent(tref + inst[2], clock, 'setbi', None, (regs[inst[1]],)))
+            elif op == 21:  # setb
+                events.append(TProcEvent(tref + _signed(regs[inst[2]]), clock, 'setb', None, (regs[inst[1]],)))
+            else:  # end
+                pc -= 1
+                break
+
+        self.clock, self.tref, self.pc, self.steps = clock, tref, pc, self.steps + steps
+        return events
+
+
+def emulate(prog, soccfg=None, **kwargs):
+    """
+    Run a program in a new emulator.
+
+    :param prog: Program, or program image
+    :type prog: QickProgram or list or numpy.ndarray
+    :param soccfg: QICK firmware configuration, used for the data memory size (if None, the program's soccfg is used)
+    :type soccfg: QickConfig
+    :return: Emulator, after running the program (the event log is in its events attribute)
+    :rtype: TProcEmulator
+    """
+    if isinstance(prog, QickProgram):
+        if soccfg is None:
+            soccfg = prog.soccfg
+        image = prog.compile_image()
+    else:
+        image = prog
+    emu = TProcEmulator.from_soccfg(soccfg, **kwargs) if soccfg is not None else TProcEmulator(**kwargs)
+    emu.load_bin_program(image)
+    emu.run()
+    return emu
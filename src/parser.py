@@ -1,876 +1,433 @@
 """
-Function to parse tProc assembly language programs.
+Functions to parse and assemble tProc assembly language programs.
 """
+import os
+import io
 import re
-
-# Function to parse program.
-
-
-def parse_prog(file="prog.asm", outfmt="bin"):
+import hashlib
+import numpy as np
+from qick_asmdemo import QickProgram
+
+# Version of the assembler's output, part of the key for cached programs.
+# Increment this when a change to the assembler code changes the machine code it produces.
+# (Changes to the instruction tables are picked up by _tables_digest().)
+ASSEMBLER_VERSION = 1
+
+# Regular expressions for the assembler, compiled once.
+_comment_re = re.compile(r"^\s*//")
+_inst_re = re.compile(r"^((.+):)?" + r"\s*(pushi|popi|mathi|seti|synci|waiti|bitwi|memri|memwi|regwi|setbi|"
+                      + r"loopnz|condj|end|" + r"math|set|sync|read|wait|bitw|memr|memw|setb)\s+(.+);", flags=re.MULTILINE)
+_end_re = re.compile(r"\s*(end);")
+
+_imm = r"(0?x?\-?[0-9a-fA-F]+)"
+_regs6 = r"\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)"
+
+# Operand syntax of each instruction: a list of alternative (regex, args) pairs.
+# args gives the QickProgram argument list, where an int is a regex group number and a string is a literal.
+# Note that pushi takes its registers in the opposite order from QickProgram.
+_asm_syntax = {
+    'pushi': [(r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*(\-?\d+)", (1, 3, 2, 4))],
+    'popi': [(r"\s*(\d+)\s*,\s*\$(\d+)", (1, 2))],
+    'mathi': [(r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*([\+\-\*])\s*" + _imm, (1, 2, 3, 4, 5))],
+    'seti': [(r"\s*(\d+)\s*,\s*(\d+)\s*,\s*\$(\d+)\s*,\s*(\-?\d+)", (1, 2, 3, 4))],
+    'synci': [(r"\s*(\d+)", (1,))],
+    'waiti': [(r"\s*(\d+)\s*,\s*(\d+)", (1, 2))],
+    'bitwi': [(r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*([&|<>^]+)\s*" + _imm, (1, 2, 3, 4, 5)),
+              (r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*~\s*" + _imm, (1, 2, "0", "~", 3))],
+    'memri': [(r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*" + _imm, (1, 2, 3))],
+    'memwi': [(r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*" + _imm, (1, 2, 3))],
+    'regwi': [(r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*" + _imm, (1, 2, 3))],
+    'setbi': [(r"\s*(\d+)\s*,\s*(\d+)\s*,\s*\$(\d+)\s*,\s*(\-?\d+)", (1, 2, 3, 4))],
+    'loopnz': [(r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\@(.+)", (1, 2, 3))],
+    'condj': [(r"\s*(\d+)\s*,\s*\$(\d+)\s*([<>=!]+)\s*\$(\d+)\s*,\s*\@(.+)", (1, 2, 3, 4, 5))],
+    'end': [(r"", ())],
+    'math': [(r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*([\+\-\*])\s*\$(\d+)", (1, 2, 3, 4, 5))],
+    'set': [(r"\s*(\d+)\s*,\s*(\d+)\s*," + _regs6, (1, 2, 3, 4, 5, 6, 7, 8))],
+    'sync': [(r"\s*(\d+)\s*,\s*\$(\d+)", (1, 2))],
+    'read': [(r"\s*(\d+)\s*,\s*(\d+)\s*,\s*(upper|lower)\s+\$(\d+)", (1, 2, 3, 4))],
+    'wait': [(r"\s*(\d+)\s*,\s*(\d+)\s*,\s*\$(\d+)", (1, 2, 3))],
+    'bitw': [(r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*([&|<>^]+)\s*\$(\d+)", (1, 2, 3, 4, 5)),
+             (r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*~\s*\$(\d+)", (1, 2, "0", "~", 3))],
+    'memr': [(r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)", (1, 2, 3))],
+    'memw': [(r"\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)", (1, 2, 3))],
+    'setb': [(r"\s*(\d+)\s*,\s*(\d+)\s*," + _regs6, (1, 2, 3, 4, 5, 6, 7, 8))],
+}
+
+# Field layouts for instructions whose assembly syntax takes different arguments from QickProgram.instructions.
+_asm_fmt = {'setbi': ((1, 53), (0, 50), (2, 36), (3, 0)),
+            'wait': ((1, 53), (0, 50), (2, 31)),
+            'setb': ((1, 53), (0, 50), (2, 36), (7, 31), (3, 26), (4, 21), (5, 16), (6, 11))}
+
+
+def _make_asm_plans(name):
     """
-    Parses the .asm assembly language tProc program into a specified output format (binary or hex)
+    Make the encoding plans for an instruction: for each alternative syntax, the compiled regex, the constant part of the machine code, and the fields to fill from the regex groups.
 
-    :param file: ASM program file name
-    :type file: str
-    :param outfmt: Output format ("bin" or "hex")
-    :type outfmt: str
-    :return: Program in the new output format
-    :rtype: bin or hex
+    :param name: Instruction name
+    :type name: str
+    :return: List of (regex, constant machine code, fields) tuples, where each field is (group number, kind, bit position, maximum value)
+    :rtype: list
     """
-    # Output structure.
-    outProg = {}
-
-    # Instructions.
-    instList = {}
-
-    # I-type.
-    instList['pushi'] = {'bin': '00010000'}
-    instList['popi'] = {'bin': '00010001'}
-    instList['mathi'] = {'bin': '00010010'}
-    instList['seti'] = {'bin': '00010011'}
-    instList['synci'] = {'bin': '00010100'}
-    instList['waiti'] = {'bin': '00010101'}
-    instList['bitwi'] = {'bin': '00010110'}
-    instList['memri'] = {'bin': '00010111'}
-    instList['memwi'] = {'bin': '00011000'}
-    instList['regwi'] = {'bin': '00011001'}
-    instList['setbi'] = {'bin': '00011010'}
-
-    # J-type.
-    instList['loopnz'] = {'bin': '00110000'}
-    instList['condj'] = {'bin': '00110001'}
-    instList['end'] = {'bin': '00111111'}
-
-    # R-type.
-    instList['math'] = {'bin': '01010000'}
-    instList['set'] = {'bin': '01010001'}
-    instList['sync'] = {'bin': '01010010'}
-    instList['read'] = {'bin': '01010011'}
-    instList['wait'] = {'bin': '01010100'}
-    instList['bitw'] = {'bin': '01010101'}
-    instList['memr'] = {'bin': '01010110'}
-    instList['memw'] = {'bin': '01010111'}
-    instList['setb'] = {'bin': '01011000'}
-
-    # Structures for symbols and program.
-    progList = {}
-    symbList = {}
-
-    ##############################
-    ### Read program from file ###
-    ##############################
-    fd = open(file, "r")
-    addr = 0
-    for line in fd:
-        # Match comments.
-        m = re.search("^\s*//", line)
-
-        # If there is a match.
-        if m:
-            # print(line)
-            a = 1
-
-        else:
-            # Match instructions.
-            jump_re = "^((.+):)?"
-            inst_re_I = "pushi|popi|mathi|seti|synci|waiti|bitwi|memri|memwi|regwi|setbi|"
-            inst_re_J = "loopnz|condj|end|"
-            inst_re_R = "math|set|sync|read|wait|bitw|memr|memw|setb"
-            inst_re = "\s*(" + inst_re_I + inst_re_J + inst_re_R + ")\s+(.+);"
-            comp_re = jump_re + inst_re
-            m = re.search(comp_re, line, flags=re.MULTILINE)
-
-            # If there is a match.
-            if m:
-                # Tagged instruction for jump.
-                if m.group(2):
-                    symb = m.group(2)
-                    inst = m.group(3)
-                    args = m.group(4)
-
-                    # Add symbol to symbList.
-                    symbList[symb] = addr
-
-                    # Add instruction to progList.
-                    progList[addr] = {'inst': inst, 'args': args}
-
-                    # Increment address.
-                    addr = addr + 1
-
-                # Normal instruction.
-                else:
-                    inst = m.group(3)
-                    args = m.group(4)
-
-                    # Add instruction to progList.
-                    progList[addr] = {'inst': inst, 'args': args}
-
-                    # Increment address.
-                    addr = addr + 1
-
-            # Check special case of "end" instruction.
-            else:
-                m = re.search("\s*(end);", line)
-
-                # If there is a match.
-                if m:
-                    # Add instruction to progList.
-                    progList[addr] = {'inst': 'end', 'args': ''}
-
-                    # Increment address.
-                    addr = addr + 1
-
-    #########################
-    ### Support functions ###
-    #########################
-    def unsigned2bin(strin, bits=8):
-        maxv = 2**bits - 1
-
-        # Check if hex string.
-        m = re.search("^0x", strin, flags=re.MULTILINE)
-        if m:
-            dec = int(strin, 16)
-        else:
-            dec = int(strin, 10)
-
-        # Check max.
-        if dec > maxv:
-            print("Error: number %d is bigger than %d" % (dec, maxv))
-            return None
-
-        # Convert to binary.
-        fmt = "{0:0" + str(bits) + "b}"
-        binv = fmt.format(dec)
-
-        return binv
-
-    def integer2bin(strin, bits=8):
-        minv = -2**(bits-1)
-        maxv = 2**(bits-1) - 1
-
-        # Check if hex string.
-        m = re.search("^0x", strin, flags=re.MULTILINE)
-        if m:
-            # Special case for hex number.
-            dec = int(strin, 16)
-
-            # Convert to binary.
-            fmt = "{0:0" + str(bits) + "b}"
-            binv = fmt.format(dec)
-
-            return binv
-        else:
-            dec = int(strin, 10)
-
-        # Check max.
-        if dec < minv:
-            print("Error: number %d is smaller than %d" % (dec, minv))
-            return None
-
-        # Check max.
-        if dec > maxv:
-            print("Error: number %d is bigger than %d" % (dec, maxv))
-            return None
-
-        # Check if number is negative.
-        if dec < 0:
-            dec = dec + 2**bits
-
-        # Convert to binary.
-        fmt = "{0:0" + str(bits) + "b}"
-        binv = fmt.format(dec)
-
-        return binv
-
-    def op2bin(op):
-        if op == "0":
-            return "0000"
-        elif op == ">":
-            return "0000"
-        elif op == ">=":
-            return "0001"
-        elif op == "<":
-            return "0010"
-        elif op == "<=":
-            return "0011"
-        elif op == "==":
-            return "0100"
-        elif op == "!=":
-            return "0101"
-        elif op == "+":
-            return "1000"
-        elif op == "-":
-            return "1001"
-        elif op == "*":
-            return "1010"
-        elif op == "&":
-            return "0000"
-        elif op == "|":
-            return "0001"
-        elif op == "^":
-            return "0010"
-        elif op == "~":
-            return "0011"
-        elif op == "<<":
-            return "0100"
-        elif op == ">>":
-            return "0101"
-        elif op == "upper":
-            return "1010"
-        elif op == "lower":
-            return "0101"
-        else:
-            print("Error: operation \"%s\" not recognized" % op)
-            return "1111"
-
-    ######################################
-    ### First pass: parse instructions ###
-    ######################################
-    for e in progList:
-        inst = progList[e]['inst']
-        args = progList[e]['args']
-
-        # I-type: three registers and an immediate value.
-        # I-type:<inst>:page:channel:oper:ra:rb:rc:imm
-
-        # pushi p, $ra, $rb, imm
-        if inst == 'pushi':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*(\-?\d+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                ra = m.group(2)
-                rb = m.group(3)
-                imm = m.group(4)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "I-type:pushi:" + \
-                    page + ":0:0:" + rb + ":" + ra + ":0:" + imm
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # popi p, $r
-        elif inst == 'popi':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                r = m.group(2)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "I-type:popi:" + \
-                    page + ":0:0:" + r + ":0:0:0"
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # mathi p, $ra, $rb oper imm
-        if inst == 'mathi':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*([\+\-\*])\s*(0?x?\-?[0-9a-fA-F]+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                ra = m.group(2)
-                rb = m.group(3)
-                oper = m.group(4)
-                imm = m.group(5)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "I-type:mathi:" + page + \
-                    ":0:" + oper + ":" + ra + ":" + rb + ":0:" + imm
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # seti ch, p, $r, t
-        if inst == 'seti':
-            comp_re = "\s*(\d+)\s*,\s*(\d+)\s*,\s*\$(\d+)\s*,\s*(\-?\d+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                ch = m.group(1)
-                page = m.group(2)
-                ra = m.group(3)
-                t = m.group(4)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "I-type:seti:" + \
-                    page + ":" + ch + ":0:0:" + ra + ":0:" + t
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # synci t
-        if inst == 'synci':
-            comp_re = "\s*(\d+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                t = m.group(1)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "I-type:synci:0:0:0:0:0:0:" + t
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # waiti ch, t
-        if inst == 'waiti':
-            comp_re = "\s*(\d+)\s*,\s*(\d+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                ch = m.group(1)
-                t = m.group(2)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "I-type:waiti:0:" + \
-                    ch + ":0:0:0:0:" + t
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # bitwi p, $ra, $rb oper imm
-        if inst == 'bitwi':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*([&|<>^]+)\s*(0?x?\-?[0-9a-fA-F]+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                ra = m.group(2)
-                rb = m.group(3)
-                oper = m.group(4)
-                imm = m.group(5)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "I-type:bitwi:" + page + \
-                    ":0:" + oper + ":" + ra + ":" + rb + ":0:" + imm
-
-            # bitwi p, $ra, ~imm
-            else:
-                comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*~\s*(0?x?\-?[0-9a-fA-F]+)"
-                m = re.search(comp_re, args)
-
-                # If there is a match.
-                if m:
-                    page = m.group(1)
-                    ra = m.group(2)
-                    oper = "~"
-                    imm = m.group(3)
-
-                    # Add entry into structure.
-                    progList[e]['inst_parse'] = "I-type:bitwi:" + \
-                        page + ":0:" + oper + ":" + ra + ":0:0:" + imm
-
-                # Error: bad instruction format.
-                else:
-                    print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # memri p, $r, imm
-        if inst == 'memri':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*(0?x?\-?[0-9a-fA-F]+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                r = m.group(2)
-                imm = m.group(3)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "I-type:memri:" + \
-                    page + ":0:0:" + r + ":0:0:" + imm
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # memwi p, $r, imm
-        if inst == 'memwi':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*(0?x?\-?[0-9a-fA-F]+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                r = m.group(2)
-                imm = m.group(3)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "I-type:memwi:" + \
-                    page + ":0:0:0:0:" + r + ":" + imm
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # regwi p, $r, imm
-        if inst == 'regwi':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*(0?x?\-?[0-9a-fA-F]+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                r = m.group(2)
-                imm = m.group(3)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "I-type:regwi:" + \
-                    page + ":0:0:" + r + ":0:0:" + imm
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # setbi ch, p, $r, t
-        if inst == 'setbi':
-            comp_re = "\s*(\d+)\s*,\s*(\d+)\s*,\s*\$(\d+)\s*,\s*(\-?\d+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                ch = m.group(1)
-                page = m.group(2)
-                ra = m.group(3)
-                t = m.group(4)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "I-type:setbi:" + \
-                    page + ":" + ch + ":0:0:" + ra + ":0:" + t
-
-            # Error: bad instruction format.
+    idef = QickProgram.instructions[name]
+    fmt = _asm_fmt.get(name, idef['fmt'])
+    plans = []
+    for regex, argmap in _asm_syntax[name]:
+        base = idef['bin'] << 56
+        if name == 'loopnz':
+            base |= QickProgram.op_codes['+'] << 46
+        fields = []
+        for iArg, pos in fmt:
+            if iArg == QickProgram.label_args.get(name):
+                kind = 'label'
+            elif iArg == QickProgram.op_args.get(name):
+                kind = 'op'
+            elif pos == 0 and idef['type'] == "I":
+                kind = 'imm'
             else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # J-type: three registers and an address for jump.
-        # J-type:<inst>:page:oper:ra:rb:rc:addr
-
-        # loopnz p, $r, @label
-        if inst == 'loopnz':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\@(.+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                oper = "+"
-                r = m.group(2)
-                label = m.group(3)
-
-                # Resolve symbol.
-                if label in symbList:
-                    label_addr = symbList[label]
-                else:
-                    print("Error: could not resolve symbol %s on instruction @%d: %s %s" % (
-                        label, e, inst, args))
-
-                # Add entry into structure.
-                regs = r + ":" + r + ":0:" + str(label_addr)
-                progList[e]['inst_parse'] = "J-type:loopnz:" + \
-                    page + ":" + oper + ":" + regs
-
-            # Error: bad instruction format.
+                kind = 'num'
+            if pos == 0:
+                width = QickProgram.imm_widths[idef['type']]
             else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # condj p, $ra op $rb, @label
-        if inst == 'condj':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*([<>=!]+)\s*\$(\d+)\s*,\s*\@(.+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                ra = m.group(2)
-                oper = m.group(3)
-                rb = m.group(4)
-                label = m.group(5)
-
-                # Resolve symbol.
-                if label in symbList:
-                    label_addr = symbList[label]
-                else:
-                    print("Error: could not resolve symbol %s on instruction @%d: %s %s" % (
-                        label, e, inst, args))
-
-                # Add entry into structure.
-                regs = ra + ":" + rb + ":" + str(label_addr)
-                progList[e]['inst_parse'] = "J-type:condj:" + \
-                    page + ":" + oper + ":0:" + regs
-
-            # Error: bad instruction format.
+                width = QickProgram.field_widths[pos]
+            if isinstance(argmap[iArg], str):
+                # literal argument: add it to the constant part
+                base |= (QickProgram.op_codes[argmap[iArg]] if kind == 'op' else int(argmap[iArg])) << pos
             else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # end
-        if inst == 'end':
-            # Add entry into structure.
-            progList[e]['inst_parse'] = "J-type:end:0:0:0:0:0:0"
-
-        # R-type: 8 registers, 7 for reading and 1 for writing.
-        # R-type:<inst>:page:channel:oper:ra:rb:rc:rd:re:rf:rg:rh
-
-        # math p, $ra, $rb oper $rc
-        if inst == 'math':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*([\+\-\*])\s*\$(\d+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                ra = m.group(2)
-                rb = m.group(3)
-                oper = m.group(4)
-                rc = m.group(5)
-
-                # Add entry into structure.
-                regs = ra + ":" + rb + ":" + rc + ":0:0:0:0:0"
-                progList[e]['inst_parse'] = "R-type:math:" + \
-                    page + ":0:" + oper + ":" + regs
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # set ch, p, $ra, $rb, $rc, $rd, $re, $rt
-        if inst == 'set':
-            regs = "\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)"
-            comp_re = "\s*(\d+)\s*,\s*(\d+)\s*," + regs
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                ch = m.group(1)
-                page = m.group(2)
-                ra = m.group(3)
-                rb = m.group(4)
-                rc = m.group(5)
-                rd = m.group(6)
-                ree = m.group(7)
-                rt = m.group(8)
-
-                # Add entry into structure.
-                regs = ra + ":" + rt + ":" + rb + ":" + rc + ":" + rd + ":" + ree + ":0"
-                progList[e]['inst_parse'] = "R-type:set:" + \
-                    page + ":" + ch + ":0:0:" + regs
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # sync p, $r
-        if inst == 'sync':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)"
-            m = re.search(comp_re, args)
+                fields.append((argmap[iArg], kind, pos, 2**width - 1))
+        plans.append((re.compile(regex), base, fields))
+    return plans
 
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                r = m.group(2)
 
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "R-type:sync:" + \
-                    page + ":0:0:0:0:" + r + ":0:0:0:0:0"
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
+# Encoding plans, built on first use by _get_asm_plans() (not at import, so importing this module doesn't depend on QickProgram).
+_asm_plans = {}
 
-        # read ch, p, oper $r
-        if inst == 'read':
-            comp_re = "\s*(\d+)\s*,\s*(\d+)\s*,\s*(upper|lower)\s+\$(\d+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                ch = m.group(1)
-                page = m.group(2)
-                oper = m.group(3)
-                r = m.group(4)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "R-type:read:" + page + \
-                    ":" + ch + ":" + oper + ":" + r + ":0:0:0:0:0:0:0"
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
 
-        # wait ch, p, $r
-        if inst == 'wait':
-            comp_re = "\s*(\d+)\s*,\s*(\d+)\s*,\s*\$(\d+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                ch = m.group(1)
-                page = m.group(2)
-                r = m.group(3)
-
-                # Add entry into structure.
-                progList[e]['inst_parse'] = "R-type:wait:" + \
-                    page + ":" + ch + ":0:0:0:" + r + ":0:0:0:0:0"
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # bitw p, $ra, $rb oper $rc
-        if inst == 'bitw':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*([&|<>^]+)\s*\$(\d+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                ra = m.group(2)
-                rb = m.group(3)
-                oper = m.group(4)
-                rc = m.group(5)
-
-                # Add entry into structure.
-                regs = ra + ":" + rb + ":" + rc + ":0:0:0:0:0"
-                progList[e]['inst_parse'] = "R-type:bitw:" + \
-                    page + ":0:" + oper + ":" + regs
-
-            # bitw p, $ra, ~$rb
-            else:
-                comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*~\s*\$(\d+)"
-                m = re.search(comp_re, args)
-
-                # If there is a match.
-                if m:
-                    page = m.group(1)
-                    ra = m.group(2)
-                    rb = m.group(3)
-                    oper = "~"
-
-                    # Add entry into structure.
-                    regs = ra + ":0:" + ":" + rb + ":0:0:0:0:0"
-                    progList[e]['inst_parse'] = "R-type:bitw:" + \
-                        page + ":0:" + oper + ":" + regs
-
-                # Error: bad instruction format.
-                else:
-                    print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # memr p, $ra, $rb
-        if inst == 'memr':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                ra = m.group(2)
-                rb = m.group(3)
-
-                # Add entry into structure.
-                regs = ra + ":" + rb + ":0:0:0:0:0:0"
-                progList[e]['inst_parse'] = "R-type:memr:" + \
-                    page + ":0:0:" + regs
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # memw p, $ra, $rb
-        if inst == 'memw':
-            comp_re = "\s*(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)"
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                page = m.group(1)
-                ra = m.group(2)
-                rb = m.group(3)
-
-                # Add entry into structure.
-                regs = rb + ":" + ra + ":0:0:0:0:0"
-                progList[e]['inst_parse'] = "R-type:memw:" + \
-                    page + ":0:0:0:" + regs
+def _get_asm_plans(name):
+    """
+    Get the encoding plans for an instruction, building and caching them the first time.
 
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-        # setb ch, p, $ra, $rb, $rc, $rd, $re, $rt
-        if inst == 'setb':
-            regs = "\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)\s*,\s*\$(\d+)"
-            comp_re = "\s*(\d+)\s*,\s*(\d+)\s*," + regs
-            m = re.search(comp_re, args)
-
-            # If there is a match.
-            if m:
-                ch = m.group(1)
-                page = m.group(2)
-                ra = m.group(3)
-                rb = m.group(4)
-                rc = m.group(5)
-                rd = m.group(6)
-                ree = m.group(7)
-                rt = m.group(8)
-
-                # Add entry into structure.
-                regs = ra + ":" + rt + ":" + rb + ":" + rc + ":" + rd + ":" + ree + ":0"
-                progList[e]['inst_parse'] = "R-type:setb:" + \
-                    page + ":" + ch + ":0:0:" + regs
-
-            # Error: bad instruction format.
-            else:
-                print("Error: bad format on instruction @%d: %s" % (e, inst))
-
-    ######################################
-    ### Second pass: convert to binary ###
-    ######################################
-    for e in progList:
-        inst = progList[e]['inst_parse']
-        spl = inst.split(":")
-
-        # I-type
-        if spl[0] == "I-type":
-            # Instruction.
-            if spl[1] in instList:
-                inst_bin = instList[spl[1]]['bin']
-            else:
-                print(
-                    "Error: instruction %s not found on instraction list" % spl[1])
+    :param name: Instruction name
+    :type name: str
+    :return: List of (regex, constant machine code, fields) tuples, see _make_asm_plans()
+    :rtype: list
+    """
+    plans = _asm_plans.get(name)
+    if plans is None:
+        plans = _make_asm_plans(name)
+        _asm_plans[name] = plans
+    return plans
 
-            # page.
-            page = unsigned2bin(spl[2], 3)
 
-            # channel
-            ch = unsigned2bin(spl[3], 3)
+def _asm_number(strin):
+    """
+    Convert a number from an assembly program, in decimal or (with a 0x prefix) hex.
 
-            # oper
-            oper = op2bin(spl[4])
+    :param strin: Number
+    :type strin: str
+    :return: Value
+    :rtype: int
+    """
+    if strin.startswith("0x"):
+        return int(strin, 16)
+    return int(strin, 10)
 
-            # Registers.
-            ra = unsigned2bin(spl[5], 5)
-            rb = unsigned2bin(spl[6], 5)
-            rc = unsigned2bin(spl[7], 5)
 
-            # Immediate.
-            imm = integer2bin(spl[8], 31)
+def _read_asm(lines):
+    """
+    Read the instructions and labels from the lines of an assembly program.
 
-            # Machine code (bin/hex).
-            code = inst_bin + page + ch + oper + ra + rb + rc + imm
-            code_h = "{:016x}".format(int(code, 2))
+    :param lines: Program lines
+    :type lines: iterable
+    :return: Instructions (as (name, operand string) tuples) and label addresses
+    :rtype: tuple
+    """
+    insts = []
+    labels = {}
+    for line in lines:
+        if _comment_re.search(line):
+            continue
+        m = _inst_re.search(line)
+        if m:
+            if m.group(2):
+                labels[m.group(2)] = len(insts)
+            insts.append((m.group(3), m.group(4)))
+        elif _end_re.search(line):
+            insts.append(('end', ''))
+    return insts, labels
 
-            # Write values back into hash.
-            progList[e]['inst_bin'] = code
-            progList[e]['inst_hex'] = code_h
 
-        elif (spl[0] == "J-type"):
-            # Instruction.
-            if spl[1] in instList:
-                inst_bin = instList[spl[1]]['bin']
+def _encode_asm(name, operands, labels, addr):
+    """
+    Encode one assembly instruction.
+
+    :param name: Instruction name
+    :type name: str
+    :param operands: Operand string
+    :type operands: str
+    :param labels: Label addresses
+    :type labels: dict
+    :param addr: Address of the instruction (used in error messages)
+    :type addr: int
+    :return: Machine code
+    :rtype: int
+    """
+    for regex, mcode, fields in _get_asm_plans(name):
+        m = regex.search(operands)
+        if m:
+            break
+    else:
+        raise RuntimeError("bad format on instruction @%d: %s %s" % (addr, name, operands))
+
+    for group, kind, pos, maxv in fields:
+        arg = m.group(group)
+        if kind == 'num':
+            val = _asm_number(arg)
+            if val > maxv:
+                raise RuntimeError("number %d is bigger than %d on instruction @%d: %s %s" % (val, maxv, addr, name, operands))
+        elif kind == 'imm':
+            # signed immediate, except that hex values are taken as-is
+            val = _asm_number(arg)
+            if arg.startswith("0x"):
+                minv = 0
             else:
-                print(
-                    "Error: instruction %s not found on instraction list" % spl[1])
+                minv, maxv = -2**30, 2**30 - 1
+            if val < minv or val > maxv:
+                raise RuntimeError("number %d out of range [%d, %d] on instruction @%d: %s %s" % (val, minv, maxv, addr, name, operands))
+            if val < 0:
+                val += 2**31
+        elif kind == 'label':
+            if arg not in labels:
+                raise RuntimeError("could not resolve symbol %s on instruction @%d: %s %s" % (arg, addr, name, operands))
+            val = labels[arg]
+        else:
+            if arg not in QickProgram.op_codes:
+                raise RuntimeError("operation \"%s\" not recognized on instruction @%d: %s %s" % (arg, addr, name, operands))
+            val = QickProgram.op_codes[arg]
+        mcode |= val << pos
+    return mcode
 
-            # Page.
-            page = unsigned2bin(spl[2], 3)
 
-            # Zeros.
-            z3 = unsigned2bin("0", 3)
+def assemble(file="prog.asm"):
+    """
+    Assembles a .asm tProc program into machine code.
+    This gives the same machine code as parse_prog(), but the regular expressions are compiled once and fields are encoded directly as integers,
+    using the same instruction table as QickProgram.
+    An error in the program raises an exception.
 
-            # oper
-            oper = op2bin(spl[3])
+    :param file: ASM program file name
+    :type file: str
+    :return: Program, one 64-bit word per instruction
+    :rtype: numpy.ndarray
+    """
+    with open(file, "r") as fd:
+        insts, labels = _read_asm(fd)
+    return _assemble_insts(insts, labels)
 
-            # Registers.
-            ra = unsigned2bin(spl[4], 5)
-            rb = unsigned2bin(spl[5], 5)
-            rc = unsigned2bin(spl[6], 5)
 
-            # Zeros.
-            z15 = unsigned2bin("0", 15)
+def assemble_source(source):
+    """
+    Assembles tProc assembly source code into machine code.
 
-            # Address.
-            jmp_addr = unsigned2bin(spl[7], 16)
+    :param source: Program source
+    :type source: str
+    :return: Program, one 64-bit word per instruction
+    :rtype: numpy.ndarray
+    """
+    insts, labels = _read_asm(io.StringIO(source))
+    return _assemble_insts(insts, labels)
 
-            # Machine code (bin/hex).
-            code = inst_bin + page + z3 + oper + ra + rb + rc + z15 + jmp_addr
-            code_h = "{:016x}".format(int(code, 2))
 
-            # Write values back into hash.
-            progList[e]['inst_bin'] = code
-            progList[e]['inst_hex'] = code_h
+# Digest of the instruction tables, computed on first use by _tables_digest().
+_digest = None
 
-        elif (spl[0] == "R-type"):
-            # Instruction.
-            if spl[1] in instList:
-                inst_bin = instList[spl[1]]['bin']
-            else:
-                print(
-                    "Error: instruction \"%s\" not found on instraction list" % spl[1])
 
-            # Page.
-            page = unsigned2bin(spl[2], 3)
+def _tables_digest():
+    """
+    Get a digest of the tables that define the machine code: QickProgram's instruction set and field widths, and the assembler's syntax and field layouts.
+    This is part of the key for cached programs, so a change to the tables never gets a stale image.
 
-            # Channel
-            ch = unsigned2bin(spl[3], 3)
+    :return: SHA-256 hex digest
+    :rtype: str
+    """
+    global _digest
+    if _digest is None:
+        tables = [QickProgram.instructions, QickProgram.op_codes, QickProgram.field_widths, QickProgram.imm_widths,
+                  QickProgram.label_args, QickProgram.op_args, _asm_syntax, _asm_fmt]
+        _digest = hashlib.sha256(repr(tables).encode()).hexdigest()
+    return _digest
 
-            # Oper
-            oper = op2bin(spl[4])
 
-            # Registers.
-            ra = unsigned2bin(spl[5], 5)
-            rb = unsigned2bin(spl[6], 5)
-            rc = unsigned2bin(spl[7], 5)
-            rd = unsigned2bin(spl[8], 5)
-            ree = unsigned2bin(spl[9], 5)
-            rf = unsigned2bin(spl[10], 5)
-            rg = unsigned2bin(spl[11], 5)
-            rh = unsigned2bin(spl[12], 5)
+class AsmCache():
+    """
+    Persistent on-disk cache of assembled programs.
+    Each program is stored as a .npy file named by the SHA-256 hash of its source, the assembler version and the instruction tables, so a changed program or assembler never gets a stale image.
+    When the cache grows past its size or entry limits, the least recently used programs are deleted (a cache hit updates the file's modification time).
+    Errors reading or writing the cache are ignored, and just mean the program is assembled again.
+
+    :param path: Cache directory (if None, "qick/asm" in $XDG_CACHE_HOME or ~/.cache)
+    :type path: str
+    :param max_bytes: Maximum total size of the cached programs
+    :type max_bytes: int
+    :param max_entries: Maximum number of cached programs
+    :type max_entries: int
+    """
+    def __init__(self, path=None, max_bytes=64*2**20, max_entries=1000):
+        """
+        Constructor method
+        """
+        if path is None:
+            cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache")
+            path = os.path.join(cache_home, "qick", "asm")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def filename(self, source):
+        """
+        Get the cache file name for a program.
+
+        :param source: Program source
+        :type source: str
+        :return: Path of the cache file
+        :rtype: str
+        """
+        key = hashlib.sha256(("%d\n%s\n" % (ASSEMBLER_VERSION, _tables_digest()) + source).encode()).hexdigest()
+        return os.path.join(self.path, key + ".npy")
+
+    def get(self, source):
+        """
+        Look up a program in the cache.
+
+        :param source: Program source
+        :type source: str
+        :return: Program image, or None if it is not in the cache
+        :rtype: numpy.ndarray
+        """
+        fname = self.filename(source)
+        try:
+            image = np.load(fname, allow_pickle=False)
+            os.utime(fname)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return image
+
+    def put(self, source, image):
+        """
+        Add a program to the cache, and evict old programs if the cache is over its limits.
+
+        :param source: Program source
+        :type source: str
+        :param image: Program image
+        :type image: numpy.ndarray
+        """
+        fname = self.filename(source)
+        tmpname = "%s.%d.tmp" % (fname, os.getpid())
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmpname, "wb") as fd:
+                np.save(fd, np.asarray(image, dtype=np.uint64), allow_pickle=False)
+            os.replace(tmpname, fname)
+            self.evict()
+        except OSError:
+            pass
+
+    def entries(self):
+        """
+        List the cached programs, least recently used first.
+
+        :return: (path, size, modification time) for each cached program
+        :rtype: list
+        """
+        entries = []
+        try:
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    if entry.name.endswith(".npy"):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((entry.path, st.st_size, st.st_mtime))
+        except OSError:
+            return []
+        return sorted(entries, key=lambda x: x[2])
+
+    def evict(self):
+        """
+        Delete the least recently used programs until the cache is within its limits.
+        """
+        entries = self.entries()
+        total = sum([x[1] for x in entries])
+        for fname, size, mtime in entries:
+            if total <= self.max_bytes and len(entries) <= self.max_entries:
+                break
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+            total -= size
+            entries = entries[1:]
+
+    def clear(self):
+        """
+        Delete all cached programs.
+        """
+        for fname, size, mtime in self.entries():
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+
+# Default cache used by parse_to_bin().
+asm_cache = AsmCache()
+
+
+def _assemble_insts(insts, labels):
+    """
+    Encode a list of instructions.
+
+    :param insts: Instructions, as (name, operand string) tuples
+    :type insts: list
+    :param labels: Label addresses
+    :type labels: dict
+    :return: Program, one 64-bit word per instruction
+    :rtype: numpy.ndarray
+    """
+    return np.array([_encode_asm(name, operands, labels, addr) for addr, (name, operands) in enumerate(insts)], dtype=np.uint64)
 
-            # Zeros.
-            z6 = unsigned2bin("0", 6)
 
-            # Machine code (bin/hex).
-            code = inst_bin + page + ch + oper + ra + \
-                rb + rc + rd + ree + rf + rg + rh + z6
-            code_h = "{:016x}".format(int(code, 2))
+def parse_prog(file="prog.asm", outfmt="bin"):
+    """
+    Parses the .asm assembly language tProc program into a specified output format (binary or hex)
 
-            # Write values back into hash.
-            progList[e]['inst_bin'] = code
-            progList[e]['inst_hex'] = code_h
+    :param file: ASM program file name
+    :type file: str
+    :param outfmt: Output format ("bin" or "hex")
+    :type outfmt: str
+    :return: Program in the new output format
+    :rtype: bin or hex
+    """
+    # Output structure.
+    outProg = {}
 
-        else:
-            print("Error: bad type on instruction @%d: %s" % (e, inst))
+    with open(file, "r") as fd:
+        insts, labels = _read_asm(fd)
+    prog = _assemble_insts(insts, labels).tolist()
 
-    ####################
-    ### Write output ###
-    ####################
     # Binary format.
     if outfmt == "bin":
-        for e in progList:
-            outProg[e] = progList[e]['inst_bin']
+        for e, code in enumerate(prog):
+            outProg[e] = "{:064b}".format(code)
 
     # Hex format.
     elif outfmt == "hex":
-        for e in progList:
-            out = progList[e]['inst_hex'] + " -> " + \
-                progList[e]['inst'] + " " + progList[e]['args']
-            outProg[e] = out
+        for e, code in enumerate(prog):
+            outProg[e] = "{:016x}".format(code) + " -> " + insts[e][0] + " " + insts[e][1]
 
     else:
         print("Error: \"%s\" is not a recognized output format" % outfmt)
@@ -879,14 +436,23 @@ def parse_prog(file="prog.asm", outfmt="bin"):
     return outProg
 
 
-def parse_to_bin(path):
+def parse_to_bin(path, cache=True):
     """
     Parses the .asm assembly language tProc program into a form appropriate for QickSoc.load_bin_program().
+    Assembled programs are kept in the on-disk cache (asm_cache), so an unchanged program is only assembled once.
 
     :param file: ASM program file name
     :type file: str
+    :param cache: If True, use the assembly cache
+    :type cache: bool
     :return: Program as a list of 64-bit ints
     :rtype: list
     """
-    p = parse_prog(path)
-    return [int(p[i], 2) for i in p]
+    with open(path, "r") as fd:
+        source = fd.read()
+    image = asm_cache.get(source) if cache else None
+    if image is None:
+        image = assemble_source(source)
+        if cache:
+            asm_cache.put(source, image)
+    return image.tolist()
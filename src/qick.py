@@ -2,6 +2,8 @@
 The lower-level driver for the QICK library. Contains classes for interfacing with the SoC.
 """
 import os
+import hashlib
+import itertools
 from pynq import Overlay, DefaultIP, allocate
 try:
     import xrfclk
@@ -218,10 +220,7 @@ class AbsSignalGen(SocIp):
         if ro_ch is None:
             rounded_f = f
         else:
-            mixercfg = {}
-            mixercfg['fs'] = self.fs*self.FS_INTERPOLATION
-            mixercfg['b_dds'] = 48
-            fstep = self.soc.calc_fstep(mixercfg, self.soc['readouts'][ro_ch])
+            fstep = self.mixer_fsteps[ro_ch]
             rounded_f = round(f/fstep)*fstep
         # The XRFDC driver uses C integer type conversion to get the register value.
         # The frequency we calculated exactly equals (to within float precision) a valid NCO frequency.
@@ -393,6 +392,31 @@ class AxisSgMux4V1(AbsSignalGen):
                 f, gen_ch=self.ch, ro_ch=ro_ch))
             self.set_freq_int(k_i, out)
 
+    def set_freqs(self, freqs, ro_ch=0):
+        """
+        Set the frequency registers of several outputs, with a single register update.
+        The frequencies are converted in one call, and registers which already hold the new value (as last written by this driver) are not written.
+
+        :param freqs: frequencies in MHz, for outputs 0, 1, ...
+        :type freqs: list
+        :param ro_ch: ADC channel (use None if you don't want to round to a valid ADC frequency)
+        :type ro_ch: int
+        """
+        freqs = np.asarray(freqs, dtype=float)
+        if len(freqs) > 4:
+            raise IndexError("Invalid output index for mux.")
+        regs, _ = self.soc.freqs2reg(freqs, gen_ch=self.ch, ro_ch=ro_ch)
+        changed = False
+        for out, (f, k_i) in enumerate(zip(freqs.tolist(), regs.tolist())):
+            # Sanity check.
+            if f < self.fs and getattr(self, "pinc%d_reg" % (out)) != k_i:
+                setattr(self, "pinc%d_reg" % (out), k_i)
+                changed = True
+
+        # Register update.
+        if changed:
+            self.update()
+
     def set_freq_int(self, k_i, out=0):
         if out not in [0,1,2,3]:
             raise IndexError("Invalid output index for mux.")
@@ -555,7 +579,7 @@ class AxisReadoutV2(SocIp):
         # calculate the exact frequency we expect to see
         ro_freq = f
         if gen_ch is not None: # calculate the frequency that will be applied to the generator
-            ro_freq = self.soc.roundfreq(f, self.soc['gens'][gen_ch], thiscfg)
+            ro_freq = np.round(f/self.fsteps[gen_ch]) * self.fsteps[gen_ch]
         if gen_ch is not None and self.soc.gens[gen_ch].HAS_MIXER:
             ro_freq += self.soc.gens[gen_ch].get_mixer_freq()
         ro_freq = ro_freq % self.fs
@@ -668,40 +692,134 @@ class AxisPFBReadoutV2(SocIp):
         self.sel = sel
         self.outsel_reg = {"product": 0, "input": 1, "dds": 2}[sel]
 
-    def set_freq(self, f, out_ch, gen_ch=0):
+    def _tone_freq(self, f, gen_ch):
         """
-        Set frequency register
+        Calculate the frequency a tone will have at the PFB, with the sign flipped in even Nyquist zones.
 
         :param f: frequency in MHz (before adding any DAC mixer frequency)
         :type f: float
         :param gen_ch: DAC channel (use None if you don't want to round to a valid DAC frequency)
         :type gen_ch: int
+        :return: frequency in MHz
+        :rtype: float
         """
-        thiscfg = {}
-        thiscfg['fs'] = self.fs
-        thiscfg['b_dds'] = self.B_DDS
         # calculate the exact frequency we expect to see
         ro_freq = f
         if gen_ch is not None: # calculate the frequency that will be applied to the generator
-            ro_freq = self.soc.roundfreq(f, self.soc['gens'][gen_ch], thiscfg)
+            ro_freq = np.round(f/self.fsteps[gen_ch]) * self.fsteps[gen_ch]
         if gen_ch is not None and self.soc.gens[gen_ch].HAS_MIXER:
             ro_freq += self.soc.gens[gen_ch].get_mixer_freq()
 
         nqz = int(ro_freq // (self.fs/2)) + 1
         if nqz % 2 == 0: # even Nyquist zone
             ro_freq *= -1
-        # the PFB channels are separated by half the DDS range
-        # round() gives you the single best channel
-        # floor() and ceil() would give you the 2 best channels
-        # if you have two RO frequencies close together, you might need to force one of them onto a non-optimal channel
-        f_steps = int(np.round(ro_freq/(self.fs/16)))
-        f_dds = ro_freq - f_steps*(self.fs/16)
-        in_ch = (4 + f_steps) % 8
+        return ro_freq
 
-        # we can calculate the register value without further referencing the gen_ch
-        freq_int = self.soc.freq2int(f_dds, thiscfg)
+    def _tone_options(self, ro_freq):
+        """
+        List the PFB channels which can read out a tone, best first.
+        The PFB channels are separated by half the DDS range, so the channels given by floor() and ceil() both contain the tone;
+        the one given by round() is closest to the tone.
+
+        :param ro_freq: frequency at the PFB in MHz (see _tone_freq())
+        :type ro_freq: float
+        :return: PFB channel, DDS frequency register value, and DDS frequency in MHz, for each option
+        :rtype: list
+        """
+        thiscfg = {}
+        thiscfg['fs'] = self.fs
+        thiscfg['b_dds'] = self.B_DDS
+        x = ro_freq/(self.fs/16)
+        best = int(np.round(x))
+        options = []
+        for f_steps in [best] + [s for s in sorted(set([int(np.floor(x)), int(np.ceil(x))])) if s != best]:
+            f_dds = ro_freq - f_steps*(self.fs/16)
+            in_ch = (4 + f_steps) % 8
+            # we can calculate the register value without further referencing the gen_ch
+            options.append((in_ch, self.soc.freq2int(f_dds, thiscfg), f_dds))
+        return options
+
+    def set_freq(self, f, out_ch, gen_ch=0):
+        """
+        Set frequency register.
+        The tone is put in the best PFB channel; to configure several outputs whose tones may need the same channel, use set_freqs().
+
+        :param f: frequency in MHz (before adding any DAC mixer frequency)
+        :type f: float
+        :param gen_ch: DAC channel (use None if you don't want to round to a valid DAC frequency)
+        :type gen_ch: int
+        """
+        in_ch, freq_int, f_dds = self._tone_options(self._tone_freq(f, gen_ch))[0]
         self.set_freq_int(freq_int, in_ch, out_ch)
 
+    def plan_freqs(self, tones):
+        """
+        Find a joint assignment of tones to PFB channels.
+        Each tone can use the channel closest to it or the next closest one, and outputs which share a PFB channel must need the same DDS frequency.
+        Of the assignments which meet that, the one with the smallest total distance between the tones and their channel centers is chosen:
+        this puts every tone in its closest channel when that's possible.
+        The DAC mixer frequencies are read from the generators, so they must be set first.
+
+        :param tones: output channel, frequency in MHz (before adding any DAC mixer frequency), and DAC channel (or None) for each tone
+        :type tones: list
+        :return: plan, with keys 'feasible' (bool), 'in_chs' (PFB channel for each output), 'freqs' (DDS register value for each PFB channel used),
+            'offsets' (DDS frequency in MHz for each output), and 'report' (why the tones can't be assigned, if they can't)
+        :rtype: dict
+        """
+        plan = {'feasible': False, 'in_chs': {}, 'freqs': {}, 'offsets': {}, 'report': ""}
+        out_chs = [tone[0] for tone in tones]
+        if len(set(out_chs)) != len(out_chs):
+            plan['report'] = "each output can only read out one tone, but outputs %s were requested" % (out_chs)
+            return plan
+        options = [self._tone_options(self._tone_freq(f, gen_ch)) for out_ch, f, gen_ch in tones]
+
+        best_cost = None
+        for choice in itertools.product(*[range(len(x)) for x in options]):
+            freqs = {}
+            for x, i in zip(options, choice):
+                in_ch, f_int, f_dds = x[i]
+                if freqs.setdefault(in_ch, f_int) != f_int:
+                    break
+            else:
+                cost = sum([abs(x[i][2]) for x, i in zip(options, choice)])
+                if best_cost is None or cost < best_cost:
+                    best_cost = cost
+                    plan['feasible'] = True
+                    plan['in_chs'] = {tone[0]: x[i][0] for tone, x, i in zip(tones, options, choice)}
+                    plan['offsets'] = {tone[0]: float(x[i][2]) for tone, x, i in zip(tones, options, choice)}
+                    plan['freqs'] = freqs
+
+        if not plan['feasible']:
+            lines = ["no assignment of tones to PFB channels gives each PFB channel a single DDS frequency:"]
+            for (out_ch, f, gen_ch), x in zip(tones, options):
+                lines.append("output %d (%f MHz) can use " % (out_ch, f)
+                             + " or ".join(["PFB channel %d (DDS freq %f MHz)" % (in_ch, f_dds) for in_ch, f_int, f_dds in x]))
+            plan['report'] = "\n".join(lines)
+        return plan
+
+    def set_freqs(self, tones):
+        """
+        Set the frequencies of several outputs together, using plan_freqs() to assign the tones to PFB channels.
+        This replaces any frequencies set since initialize().
+        Each register is written once.
+
+        :param tones: output channel, frequency in MHz (before adding any DAC mixer frequency), and DAC channel (or None) for each tone
+        :type tones: list
+        :return: plan, see plan_freqs()
+        :rtype: dict
+        """
+        plan = self.plan_freqs(tones)
+        if not plan['feasible']:
+            raise RuntimeError(plan['report'])
+        self.ch_freqs = dict(plan['freqs'])
+        for in_ch, f_int in plan['freqs'].items():
+            # set the PFB channel's DDS frequency
+            setattr(self, "freq%d_reg"%(in_ch), f_int)
+        for out_ch, in_ch in plan['in_chs'].items():
+            # wire the selected PFB channel to the output
+            setattr(self, "ch%dsel_reg"%(out_ch), in_ch)
+        return plan
+
     def set_freq_int(self, f_int, in_ch, out_ch):
         if in_ch in self.ch_freqs and f_int != self.ch_freqs[in_ch]:
             raise RuntimeError("trying to set PFB channel %d to freq %d, but freq was previously set to %d"%(in_ch, f_int, self.ch_freqs[in_ch]))
@@ -1165,6 +1283,9 @@ class AxisTProc64x32_x8(SocIp):
     # Reserved lower memory section for register access.
     DMEM_OFFSET = 256
 
+    # Machine code for the "end" instruction.
+    END_INST = 0x3F << 56
+
     def __init__(self, description):
         """
         Constructor method
@@ -1189,6 +1310,15 @@ class AxisTProc64x32_x8(SocIp):
         self.DMEM_N = int(description['parameters']['DMEM_N'])
         self.PMEM_N = int(description['parameters']['PMEM_N'])
 
+        # Hash of the program in program memory (None if unknown), see load_bin_program().
+        self.prog_hash = None
+        # Number of program loads that were skipped because the program was already in memory.
+        self.skipped_loads = 0
+        # Copy of the program memory contents (None if unknown), used for delta loads.
+        self.pmem_shadow = None
+        # Default for the delta option of load_bin_program().
+        self.delta_load = False
+
     # Configure this driver with links to its memory and DMA.
     def configure(self, mem, axi_dma):
         # Program memory.
@@ -1228,29 +1358,184 @@ class AxisTProc64x32_x8(SocIp):
         """
         Force the tProc to stop by filling the program memory with "end" instructions.
         For speed, we hard-code the "end" instruction and write directly to the program memory.
-        This typically takes about 1 ms.
+        This typically takes a few ms.
         """
-        # we only write the high half of each program word, the low half doesn't matter
-        np.copyto(self.mem.mmio.array[1::2],np.uint32(0x3F000000))
+        # the low half doesn't matter to the tProc, but we write it too so the shadow copy is exact
+        # (a delta load skips any word that the shadow says is already correct)
+        np.copyto(self.mem.mmio.array[0::2],np.uint32(self.END_INST & 0xffffffff))
+        np.copyto(self.mem.mmio.array[1::2],np.uint32(self.END_INST >> 32))
+        self.invalidate_program()
+        self.pmem_shadow = np.full(self.mem.mmio.length//8, self.END_INST, dtype=np.uint64)
 
         #prog = QickProgram(self.soc)
         #for i in range(self.mem.mmio.length//8):
         #    prog.end()
         #prog.load_program(self.soc)
 
-    def load_bin_program(self, binprog):
+    def invalidate_program(self):
         """
-        Stop the tProcessor and write the program to the tProc program memory.
+        Forget the hash of the resident program, so the next load_bin_program() will always write the program memory.
+        Call this if the program memory was written by some other route.
+        """
+        self.prog_hash = None
+        self.pmem_shadow = None
+
+    def check_pmem_size(self, length, addr=0):
         """
-        self.reset()
+        Check that a program fits in the tProc program memory.
 
-        for ii, inst in enumerate(binprog):
+        :param length: Program length (in instructions)
+        :type length: int
+        :param addr: Starting address (in instructions)
+        :type addr: int
+        """
+        if addr + length > 2**self.PMEM_N:
+            raise RuntimeError("program of %d instructions at address %d doesn't fit in the tProc program memory (%d instructions)"
+                               % (length, addr, 2**self.PMEM_N))
+
+    def write_pmem(self, binprog, addr=0, verify=False):
+        """
+        Write a program image to the tProc program memory.
+        The image is split into low and high 32-bit halves, which are copied into the memory in a single operation.
+
+        :param binprog: Program as a list or array of 64-bit ints
+        :type binprog: list or numpy.ndarray
+        :param addr: Starting address (in instructions)
+        :type addr: int
+        :param verify: If True, read back the memory and check it against the image
+        :type verify: bool
+        """
+        binprog = np.asarray(binprog, dtype=np.uint64)
+        self.check_pmem_size(len(binprog), addr)
+        words = np.empty(2*len(binprog), dtype=np.uint32)
+        words[0::2] = binprog & np.uint64(0xffffffff)
+        words[1::2] = binprog >> np.uint64(32)
+        np.copyto(self.mem.mmio.array[2*addr:2*(addr+len(binprog))], words)
+        if verify:
+            self.verify_pmem(binprog, addr)
+
+    def _write_pmem_words(self, binprog, addr=0):
+        """
+        Write a program image to the tProc program memory, one 32-bit word at a time.
+        This is the slow path which write_pmem() replaces; it is kept for benchmarking.
+
+        :param binprog: Program as a list or array of 64-bit ints
+        :type binprog: list or numpy.ndarray
+        :param addr: Starting address (in instructions)
+        :type addr: int
+        """
+        for ii, inst in enumerate(np.asarray(binprog, dtype=np.uint64).tolist()):
             dec_low = inst & 0xffffffff
             dec_high = inst >> 32
-            self.mem.write(8*ii, value=int(dec_low))
-            self.mem.write(4*(2*ii+1), value=int(dec_high))
+            self.mem.write(8*(addr+ii), value=int(dec_low))
+            self.mem.write(4*(2*(addr+ii)+1), value=int(dec_high))
 
-    def load_program(self, prog="prog.asm", fmt="asm"):
+    def read_pmem(self, addr=0, length=None):
+        """
+        Read back the tProc program memory.
+
+        :param addr: Starting address (in instructions)
+        :type addr: int
+        :param length: Number of instructions (if None, read to the end of the memory)
+        :type length: int
+        :return: Program image
+        :rtype: numpy.ndarray
+        """
+        if length is None:
+            length = self.mem.mmio.length//8 - addr
+        words = self.mem.mmio.array[2*addr:2*(addr+length)].astype(np.uint64)
+        return words[0::2] | (words[1::2] << np.uint64(32))
+
+    def verify_pmem(self, binprog, addr=0):
+        """
+        Check the contents of the tProc program memory against a program image.
+
+        :param binprog: Program as a list or array of 64-bit ints
+        :type binprog: list or numpy.ndarray
+        :param addr: Starting address (in instructions)
+        :type addr: int
+        """
+        binprog = np.asarray(binprog, dtype=np.uint64)
+        readback = self.read_pmem(addr, len(binprog))
+        mismatch = np.nonzero(readback != binprog)[0]
+        if len(mismatch) > 0:
+            ii = mismatch[0]
+            words = []
+            for word in [binprog[ii], readback[ii]]:
+                try:
+                    words.append("%#018x (%s)" % (word, QickProgram.disasm_lines([word])[0]))
+                except RuntimeError:
+                    words.append("%#018x" % (word))
+            expected, found = words
+            raise RuntimeError("program memory doesn't match the program at %d addresses, first at %d: expected %s, found %s"
+                               % (len(mismatch), addr + ii, expected, found))
+
+    def load_bin_program(self, binprog, force=False, delta=None, verify=False):
+        """
+        Stop the tProcessor and write the program to the tProc program memory.
+
+        If the same program is already in program memory, nothing is written (and the count of skipped loads is incremented).
+        Note that the tProc is then not stopped either: use force=True, or call reset() first, if it may still be running.
+
+        In delta mode, the program is compared with a copy of the program memory, and only the 32-bit words that changed are written.
+        Words past the end of the new program are overwritten with "end" instructions if they aren't already.
+        The tProc is not stopped, so this must only be used when the tProc is not running (e.g. the previous program has reached its end).
+
+        :param binprog: Program as a list or array of 64-bit ints
+        :type binprog: list or numpy.ndarray
+        :param force: If True, always do a full write of the program memory
+        :type force: bool
+        :param delta: If True, do a delta load if possible (if None, use the delta_load attribute)
+        :type delta: bool
+        :param verify: If True, read back the program memory and check it against the program
+        :type verify: bool
+        """
+        binprog = np.asarray(binprog, dtype=np.uint64)
+        self.check_pmem_size(len(binprog))
+        prog_hash = hashlib.sha256(binprog.tobytes()).hexdigest()
+        if prog_hash == self.prog_hash and not force:
+            self.skipped_loads += 1
+            return
+        if delta is None:
+            delta = self.delta_load
+
+        if delta and not force and self.pmem_shadow is not None:
+            self._load_delta(binprog)
+        else:
+            self.reset()
+            self.write_pmem(binprog)
+            self.pmem_shadow[:len(binprog)] = binprog
+
+        if verify:
+            self.verify_pmem(binprog)
+        self.prog_hash = prog_hash
+
+    def _load_delta(self, binprog):
+        """
+        Write only the parts of the program memory that differ from the shadow copy.
+
+        :param binprog: Program
+        :type binprog: numpy.ndarray
+        """
+        old = self.pmem_shadow
+        if len(binprog) > len(old):
+            raise RuntimeError("program has %d instructions, but program memory only holds %d" % (len(binprog), len(old)))
+        new = old.copy()
+        new[:len(binprog)] = binprog
+        # past the end of the program, any "end" instruction will do, whatever its low half
+        tail = new[len(binprog):]
+        not_end = (tail >> np.uint64(32)) != np.uint64(self.END_INST >> 32)
+        tail[not_end] = (tail[not_end] & np.uint64(0xffffffff)) | np.uint64(self.END_INST)
+
+        # write the low and high halves that changed
+        for offset, shift in [(0, 0), (1, 32)]:
+            new_half = ((new >> np.uint64(shift)) & np.uint64(0xffffffff)).astype(np.uint32)
+            old_half = ((old >> np.uint64(shift)) & np.uint64(0xffffffff)).astype(np.uint32)
+            changed = np.nonzero(new_half != old_half)[0]
+            self.mem.mmio.array[2*changed + offset] = new_half[changed]
+        self.pmem_shadow = new
+
+    def load_program(self, prog="prog.asm", fmt="asm", verify=False):
         """
         Loads tProc program. If asm progam, it compiles first
 
@@ -1258,23 +1543,20 @@ class AxisTProc64x32_x8(SocIp):
         :type prog: string
         :param fmt: file format
         :type fmt: string
+        :param verify: If True, read back the program memory and check it against the program
+        :type verify: bool
         """
+        # The program memory is written without going through load_bin_program().
+        self.invalidate_program()
+
         # Binary file format.
         if fmt == "bin":
             # Read binary file from disk.
-            fd = open(prog, "r")
+            with open(prog, "r") as fd:
+                progList = [int(line, 2) for line in fd]
 
             # Write memory.
-            addr = 0
-            for line in fd:
-                line.strip("\r\n")
-                dec = int(line, 2)
-                dec_low = dec & 0xffffffff
-                dec_high = dec >> 32
-                self.mem.write(addr, value=int(dec_low))
-                addr = addr + 4
-                self.mem.write(addr, value=int(dec_high))
-                addr = addr + 4
+            self.write_pmem(progList, verify=verify)
 
         # Asm file.
         elif fmt == "asm":
@@ -1282,15 +1564,7 @@ class AxisTProc64x32_x8(SocIp):
             progList = parse_to_bin(prog)
 
             # Load Program Memory.
-            addr = 0
-            for dec in progList:
-                #print ("@" + str(addr) + ": " + str(dec))
-                dec_low = dec & 0xffffffff
-                dec_high = dec >> 32
-                self.mem.write(addr, value=int(dec_low))
-                addr = addr + 4
-                self.mem.write(addr, value=int(dec_high))
-                addr = addr + 4
+            self.write_pmem(progList, verify=verify)
 
     def single_read(self, addr):
         """
@@ -1692,10 +1966,24 @@ class QickSoc(Overlay, QickConfig):
             thiscfg['fs'] = iq.fs
             self['iqs'].append(thiscfg)
 
+        # Precompute the common frequency steps used to match DAC and ADC frequencies.
+        self.calc_fstep_table()
+        for ro_ch, buf in enumerate(self.avg_bufs):
+            # every buffer driven by a readout has the same readout parameters, so any of its columns will do
+            buf.readout.fsteps = self.get_fstep(ro_ch=ro_ch)
+        for gen in self.gens:
+            if gen.HAS_MIXER:
+                mixercfg = {}
+                mixercfg['fs'] = gen.fs*gen.FS_INTERPOLATION
+                mixercfg['b_dds'] = 48
+                gen.mixer_fsteps = [self.calc_fstep(mixercfg, rocfg) for rocfg in self['readouts']]
+
         self['tprocs'] = []
         for tproc in [self.tproc]:
             thiscfg = {}
             thiscfg['trig_output'] = tproc.trig_output
+            thiscfg['pmem_size'] = 2**tproc.PMEM_N
+            thiscfg['dmem_size'] = 2**tproc.DMEM_N
             self['tprocs'].append(thiscfg)
 
     def config_clocks(self, force_init_clks):
@@ -1885,6 +2173,23 @@ class QickSoc(Overlay, QickConfig):
         self.avg_bufs[ch].readout.set_out(sel=output)
         self.avg_bufs[ch].set_freq(frequency, gen_ch=gen_ch)
 
+    def configure_readouts(self, cfgs):
+        """Configure the output style and frequency of several readout channels.
+        Channels which share a PFB readout have their frequencies assigned together (see AxisPFBReadoutV2.set_freqs()).
+        :param cfgs: output type, frequency and DAC channel (see configure_readout()) for each channel, keyed by channel
+        :type cfgs: dict
+        """
+        pfb_tones = {}
+        for ch, (output, frequency, gen_ch) in cfgs.items():
+            buf = self.avg_bufs[ch]
+            buf.readout.set_out(sel=output)
+            if isinstance(buf.readout, AxisPFBReadoutV2):
+                pfb_tones.setdefault(id(buf.readout), (buf.readout, []))[1].append((buf.readoutport, frequency, gen_ch))
+            else:
+                buf.set_freq(frequency, gen_ch=gen_ch)
+        for readout, tones in pfb_tones.values():
+            readout.set_freqs(tones)
+
     def config_avg(self, ch, address=0, length=1, enable=True):
         """Configure and optionally enable accumulation buffer
         :param ch: Channel to configure
@@ -1984,8 +2289,7 @@ class QickSoc(Overlay, QickConfig):
         :param ro_ch: readout channel (use None if you don't want to round to a valid ADC frequency)
         :type ro_ch: int
         """
-        for ii, f in enumerate(freqs):
-            self.gens[ch].set_freq(f, out=ii, ro_ch=ro_ch)
+        self.gens[ch].set_freqs(freqs, ro_ch=ro_ch)
 
     def set_iq(self, ch, f, i, q):
         """
@@ -2010,7 +2314,7 @@ class QickSoc(Overlay, QickConfig):
         :param debug: Debug option
         :type debug: bool
         """
-        self.tproc.load_bin_program(prog.compile(debug=debug))
+        self.tproc.load_bin_program(prog.compile_image(debug=debug))
 
     def reset_gens(self):
         """
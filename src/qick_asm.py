@@ -3,7 +3,11 @@ The higher-level driver for the QICK library. Contains an tProc assembly languag
 """
 import numpy as np
 import json
+import hashlib
+from array import array
 from collections import namedtuple, OrderedDict
+from collections.abc import Sequence
+from contextlib import contextmanager
 from helpers import gauss, triang, DRAG
 
 
@@ -18,11 +22,19 @@ class QickConfig():
     """
 
     def __init__(self, cfg=None):
+        # common frequency steps of channel pairs, keyed by the parameters they depend on (see calc_fstep())
+        self._fstep_cache = {}
+        # common frequency steps of every DAC/ADC pair (see get_fstep())
+        self._fsteps = None
+        # per-channel constants of the unit conversions (phase widths and clock frequencies)
+        self._conv_cache = {}
         if isinstance(cfg, str):
             with open(cfg) as f:
                 self._cfg = json.load(f)
         elif cfg is not None:
             self._cfg = cfg
+        if hasattr(self, '_cfg') and 'gens' in self._cfg and 'readouts' in self._cfg:
+            self.calc_fstep_table()
 
     def __str__(self):
         return self.description()
@@ -32,6 +44,9 @@ class QickConfig():
 
     def __setitem__(self, key, val):
         self._cfg[key] = val
+        self._conv_cache = {}
+        if key in ['gens', 'readouts', 'refclk_freq']:
+            self._fsteps = None
 
     def description(self):
         """
@@ -65,9 +80,11 @@ class QickConfig():
             lines.append("\t\tmaxlen %d (avg) %d (decimated), trigger %d, tProc input %d" % (
                 readout['avg_maxlen'], readout['buf_maxlen'], readout['trigger_bit'], readout['tproc_ch']))
 
-        if hasattr(self, 'tproc'):  # this is a QickSoc
+        tproc = self['tprocs'][0]
+        if 'pmem_size' in tproc:
             lines.append("\n\ttProc: %d words program memory, %d words data memory" % (
-                2**self.tproc.PMEM_N, 2**self.tproc.DMEM_N))
+                tproc['pmem_size'], tproc['dmem_size']))
+        if hasattr(self, 'tproc'):  # this is a QickSoc
             lines.append("\t\tprogram RAM: %d bytes" %
                          (self.tproc.mem.mmio.length))
 
@@ -93,6 +110,16 @@ class QickConfig():
         """
         return json.dumps(self._cfg, indent=4)
 
+    def fingerprint(self):
+        """
+        Compute a hash of the QICK configuration, which identifies the firmware that a program was compiled for.
+        A QickConfig loaded from the JSON description of a QickSoc has the same fingerprint as the QickSoc.
+
+        :return: SHA-256 hash of the configuration, as a hex string
+        :rtype: str
+        """
+        return hashlib.sha256(json.dumps(self._cfg, sort_keys=True).encode()).hexdigest()
+
     def calc_fstep(self, dict1, dict2):
         """
         Finds the least common multiple of the frequency steps of two channels (typically a DAC and ADC)
@@ -104,6 +131,10 @@ class QickConfig():
         :rtype: float
         """
         refclk = self['refclk_freq']
+        key = (refclk, dict1['fs'], dict1['b_dds'], dict2['fs'], dict2['b_dds'])
+        fstep = self._fstep_cache.get(key)
+        if fstep is not None:
+            return fstep
         # Calculate least common multiple of sampling frequencies.
 
         # clock multipliers from refclk to DAC/ADC - always integer
@@ -115,7 +146,37 @@ class QickConfig():
         b_max = max(dict1['b_dds'], dict2['b_dds'])
         mult_lcm = np.lcm(fsmult1 * 2**(b_max - dict1['b_dds']),
                           fsmult2 * 2**(b_max - dict2['b_dds']))
-        return refclk * mult_lcm / 2**b_max
+        fstep = refclk * mult_lcm / 2**b_max
+        self._fstep_cache[key] = fstep
+        return fstep
+
+    def calc_fstep_table(self):
+        """
+        Compute the common frequency step of every DAC and ADC channel pair, for get_fstep().
+        This is done when the configuration is loaded (or, on the QICK, when the firmware's signal paths are mapped).
+        """
+        self._fsteps = np.array([[self.calc_fstep(gencfg, rocfg) for rocfg in self['readouts']] for gencfg in self['gens']],
+                                dtype=float).reshape((len(self['gens']), len(self['readouts'])))
+
+    def get_fstep(self, gen_ch=None, ro_ch=None):
+        """
+        Look up the frequency step common to a DAC and an ADC channel (see calc_fstep()).
+        A frequency which is a multiple of this step can be generated and read out exactly.
+
+        If a channel is not given, the steps for all channels of that kind are returned: with neither channel given, this is the full table, with one row per DAC and one column per ADC.
+
+        :param gen_ch: DAC channel (index in 'gens' list)
+        :type gen_ch: int
+        :param ro_ch: ADC channel (index in 'readouts' list)
+        :type ro_ch: int
+        :return: frequency step (MHz)
+        :rtype: float or numpy.ndarray
+        """
+        if self._fsteps is None:
+            self.calc_fstep_table()
+        if gen_ch is not None and ro_ch is not None:
+            return float(self._fsteps[gen_ch, ro_ch])
+        return self._fsteps[slice(None) if gen_ch is None else gen_ch, slice(None) if ro_ch is None else ro_ch].copy()
 
     def roundfreq(self, f, dict1, dict2):
         """
@@ -147,76 +208,148 @@ class QickConfig():
         :return: Re-formatted frequency
         :rtype: int
         """
-        if otherch is None:
+        fstep = None if otherch is None else self.calc_fstep(thisch, otherch)
+        return self._freq2int(f, thisch, fstep)
+
+    def _freq2int(self, f, thisch, fstep):
+        """
+        Converts frequency in MHz to register value, rounding to a common frequency step first if one is given.
+
+        :param f: frequency (MHz)
+        :type f: float
+        :param thisch: config dict for the channel you're configuring
+        :type thisch: dict
+        :param fstep: frequency step to round to (MHz), or None
+        :type fstep: float
+        :return: Re-formatted frequency
+        :rtype: int
+        """
+        f = np.asarray(f)
+        if fstep is None:
             f_round = f
         else:
-            f_round = self.roundfreq(f, thisch, otherch)
+            f_round = np.round(f/fstep) * fstep
         k_i = np.round(f_round*(2**thisch['b_dds'])/thisch['fs'])
         return np.int64(k_i)
 
-    def freq2reg(self, f, gen_ch=0, ro_ch=None):
+    def freq2reg(self, f, gen_ch=0, ro_ch=None, dtype=None):
         """
         Converts frequency in MHz to tProc DAC register value.
 
         :param f: frequency (MHz)
-        :type f: float
+        :type f: float or array
         :param gen_ch: DAC channel
         :type gen_ch: int
         :param ro_ch: readout channel (use None if you don't want to frequency-match to an ADC)
         :type ro_ch: int
+        :param dtype: NumPy dtype of the result (if None, int64)
+        :type dtype: type
         :return: Re-formatted frequency
-        :rtype: int
+        :rtype: int or numpy.ndarray
         """
-        if ro_ch is None:
-            rocfg = None
-        else:
-            rocfg = self['readouts'][ro_ch]
-        return self.freq2int(f, self['gens'][gen_ch], rocfg)
+        fstep = None if ro_ch is None else self.get_fstep(gen_ch, ro_ch)
+        return _as_dtype(self._freq2int(f, self['gens'][gen_ch], fstep), dtype)
 
-    def freq2reg_adc(self, f, ro_ch=0, gen_ch=None):
+    def freq2reg_adc(self, f, ro_ch=0, gen_ch=None, dtype=None):
         """
         Converts frequency in MHz to ADC register value.
 
         :param f: frequency (MHz)
-        :type f: float
+        :type f: float or array
         :param ro_ch: readout channel
         :type ro_ch: int
         :param gen_ch: DAC channel (use None if you don't want to frequency-match to a DAC)
         :type gen_ch: int
+        :param dtype: NumPy dtype of the result (if None, int64)
+        :type dtype: type
         :return: Re-formatted frequency
-        :rtype: int
+        :rtype: int or numpy.ndarray
         """
-        if gen_ch is None:
-            gencfg = None
-        else:
-            gencfg = self['gens'][gen_ch]
-        return self.freq2int(f, self['readouts'][ro_ch], gencfg)
+        fstep = None if gen_ch is None else self.get_fstep(gen_ch, ro_ch)
+        return _as_dtype(self._freq2int(f, self['readouts'][ro_ch], fstep), dtype)
 
-    def reg2freq(self, r, gen_ch=0):
+    def _freqs2int(self, freqs, thiscfg, fstep):
+        """
+        Convert an array of frequencies to register values, with the same arithmetic as freq2int().
+
+        :param freqs: frequencies (MHz)
+        :type freqs: float or array
+        :param thiscfg: config dict for the channel you're configuring
+        :type thiscfg: dict
+        :param fstep: frequency step to round to (MHz), or None
+        :type fstep: float
+        :return: register values, and the frequencies (MHz) they give
+        :rtype: tuple
+        """
+        f_round = np.asarray(freqs, dtype=float)
+        if fstep is not None:
+            f_round = np.round(f_round/fstep) * fstep
+        regs = np.round(f_round*(2**thiscfg['b_dds'])/thiscfg['fs']).astype(np.int64)
+        return regs, (regs/2**thiscfg['b_dds']) * thiscfg['fs']
+
+    def freqs2reg(self, freqs, gen_ch=0, ro_ch=None):
+        """
+        Converts an array of frequencies in MHz to tProc DAC register values, in one call.
+        The register values are identical to what freq2reg() gives for each frequency.
+
+        :param freqs: frequencies (MHz)
+        :type freqs: float or array
+        :param gen_ch: DAC channel
+        :type gen_ch: int
+        :param ro_ch: readout channel (use None if you don't want to frequency-match to an ADC)
+        :type ro_ch: int
+        :return: register values (as an int64 array), and the frequencies (MHz) the DAC will actually generate
+        :rtype: tuple
+        """
+        fstep = None if ro_ch is None else self.get_fstep(gen_ch, ro_ch)
+        return self._freqs2int(freqs, self['gens'][gen_ch], fstep)
+
+    def freqs2reg_adc(self, freqs, ro_ch=0, gen_ch=None):
+        """
+        Converts an array of frequencies in MHz to ADC register values, in one call.
+        The register values are identical to what freq2reg_adc() gives for each frequency.
+
+        :param freqs: frequencies (MHz)
+        :type freqs: float or array
+        :param ro_ch: readout channel
+        :type ro_ch: int
+        :param gen_ch: DAC channel (use None if you don't want to frequency-match to a DAC)
+        :type gen_ch: int
+        :return: register values (as an int64 array), and the frequencies (MHz) the readout will actually use
+        :rtype: tuple
+        """
+        fstep = None if gen_ch is None else self.get_fstep(gen_ch, ro_ch)
+        return self._freqs2int(freqs, self['readouts'][ro_ch], fstep)
+
+    def reg2freq(self, r, gen_ch=0, dtype=None):
         """
         Converts frequency from format readable by tProc DAC to MHz.
 
         :param r: frequency in tProc DAC format
-        :type r: int
+        :type r: int or array
         :param gen_ch: DAC channel
         :type gen_ch: int
+        :param dtype: NumPy dtype of the result (if None, float)
+        :type dtype: type
         :return: Re-formatted frequency in MHz
-        :rtype: float
+        :rtype: float or numpy.ndarray
         """
-        return (r/2**self['gens'][gen_ch]['b_dds']) * self['gens'][gen_ch]['fs']
+        return _as_dtype((np.asarray(r)/2**self['gens'][gen_ch]['b_dds']) * self['gens'][gen_ch]['fs'], dtype)
 
-    def reg2freq_adc(self, r, ro_ch=0):
+    def reg2freq_adc(self, r, ro_ch=0, dtype=None):
         """
         Converts frequency from format readable by tProc ADC to MHz.
 
         :param r: frequency in tProc ADC format
-        :type r: int
+        :type r: int or array
         :param ro_ch: ADC channel
         :type ro_ch: int
+        :param dtype: NumPy dtype of the result (if None, float)
+        :type dtype: type
         :return: Re-formatted frequency in MHz
-        :rtype: float
+        :rtype: float or numpy.ndarray
         """
-        return (r/2**self['readouts'][ro_ch]['b_dds']) * self['readouts'][ro_ch]['fs']
+        return _as_dtype((np.asarray(r)/2**self['readouts'][ro_ch]['b_dds']) * self['readouts'][ro_ch]['fs'], dtype)
 
     def adcfreq(self, f, gen_ch=0, ro_ch=0):
         """
@@ -231,94 +364,461 @@ class QickConfig():
         :return: Re-formatted frequency
         :rtype: float
         """
-        return self.roundfreq(f, self['gens'][gen_ch], self['readouts'][ro_ch])
+        fstep = self.get_fstep(gen_ch, ro_ch)
+        return np.round(f/fstep) * fstep
 
-    def deg2reg(self, deg, gen_ch=0):
+    def _phase_bits(self, gen_ch):
+        """
+        Get the width of a generator's phase register, from the cache.
+
+        :param gen_ch: DAC channel (index in 'gens' list)
+        :type gen_ch: int
+        :return: Number of phase bits
+        :rtype: int
+        """
+        key = ('phase', gen_ch)
+        b_phase = self._conv_cache.get(key)
+        if b_phase is None:
+            b_phase = 16 if self['gens'][gen_ch]['type'] == 'axis_sg_int4_v1' else 32
+            self._conv_cache[key] = b_phase
+        return b_phase
+
+    def _fclk(self, gen_ch, ro_ch):
+        """
+        Get the clock frequency used for time conversions, from the cache: the fabric clock of a DAC or ADC channel, or the tProc clock.
+
+        :param gen_ch: DAC channel (index in 'gens' list)
+        :type gen_ch: int
+        :param ro_ch: ADC channel (index in 'readouts' list)
+        :type ro_ch: int
+        :return: Clock frequency (MHz)
+        :rtype: float
+        """
+        key = ('fclk', gen_ch, ro_ch)
+        fclk = self._conv_cache.get(key)
+        if fclk is None:
+            if gen_ch is not None and ro_ch is not None:
+                raise RuntimeError("can't specify both gen_ch and ro_ch!")
+            if gen_ch is not None:
+                fclk = self['gens'][gen_ch]['f_fabric']
+            elif ro_ch is not None:
+                fclk = self['readouts'][ro_ch]['f_fabric']
+            else:
+                fclk = self['fs_proc']
+            self._conv_cache[key] = fclk
+        return fclk
+
+    def deg2reg(self, deg, gen_ch=0, dtype=None):
         """
         Converts degrees into phase register values; numbers greater than 360 will effectively be wrapped.
 
         :param deg: Number of degrees
-        :type deg: float
+        :type deg: float or array
+        :param gen_ch: DAC channel (index in 'gens' list)
+        :type gen_ch: int
+        :param dtype: NumPy dtype of the result (if None, int for a scalar and int64 for an array)
+        :type dtype: type
         :return: Re-formatted number of degrees
-        :rtype: int
+        :rtype: int or numpy.ndarray
         """
-        gen_type = self['gens'][gen_ch]['type']
-        if gen_type == 'axis_sg_int4_v1':
-            b_phase = 16
-        else:
-            b_phase = 32
-        return int(deg*2**b_phase//360) % 2**b_phase
+        b_phase = self._phase_bits(gen_ch)
+        if dtype is None and np.ndim(deg) == 0:
+            return int(deg*2**b_phase//360) % 2**b_phase
+        # the floor division and wrap are exact in floating point, so this matches the scalar conversion
+        reg = np.mod(np.floor_divide(np.asarray(deg, dtype=float)*2**b_phase, 360), 2**b_phase).astype(np.int64)
+        return _as_dtype(reg, dtype)
 
-    def reg2deg(self, reg, gen_ch=0):
+    def reg2deg(self, reg, gen_ch=0, dtype=None):
         """
         Converts phase register values into degrees.
 
-        :param cycles: Re-formatted number of degrees
-        :type cycles: int
+        :param reg: Re-formatted number of degrees
+        :type reg: int or array
+        :param gen_ch: DAC channel (index in 'gens' list)
+        :type gen_ch: int
+        :param dtype: NumPy dtype of the result (if None, float)
+        :type dtype: type
         :return: Number of degrees
-        :rtype: float
+        :rtype: float or numpy.ndarray
         """
-        gen_type = self['gens'][gen_ch]['type']
-        if gen_type == 'axis_sg_int4_v1':
-            b_phase = 16
-        else:
-            b_phase = 32
-        return reg*360/2**b_phase
+        return _as_dtype(np.asarray(reg)*360/2**self._phase_bits(gen_ch), dtype)
 
-    def cycles2us(self, cycles, gen_ch=None, ro_ch=None):
+    def cycles2us(self, cycles, gen_ch=None, ro_ch=None, dtype=None):
         """
         Converts clock cycles to microseconds.
         Uses tProc clock frequency by default.
         If gen_ch or ro_ch is specified, uses that DAC/ADC channel's fabric clock.
 
         :param cycles: Number of clock cycles
-        :type cycles: int
+        :type cycles: int or array
         :param gen_ch: DAC channel (index in 'gens' list)
         :type gen_ch: int
         :param ro_ch: ADC channel (index in 'readouts' list)
         :type ro_ch: int
+        :param dtype: NumPy dtype of the result (if None, float)
+        :type dtype: type
         :return: Number of microseconds
-        :rtype: float
+        :rtype: float or numpy.ndarray
         """
-        if gen_ch is not None and ro_ch is not None:
-            raise RuntimeError("can't specify both gen_ch and ro_ch!")
-        if gen_ch is not None:
-            fclk = self['gens'][gen_ch]['f_fabric']
-        elif ro_ch is not None:
-            fclk = self['readouts'][ro_ch]['f_fabric']
-        else:
-            fclk = self['fs_proc']
-        return cycles/fclk
+        return _as_dtype(np.asarray(cycles)/self._fclk(gen_ch, ro_ch), dtype)
 
-    def us2cycles(self, us, gen_ch=None, ro_ch=None):
+    def us2cycles(self, us, gen_ch=None, ro_ch=None, dtype=None):
         """
         Converts microseconds to integer number of clock cycles.
         Uses tProc clock frequency by default.
         If gen_ch or ro_ch is specified, uses that DAC/ADC channel's fabric clock.
 
-        :param cycles: Number of microseconds
-        :type cycles: float
+        :param us: Number of microseconds
+        :type us: float or array
         :param gen_ch: DAC channel (index in 'gens' list)
         :type gen_ch: int
         :param ro_ch: ADC channel (index in 'readouts' list)
         :type ro_ch: int
+        :param dtype: NumPy dtype of the result (if None, int64)
+        :type dtype: type
         :return: Number of clock cycles
-        :rtype: int
+        :rtype: int or numpy.ndarray
         """
-        if gen_ch is not None and ro_ch is not None:
-            raise RuntimeError("can't specify both gen_ch and ro_ch!")
-        if gen_ch is not None:
-            fclk = self['gens'][gen_ch]['f_fabric']
-        elif ro_ch is not None:
-            fclk = self['readouts'][ro_ch]['f_fabric']
-        else:
-            fclk = self['fs_proc']
-        return np.int64(np.round(us*fclk))
+        return _as_dtype(np.round(np.asarray(us)*self._fclk(gen_ch, ro_ch)).astype(np.int64), dtype)
+
+
+def _as_dtype(x, dtype):
+    """
+    Convert the result of a unit conversion to the requested dtype, returning a NumPy scalar for a scalar input.
+
+    :param x: Result
+    :type x: numpy.ndarray or scalar
+    :param dtype: NumPy dtype (if None, the dtype is not changed)
+    :type dtype: type
+    :return: Converted result
+    :rtype: numpy.ndarray or scalar
+    """
+    x = np.asarray(x)
+    if dtype is not None:
+        x = x.astype(dtype)
+    return x[()]
 
 
 # configuration for an enabled readout channel
 ReadoutConfig = namedtuple('ReadoutConfig', ['freq', 'length', 'sel', 'gen_ch'])
 GeneratorConfig = namedtuple('GeneratorConfig', ['nqz', 'mixer_freq', 'mux_freqs', 'ro_ch'])
+ProgramCost = namedtuple('ProgramCost', ['length', 'pmem_size', 'regs_used', 'regs_reserved', 'regs_free', 'loops'])
+LoopCost = namedtuple('LoopCost', ['label', 'start', 'end', 'reps', 'cycles', 'us'])
+Register = namedtuple('Register', ['page', 'reg'])
+
+
+class ParamValue(int):
+    """
+    An integer register value which is a named program parameter, and can be changed with QickProgram.patch() after the program is compiled.
+    The operations that safe_regwi() and the pulse macros apply to register values (>>, %, //) are recorded, so the derived values can be recomputed when the parameter is patched.
+    Other arithmetic raises an error, since its result could not be recomputed.
+
+    :param name: Parameter name
+    :type name: str
+    :param value: Register value
+    :type value: int
+    :param ops: Operations applied to the parameter value, as (operator, operand) tuples
+    :type ops: tuple
+    """
+    def __new__(cls, name, value, ops=()):
+        obj = super().__new__(cls, value)
+        obj.name = name
+        obj.ops = ops
+        return obj
+
+    def apply(self, value):
+        """
+        Apply this value's operations to a new value of the parameter.
+
+        :param value: New parameter value
+        :type value: int
+        :return: Derived value
+        :rtype: int
+        """
+        for op, x in self.ops:
+            if op == '>>':
+                value >>= x
+            elif op == '%':
+                value %= x
+            elif op == '//':
+                value //= x
+        return value
+
+    def __rshift__(self, x):
+        return ParamValue(self.name, int(self) >> x, self.ops + (('>>', x),))
+
+    def __mod__(self, x):
+        return ParamValue(self.name, int(self) % x, self.ops + (('%', x),))
+
+    def __floordiv__(self, x):
+        return ParamValue(self.name, int(self) // x, self.ops + (('//', x),))
+
+
+def _untracked_op(op):
+    def f(self, *args):
+        raise RuntimeError("parameter %s can't be used with the %s operator, because the result could not be patched" % (self.name, op))
+    return f
+
+
+for op in ['add', 'radd', 'sub', 'rsub', 'mul', 'rmul', 'lshift', 'rlshift', 'rrshift',
+           'or', 'ror', 'and', 'rand', 'xor', 'rxor', 'rmod', 'rfloordiv', 'pow', 'rpow', 'neg', 'invert']:
+    setattr(ParamValue, '__%s__' % (op), _untracked_op(op))
+
+
+class InstructionStore(Sequence):
+    """
+    Array-backed storage for the instructions of a tProc program.
+    Each instruction is stored as a fixed-width row of integers in a single array: the opcode, the number of arguments, the comment index, and the arguments.
+    Label names and op strings are interned in a symbol table, and comments in a comment table which is only built as a list when it is read.
+
+    For compatibility with code that used the old list of dicts, this is a sequence of {'name': ..., 'args': ...} dicts.
+    The dicts are built on request, so modifying them has no effect on the program.
+
+    :param instructions: Instruction set, as in QickProgram.instructions
+    :type instructions: dict
+    :param label_args: Argument position which holds a jump label, for each jump instruction
+    :type label_args: dict
+    :param op_args: Argument position which holds an op string, for each instruction that has one
+    :type op_args: dict
+    """
+    # maximum number of arguments for an instruction (not counting the comment)
+    max_args = 8
+    # each row holds the opcode, the number of arguments, the comment index (-1 for none), and the arguments
+    header_len = 3
+    row_len = header_len + max_args
+
+    def __init__(self, instructions, label_args, op_args):
+        """
+        Constructor method
+        """
+        self.names = list(instructions.keys())
+        self.name_index = {name: i for i, name in enumerate(self.names)}
+        # number of arguments needed to encode each instruction
+        self.min_args = [max([field[0]+1 for field in idef['fmt']], default=0) for idef in instructions.values()]
+        self.label_args = [label_args.get(name) for name in self.names]
+        self.symbol_args = [tuple(x[name] for x in [label_args, op_args] if name in x) for name in self.names]
+        self._padding = [(0,)*(self.max_args-n) for n in range(self.max_args+1)]
+
+        self.data = array('q')
+        # incremented when instructions are removed or reordered, so all addresses change
+        self.epoch = 0
+        # addresses of instructions whose arguments were changed in place
+        self.dirty = set()
+        # addresses of the jump instructions which use each label, keyed by symbol index
+        self.label_refs = {}
+
+        self.symbols = []
+        self.symbol_index = {}
+        self.comment_index = {}
+        self._comments = []
+
+    def intern_symbol(self, symbol):
+        """
+        Get the index of a label or op string in the symbol table, adding it if needed.
+
+        :param symbol: Label or op string
+        :type symbol: str
+        :return: Symbol index
+        :rtype: int
+        """
+        idx = self.symbol_index.get(symbol)
+        if idx is None:
+            if not isinstance(symbol, str):
+                raise RuntimeError("expected a label or op string, got %s" % (repr(symbol)))
+            idx = len(self.symbols)
+            self.symbols.append(symbol)
+            self.symbol_index[symbol] = idx
+        return idx
+
+    @property
+    def comments(self):
+        """
+        The comment table, built from the comment index when needed.
+
+        :return: Comments, in order of comment index
+        :rtype: list
+        """
+        if len(self._comments) != len(self.comment_index):
+            self._comments = list(self.comment_index)
+        return self._comments
+
+    def add(self, name, args):
+        """
+        Append an instruction.
+        A string argument which is not a label or op string is a comment, and must be the last argument.
+        A last argument of None means there is no comment.
+
+        :param name: Instruction name
+        :type name: str
+        :param args: Instruction arguments
+        :type args: tuple
+        """
+        try:
+            code = self.name_index[name]
+        except KeyError:
+            raise RuntimeError("unknown instruction %s" % (name))
+        symbol_args = self.symbol_args[code]
+        nargs = len(args)
+        comment = -1
+        if nargs and args[-1].__class__ is str and nargs-1 not in symbol_args:
+            comment = self.comment_index.setdefault(args[-1], len(self.comment_index))
+            nargs -= 1
+            args = args[:nargs]
+        elif nargs and args[-1] is None:
+            # safe_regwi passes None when there is no comment
+            nargs -= 1
+            args = args[:nargs]
+        if not self.min_args[code] <= nargs <= self.max_args:
+            raise RuntimeError("%s instruction has %d arguments, expected %d" % (name, nargs, self.min_args[code]))
+
+        if symbol_args:
+            args = tuple([self.intern_symbol(x) if iArg in symbol_args else x for iArg, x in enumerate(args)])
+        end = len(self.data)
+        try:
+            self.data.extend((code, nargs, comment) + args + self._padding[nargs])
+        except (TypeError, OverflowError):
+            del self.data[end:]
+            for iArg, x in enumerate(args):
+                try:
+                    array('q', [x])
+                except TypeError:
+                    raise RuntimeError("%s instruction: argument %d = %s is not an integer" % (name, iArg, repr(x)))
+                except OverflowError:
+                    raise RuntimeError("%s instruction: argument %d = %d doesn't fit in 64 bits" % (name, iArg, x))
+            raise
+        if self.label_args[code] is not None:
+            self.label_refs.setdefault(args[self.label_args[code]], []).append(len(self)-1)
+
+    def add_columns(self, opcodes, nargs, args):
+        """
+        Append instructions given as columns, in the format returned by columns().
+        There are no comments, and labels and op strings must already be in the symbol table.
+
+        :param opcodes: Opcodes (one per instruction)
+        :type opcodes: numpy.ndarray
+        :param nargs: Number of arguments (one per instruction)
+        :type nargs: numpy.ndarray
+        :param args: Arguments (one row per instruction, labels and op strings given as symbol indices)
+        :type args: numpy.ndarray
+        """
+        start = len(self)
+        rows = np.zeros((len(opcodes), self.row_len), dtype=np.int64)
+        rows[:, 0] = opcodes
+        rows[:, 1] = nargs
+        rows[:, 2] = -1
+        rows[:, self.header_len:self.header_len+args.shape[1]] = args
+        self.data.frombytes(rows.tobytes())
+        self._index_labels(start)
+
+    def _index_labels(self, start=0):
+        """
+        Record the labels used by the jump instructions starting at the given address.
+
+        :param start: Address of the first instruction to index
+        :type start: int
+        """
+        opcodes, nargs, args = self.columns(np.arange(start, len(self)))
+        for ii, code in enumerate(opcodes.tolist()):
+            if self.label_args[code] is not None:
+                self.label_refs.setdefault(int(args[ii, self.label_args[code]]), []).append(start + ii)
+
+    def append(self, inst):
+        """
+        Append an instruction given as a dict, for compatibility with the old list of dicts.
+
+        :param inst: Instruction, with 'name' and 'args' keys
+        :type inst: dict
+        """
+        self.add(inst['name'], tuple(inst['args']))
+
+    def get_name(self, ii):
+        """
+        Get the name of an instruction.
+
+        :param ii: Instruction index
+        :type ii: int
+        :return: Instruction name
+        :rtype: str
+        """
+        return self.names[self.data[self.row_len*ii]]
+
+    def get_args(self, ii):
+        """
+        Get the arguments of an instruction, as originally passed (including the comment, if any).
+
+        :param ii: Instruction index
+        :type ii: int
+        :return: Instruction arguments
+        :rtype: tuple
+        """
+        code, nargs, comment = self.data[self.row_len*ii:self.row_len*ii+self.header_len]
+        start = self.row_len*ii + self.header_len
+        symbol_args = self.symbol_args[code]
+        args = [self.symbols[x] if iArg in symbol_args else x for iArg, x in enumerate(self.data[start:start+nargs])]
+        if comment >= 0:
+            args.append(self.comments[comment])
+        return tuple(args)
+
+    def columns(self, addrs=None):
+        """
+        Get the opcode and argument columns as NumPy arrays.
+
+        :param addrs: Addresses of the instructions to get (if None, get all instructions)
+        :type addrs: numpy.ndarray
+        :return: Opcodes (one per instruction), number of arguments (one per instruction), and arguments (one row per instruction, labels and op strings given as symbol indices)
+        :rtype: tuple
+        """
+        rows = np.frombuffer(self.data, dtype=np.int64).reshape((len(self), self.row_len))
+        if addrs is None:
+            rows = rows.copy()
+        else:
+            rows = rows[addrs]
+        return rows[:, 0], rows[:, 1], rows[:, self.header_len:]
+
+    def take(self, indices):
+        """
+        Keep only the selected instructions, in the given order.
+
+        :param indices: Indices of the instructions to keep
+        :type indices: list
+        """
+        rows = np.frombuffer(self.data, dtype=np.int64).reshape((len(self), self.row_len))
+        data = array('q')
+        data.frombytes(rows[np.asarray(indices, dtype=np.int64)].tobytes())
+        self.data = data
+        self.epoch += 1
+        self.dirty = set()
+        self.label_refs = {}
+        self._index_labels()
+
+    def set_arg(self, ii, iArg, value):
+        """
+        Change an integer argument of an instruction.
+
+        :param ii: Instruction index
+        :type ii: int
+        :param iArg: Argument index
+        :type iArg: int
+        :param value: New value
+        :type value: int
+        """
+        try:
+            self.data[self.row_len*ii + self.header_len + iArg] = value
+        except OverflowError:
+            raise RuntimeError("%s instruction: argument %d = %d doesn't fit in 64 bits" % (self.get_name(ii), iArg, value))
+        self.dirty.add(ii)
+
+    def __len__(self):
+        return len(self.data)//self.row_len
+
+    def __getitem__(self, ii):
+        if isinstance(ii, slice):
+            return [self[jj] for jj in range(*ii.indices(len(self)))]
+        if ii < 0:
+            ii += len(self)
+        if ii < 0 or ii >= len(self):
+            raise IndexError("instruction index out of range")
+        return {'name': self.get_name(ii), 'args': self.get_args(ii)}
 
 
 class QickProgram:
@@ -347,7 +847,7 @@ class QickProgram:
                     'set':  {'type': "R", 'bin': 0b01010001, 'fmt': ((1, 53), (0, 50), (2, 36), (7, 31), (3, 26), (4, 21), (5, 16), (6, 11)), 'repr': "{0}, {1}, ${2}, ${3}, ${4}, ${5}, ${6}, ${7}"},
                     'sync': {'type': "R", 'bin': 0b01010010, 'fmt': ((0, 53), (1, 31)), 'repr': "{0}, ${1}"},
                     'read': {'type': "R", 'bin': 0b01010011, 'fmt': ((1, 53), (0, 50), (2, 46), (3, 41)), 'repr': "{0}, {1}, {2} ${3}"},
-                    'wait': {'type': "R", 'bin': 0b01010100, 'fmt': ((0, 53), (1, 31)), 'repr': "{0}, {1}, ${2}"},
+                    'wait': {'type': "R", 'bin': 0b01010100, 'fmt': ((0, 53), (1, 31)), 'repr': "{0}, ${1}"},
                     'bitw': {'type': "R", 'bin': 0b01010101, 'fmt': ((0, 53), (1, 41), (2, 36), (3, 46), (4, 31)), 'repr': "{0}, ${1}, ${2} {3} ${4}"},
                     'memr': {'type': "R", 'bin': 0b01010110, 'fmt': ((0, 53), (1, 41), (2, 36)), 'repr': "{0}, ${1}, ${2}"},
                     'memw': {'type': "R", 'bin': 0b01010111, 'fmt': ((0, 53), (2, 36), (1, 31)), 'repr': "{0}, ${1}, ${2}"},
@@ -361,6 +861,31 @@ class QickProgram:
                 "upper": 0b1010, "lower": 0b0101
                 }
 
+    # Op strings accepted by each instruction which has an op argument (op codes are only unique within an instruction).
+    op_names = {'condj': [">", ">=", "<", "<=", "==", "!="],
+                'math': ["+", "-", "*"], 'mathi': ["+", "-", "*"],
+                'bitw': ["&", "|", "^", "~", "<<", ">>"], 'bitwi': ["&", "|", "^", "~", "<<", ">>"],
+                'read': ["upper", "lower"]}
+
+    # Widths of the instruction fields, keyed by the bit position used in the 'fmt' tuples.
+    # The field at bit 0 holds the immediate value (I-type) or the jump address (J-type), see imm_widths.
+    field_widths = {53: 3, 50: 3, 46: 4, 41: 5, 36: 5, 31: 5, 26: 5, 21: 5, 16: 5, 11: 5}
+    imm_widths = {'I': 31, 'J1': 16, 'J2': 16}
+
+    # Arguments which are given as strings: jump labels and op codes.
+    label_args = {'loopnz': 2, 'condj': 4}
+    op_args = {'condj': 2, 'read': 2, 'math': 3, 'mathi': 3, 'bitw': 3, 'bitwi': 3}
+
+    # Register usage of each instruction, for the optimizer: (page argument, written register argument, read register arguments).
+    # Instructions which are not listed here end a basic block (jumps) or have effects that the optimizer doesn't model, and are treated as barriers.
+    reg_usage = {'regwi': (0, 1, ()), 'mathi': (0, 1, (2,)), 'bitwi': (0, 1, (2,)),
+                 'math': (0, 1, (2, 4)), 'bitw': (0, 1, (2, 4)),
+                 'memri': (0, 1, ()), 'memr': (0, 1, (2,)), 'memwi': (0, None, (1,)), 'memw': (0, None, (1, 2)),
+                 'set': (1, None, (2, 3, 4, 5, 6, 7)), 'seti': (1, None, (2,)), 'read': (1, 3, ()),
+                 'sync': (0, None, (1,)), 'synci': (None, None, ()), 'waiti': (None, None, ())}
+    # Instructions that only write a register, and can be removed if the write is redundant.
+    pure_writes = ['regwi', 'mathi', 'bitwi', 'math', 'bitw', 'memri', 'memr']
+
     # To make it easier to configure pulses these special registers are reserved for each channel's pulse configuration.
     # In each page, register 0 is hard-wired with the value 0.
     # In page 0 we reserve the following additional registers:
@@ -373,6 +898,7 @@ class QickProgram:
     trig_offset = 25
 
     soccfg_methods = ['freq2reg', 'freq2reg_adc',
+                      'freqs2reg', 'freqs2reg_adc',
                       'reg2freq', 'reg2freq_adc',
                       'cycles2us', 'us2cycles',
                       'deg2reg', 'reg2deg']
@@ -384,6 +910,15 @@ class QickProgram:
         self.soccfg = soccfg
         self.prog_list = []
         self.labels = {}
+        # named parameters (see param()) and the instruction arguments that use them
+        self.template_params = {}
+        self.patch_points = {}
+        # compiled image, and the state of the program it was compiled from (see _cached_image())
+        self._image_cache = None
+        # registers handed out by new_reg() (live ones, and all that were ever allocated), and the allocations of each open reg_scope()
+        self._live_regs = set()
+        self._allocated_regs = set()
+        self._reg_scopes = []
         self.dac_ts = [0]*len(soccfg['gens'])
         self.adc_ts = [0]*len(soccfg['readouts'])
         self.channels = {ch: {"addr": 0, "pulses": {}, "params": {},
@@ -420,8 +955,7 @@ class QickProgram:
         :type soc: QickSoc
         """
         soc.init_readouts()
-        for ch, cfg in self.ro_chs.items():
-            soc.configure_readout(ch, output=cfg.sel, frequency=cfg.freq, gen_ch=cfg.gen_ch)
+        soc.configure_readouts({ch: (cfg.sel, cfg.freq, cfg.gen_ch) for ch, cfg in self.ro_chs.items()})
 
     def config_bufs(self, soc, enable_avg=True, enable_buf=True):
         """
@@ -621,6 +1155,68 @@ class QickProgram:
         n_regs = len(self.pulse_registers)
         return 31 - (n_regs * 2) + n_regs*((ch+1)%2) + self.pulse_registers.index(name)
 
+    def new_reg(self, page=None):
+        """
+        Allocate a register for user values (sweep variables, counters, scratch values).
+        The register is not register 0, one of the page 0 loop counter and trigger registers, or a pulse register of a generator (see sreg()),
+        and it is not used by any instruction already in the program, unless it was allocated here and then freed.
+        If no page is given, the lowest page with a free register is used, so allocations are packed into as few pages as possible.
+
+        Math instructions only work within a page, so a value which is combined with a pulse register must be in the generator's page (see ch_page()).
+        A register stays allocated until free_reg() is called, or the reg_scope() it was allocated in ends.
+
+        :param page: Register page (if None, any page)
+        :type page: int
+        :return: Register page and number
+        :rtype: Register
+        """
+        if page is not None and not 0 <= page < 8:
+            raise RuntimeError("register page %d doesn't exist, pages are 0 to 7" % (page))
+        used = self._used_registers() - self._allocated_regs
+        taken = used | self._reserved_registers() | self._live_regs
+        pages = range(8) if page is None else [page]
+        for rp in pages:
+            for reg in range(1, 32):
+                if (rp, reg) not in taken:
+                    self._live_regs.add((rp, reg))
+                    self._allocated_regs.add((rp, reg))
+                    if self._reg_scopes:
+                        self._reg_scopes[-1].append((rp, reg))
+                    return Register(rp, reg)
+        if page is None:
+            raise RuntimeError("no free registers")
+        raise RuntimeError("no free registers in page %d" % (page))
+
+    def free_reg(self, reg):
+        """
+        Release a register allocated with new_reg(), so it can be allocated again.
+
+        :param reg: Register page and number
+        :type reg: Register
+        """
+        reg = Register(*reg)
+        if reg not in self._live_regs:
+            raise RuntimeError("register %d in page %d is not allocated" % (reg.reg, reg.page))
+        self._live_regs.remove(reg)
+        for scope in self._reg_scopes:
+            if reg in scope:
+                scope.remove(reg)
+
+    @contextmanager
+    def reg_scope(self):
+        """
+        Context manager which frees the registers allocated with new_reg() inside the with block when the block ends.
+        Scopes can be nested.
+        """
+        scope = []
+        self._reg_scopes.append(scope)
+        try:
+            yield self
+        finally:
+            self._reg_scopes.remove(scope)
+            for reg in scope:
+                self._live_regs.discard(reg)
+
     def set_pulse_registers(self, ch, style, **kwargs):
         #waveform=None, freq=None, phase=None, gain=None, phrst=None, stdysel=None, mode=None, outsel=None, length=None):
         """
@@ -921,7 +1517,7 @@ class QickProgram:
             if t == 'auto':
                 t = int(self.dac_ts[ch])
             elif t < self.dac_ts[ch]:
-                print("Pulse time %d appears to conflict with previous pulse ending at %f?"%(t, dac_ts[ch]))
+                print("Pulse time %d appears to conflict with previous pulse ending at %f?"%(t, self.dac_ts[ch]))
             # convert from generator clock to tProc clock
             pulse_length = last_pulse['length']
             pulse_length *= self.soccfg['fs_proc']/self.soccfg['gens'][ch]['f_fabric']
@@ -949,7 +1545,12 @@ class QickProgram:
         :param comment: Comment associated with the write
         :type comment: str
         """
-        if abs(imm) < 2**30:
+        if isinstance(imm, ParamValue):
+            # always use the long form, so the value can be patched to anything
+            self.regwi(rp, reg, imm >> 2, comment)
+            self.bitwi(rp, reg, reg, "<<", 2)
+            self.mathi(rp, reg, reg, "+", imm % 4)
+        elif abs(imm) < 2**30:
             self.regwi(rp, reg, imm, comment)
         else:
             self.regwi(rp, reg, imm >> 2, comment)
@@ -1086,7 +1687,7 @@ class QickProgram:
             # update timestamps with the end of the readout window
             for adc in adcs:
                 if t_start < self.adc_ts[adc]:
-                    print("Readout time %d appears to conflict with previous readout ending at %f?"%(t, adc_ts[adc]))
+                    print("Readout time %d appears to conflict with previous readout ending at %f?"%(t, self.adc_ts[adc]))
                 # convert from readout clock to tProc clock
                 ro_length = self.ro_chs[adc].length
                 ro_length *= self.soccfg['fs_proc']/self.soccfg['readouts'][adc]['f_fabric']
@@ -1129,6 +1730,20 @@ class QickProgram:
         if syncdelay is not None:
             self.sync_all(syncdelay)
 
+    def schedule(self, sync=None, wait=False):
+        """
+        Start a block of pulses and triggers which are scheduled together, for use in a with statement.
+        See PulseSchedule.
+
+        :param sync: If not None, sync_all() with this time offset at the end of the block
+        :type sync: int
+        :param wait: If True, wait_all() at the end of the block (before the sync)
+        :type wait: bool
+        :return: Schedule
+        :rtype: PulseSchedule
+        """
+        return PulseSchedule(self, sync=sync, wait=wait)
+
     def convert_immediate(self, val):
         """
         Convert the register value to ensure that it is positive and not too large. Throws an error if you ever try to use a value greater than 2**31 as an immediate value.
@@ -1204,7 +1819,638 @@ class QickProgram:
         :return: List of binary instructions
         :rtype: list
         """
-        return [self.compile_instruction(inst, debug=debug) for inst in self.prog_list]
+        return self.compile_image(debug=debug).tolist()
+
+    def compile_image(self, debug=False):
+        """
+        Compiles program to machine code, as a NumPy array.
+        Instructions are grouped by opcode, and each group is encoded with array shifts and ORs on the columns of the instruction store.
+        The result is identical to what compile_instruction() gives for each instruction,
+        except that a field value which doesn't fit in its bit field raises an error instead of corrupting the neighboring fields.
+
+        :param debug: If True, debug mode is on
+        :type debug: bool
+        :return: Program image, one 64-bit word per instruction
+        :rtype: numpy.ndarray
+        """
+        if debug:
+            for inst in self.prog_list:
+                print(inst)
+        return self._cached_image().copy()
+
+    def _cached_image(self):
+        """
+        Get the compiled program image.
+        The image from the last compile is kept, and only the instructions that changed since then are encoded:
+        instructions appended to the program, instructions whose arguments were changed in place (e.g. by patch()), and jumps to labels that moved.
+        Text representations of the image (see hex() and bin()) are updated in the same way.
+
+        :return: Program image (not a copy, so don't modify it)
+        :rtype: numpy.ndarray
+        """
+        store = self._store
+        cache = self._image_cache
+        n = len(store)
+        if cache is None or cache['store'] is not store or cache['epoch'] != store.epoch:
+            image = self._encode(np.arange(n))
+            store.dirty.clear()
+            self._image_cache = {'store': store, 'epoch': store.epoch, 'labels': dict(self.labels),
+                                 'buf': image, 'n': n, 'text': {}}
+            return image
+
+        n_old = cache['n']
+        addrs = [ii for ii in store.dirty if ii < n_old]
+        if cache['labels'] != self.labels:
+            old_labels = cache['labels']
+            for label in set(old_labels) | set(self.labels):
+                if old_labels.get(label) != self.labels.get(label) and label in store.symbol_index:
+                    addrs.extend([ii for ii in store.label_refs.get(store.symbol_index[label], []) if ii < n_old])
+        if not addrs and n == n_old:
+            return cache['buf'][:n]
+
+        addrs = np.unique(np.concatenate([np.array(addrs, dtype=np.int64), np.arange(n_old, n)]))
+        mcode = self._encode(addrs)
+
+        buf = cache['buf']
+        if n > len(buf):
+            # grow the buffer geometrically, so appending is cheap
+            buf = np.concatenate([buf[:n_old], np.zeros(max(n, 2*len(buf)) - n_old, dtype=np.uint64)])
+        buf[addrs] = mcode
+        for fmt, lines in cache['text'].items():
+            lines.extend([None]*(n - n_old))
+            for ii, mc in zip(addrs.tolist(), mcode.tolist()):
+                lines[ii] = format(mc, fmt)
+        store.dirty.clear()
+        cache.update({'labels': dict(self.labels), 'buf': buf, 'n': n})
+        return buf[:n]
+
+    def _text_lines(self, fmt):
+        """
+        Get the compiled program as a list of formatted strings, updating only the lines that changed since the last call.
+
+        :param fmt: Format specification for each instruction word
+        :type fmt: str
+        :return: One string per instruction
+        :rtype: list
+        """
+        image = self._cached_image()
+        text = self._image_cache['text']
+        if fmt not in text:
+            text[fmt] = [format(mc, fmt) for mc in image.tolist()]
+        return text[fmt]
+
+    def _encode(self, addrs):
+        """
+        Encodes the instructions at the given addresses.
+
+        :param addrs: Program addresses
+        :type addrs: numpy.ndarray
+        :return: Machine code, one 64-bit word per address
+        :rtype: numpy.ndarray
+        """
+        store = self._store
+        opcodes, nargs, args = store.columns(addrs)
+        # lookup tables for the symbol table: label addresses and op codes (-1 if not defined)
+        symbols = {'label': np.array([self.labels.get(x, -1) for x in store.symbols], dtype=np.int64),
+                   'op': np.array([self.__class__.op_codes.get(x, -1) for x in store.symbols], dtype=np.int64)}
+
+        mcode = np.zeros(len(addrs), dtype=np.uint64)
+        for code in np.unique(opcodes):
+            group = np.nonzero(opcodes == code)[0]
+            mcode[group] = self._encode_group(store.names[code], args[group], addrs[group], symbols)
+        return mcode
+
+    def _encode_group(self, name, args, addrs, symbols):
+        """
+        Encodes a group of instructions which all have the same name.
+
+        :param name: Instruction name
+        :type name: str
+        :param args: Instruction arguments, one row per instruction (labels and op strings given as symbol indices)
+        :type args: numpy.ndarray
+        :param addrs: Program addresses of the instructions (used in error messages)
+        :type addrs: numpy.ndarray
+        :param symbols: Label addresses and op codes for each symbol index
+        :type symbols: dict
+        :return: Machine code
+        :rtype: numpy.ndarray
+        """
+        idef = self.__class__.instructions[name]
+        fmt = idef['fmt']
+        mcode = np.full(len(addrs), idef['bin'] << 56, dtype=np.uint64)
+        if name == 'loopnz':
+            mcode |= np.uint64(0b1000 << 46)
+        if not fmt:
+            return mcode
+
+        # resolve labels and op codes
+        cols = {}
+        for kind, iArg in [('label', self.__class__.label_args.get(name)), ('op', self.__class__.op_args.get(name))]:
+            if iArg is not None:
+                cols[iArg] = symbols[kind][args[:, iArg]]
+                if np.any(cols[iArg] < 0):
+                    iBad = np.argmax(cols[iArg] < 0)
+                    raise RuntimeError("instruction %d (%s): undefined %s %s"
+                                       % (addrs[iBad], name, kind, self._store.symbols[args[iBad, iArg]]))
+
+        for iArg, pos in fmt:
+            col = cols.get(iArg, args[:, iArg])
+            if pos == 0:
+                width = self.__class__.imm_widths[idef['type']]
+                if idef['type'] == "I":
+                    if np.any(col > 2**31):
+                        raise RuntimeError(
+                            f"Immediate values are only 31 bits {col[col > 2**31][0]} > 2**31")
+                    col = np.where(col < 0, col + 2**31, col)
+            else:
+                width = self.__class__.field_widths[pos]
+            bad = (col < 0) | (col >= 2**width)
+            if np.any(bad):
+                iBad = np.argmax(bad)
+                raise RuntimeError("instruction %d (%s): argument %d = %d doesn't fit in %d bits"
+                                   % (addrs[iBad], name, iArg, col[iBad], width))
+            mcode |= col.astype(np.uint64) << np.uint64(pos)
+        return mcode
+
+    @classmethod
+    def _decode(cls, image):
+        """
+        Decodes machine code into instruction columns, the inverse of _encode().
+        Each field is extracted with array shifts and masks on the group of words that share an opcode.
+        Immediate values are returned as the unsigned field value, so negative immediates come back as 2**31 plus the value, which encodes to the same word.
+        Jump addresses and op codes are returned as numbers.
+
+        :param image: Program image, one 64-bit word per instruction
+        :type image: numpy.ndarray
+        :return: Instruction codes (one per instruction, indexing the instruction set), number of arguments (one per instruction), and arguments (one row per instruction)
+        :rtype: tuple
+        """
+        image = np.asarray(image, dtype=np.uint64)
+        names = list(cls.instructions.keys())
+        bins = {idef['bin']: i for i, idef in enumerate(cls.instructions.values())}
+        top = (image >> np.uint64(56)).astype(np.int64)
+        codes = np.zeros(len(image), dtype=np.int64)
+        nargs = np.zeros(len(image), dtype=np.int64)
+        args = np.zeros((len(image), InstructionStore.max_args), dtype=np.int64)
+        for b in np.unique(top).tolist():
+            group = np.nonzero(top == b)[0]
+            if b not in bins:
+                raise RuntimeError("instruction %d: unknown opcode %#04x in word %#018x" % (group[0], b, image[group[0]]))
+            code = bins[b]
+            idef = cls.instructions[names[code]]
+            codes[group] = code
+            nargs[group] = max([field[0]+1 for field in idef['fmt']], default=0)
+            done = set()
+            for iArg, pos in idef['fmt']:
+                # loopnz has its register in two fields
+                if iArg in done:
+                    continue
+                done.add(iArg)
+                width = cls.imm_widths[idef['type']] if pos == 0 else cls.field_widths[pos]
+                args[group, iArg] = ((image[group] >> np.uint64(pos)) & np.uint64(2**width-1)).astype(np.int64)
+            iOp = cls.op_args.get(names[code])
+            if iOp is not None:
+                valid = [cls.op_codes[op] for op in cls.op_names[names[code]]]
+                bad = ~np.isin(args[group, iOp], valid)
+                if np.any(bad):
+                    ii = group[np.argmax(bad)]
+                    raise RuntimeError("instruction %d (%s): unknown op code %d" % (ii, names[code], args[ii, iOp]))
+        return codes, nargs, args
+
+    @classmethod
+    def disasm_lines(cls, image):
+        """
+        Disassembles machine code into assembly text, one line per instruction.
+        Jump targets are shown as addresses, since the words don't contain label names.
+
+        :param image: Program image, one 64-bit word per instruction
+        :type image: numpy.ndarray or list
+        :return: Assembly text for each instruction
+        :rtype: list
+        """
+        names = list(cls.instructions.keys())
+        codes, nargs, args = cls._decode(image)
+        lines = []
+        for code, n, row in zip(codes.tolist(), nargs.tolist(), args.tolist()):
+            name = names[code]
+            row = row[:n]
+            iOp = cls.op_args.get(name)
+            if iOp is not None:
+                row[iOp] = {cls.op_codes[op]: op for op in cls.op_names[name]}[row[iOp]]
+            lines.append((name + " " + cls.instructions[name]['repr'] + ";").format(*row))
+        return lines
+
+    @classmethod
+    def disassemble(cls, soccfg, image, labels=None):
+        """
+        Builds a program from machine code, e.g. the output of compile() or a program read back from the tProc program memory.
+        The program compiles back to the same machine code, apart from unused bits.
+        A label is created for each jump target; names can be given for some or all of them, otherwise they are named by address.
+
+        :param soccfg: QICK firmware configuration
+        :type soccfg: QickConfig
+        :param image: Program image, one 64-bit word per instruction
+        :type image: numpy.ndarray or list
+        :param labels: Label names, keyed by name with the address as value (as in the labels attribute)
+        :type labels: dict
+        :return: Program
+        :rtype: QickProgram
+        """
+        prog = cls(soccfg)
+        store = prog._store
+        codes, nargs, args = cls._decode(image)
+        names = list(cls.instructions.keys())
+
+        # name the jump targets
+        addr_names = {}
+        for name, addr in (labels or {}).items():
+            addr_names.setdefault(addr, name)
+            prog.labels[name] = addr
+        for code in np.unique(codes).tolist():
+            iArg = cls.label_args.get(names[code])
+            if iArg is None:
+                continue
+            group = np.nonzero(codes == code)[0]
+            for addr in np.unique(args[group, iArg]).tolist():
+                if addr not in addr_names:
+                    addr_names[addr] = "label_%d" % (addr)
+                    prog.labels[addr_names[addr]] = addr
+            args[group, iArg] = [store.intern_symbol(addr_names[addr]) for addr in args[group, iArg].tolist()]
+
+        # op codes to op strings
+        for code in np.unique(codes).tolist():
+            iOp = cls.op_args.get(names[code])
+            if iOp is None:
+                continue
+            group = np.nonzero(codes == code)[0]
+            lookup = {cls.op_codes[op]: store.intern_symbol(op) for op in cls.op_names[names[code]]}
+            args[group, iOp] = [lookup[x] for x in args[group, iOp].tolist()]
+
+        store.add_columns(codes, nargs, args)
+        return prog
+
+    def diff(self, other):
+        """
+        Compares this program with another program or program image, instruction by instruction.
+        The compiled images are compared in one pass, and only the instructions that differ are disassembled.
+
+        :param other: Program, or program image
+        :type other: QickProgram or numpy.ndarray or list
+        :return: (address, this program's instruction, other program's instruction) for each address that differs, with None for an address past the end of a program
+        :rtype: list
+        """
+        mine = self._cached_image()
+        if isinstance(other, QickProgram):
+            theirs = other._cached_image()
+        else:
+            theirs = np.asarray(other, dtype=np.uint64)
+        n = min(len(mine), len(theirs))
+        addrs = np.concatenate([np.nonzero(mine[:n] != theirs[:n])[0], np.arange(n, max(len(mine), len(theirs)))])
+        sides = []
+        for image in [mine, theirs]:
+            valid = addrs[addrs < len(image)]
+            sides.append(dict(zip(valid.tolist(), self.__class__.disasm_lines(image[valid]))))
+        return [(addr, sides[0].get(addr), sides[1].get(addr)) for addr in addrs.tolist()]
+
+    def optimize(self):
+        """
+        Remove redundant register writes from the program.
+        The program is split into basic blocks at jump instructions and jump targets (the addresses in the labels dictionary).
+        Within a block, register contents are tracked and two kinds of writes are removed:
+
+        * a regwi (with the bitwi and mathi that safe_regwi adds after it) which writes a value that the register already holds;
+        * a write to a register which is overwritten later in the block before it is read.
+
+        Instructions that the optimizer doesn't model (see reg_usage) are treated as barriers.
+        Labels are moved to account for the removed instructions.
+
+        :return: Number of instructions removed
+        :rtype: int
+        """
+        store = self._store
+        n = len(store)
+        names = [store.names[code] for code in store.columns()[0].tolist()]
+        args = store.columns()[2].tolist()
+        usage = self.__class__.reg_usage
+        pure = set(self.__class__.pure_writes)
+        targets = set(self.labels.values())
+        # arguments which are parameters are compared by parameter name, since their values can be patched
+        param_args = {(addr, iArg): ('param', x.name, x.ops) for points in self.patch_points.values() for addr, iArg, x in points}
+
+        def arg(ii, iArg):
+            return param_args.get((ii, iArg), args[ii][iArg])
+
+        def regs(ii):
+            # registers written and read by an instruction, as (page, register) tuples; None if it's a barrier
+            if names[ii] not in usage:
+                return None
+            iPage, iWrite, iReads = usage[names[ii]]
+            if iPage is None:
+                return None, []
+            page = args[ii][iPage]
+            write = None if iWrite is None or args[ii][iWrite] == 0 else (page, args[ii][iWrite])
+            return write, [(page, args[ii][iArg]) for iArg in iReads]
+
+        # forward pass: remove writes of values that a register already holds
+        keep = [True]*n
+        known = {}
+        ii = 0
+        while ii < n:
+            if ii in targets:
+                known = {}
+            usage_ii = regs(ii)
+            if usage_ii is None:
+                known = {}
+                ii += 1
+                continue
+            write, reads = usage_ii
+            if names[ii] == 'regwi' and write is not None:
+                # follow the shifts and adds that safe_regwi puts after a regwi
+                value = (('regwi', arg(ii, 2)),)
+                jj = ii + 1
+                while jj < n and jj not in targets and names[jj] in ['bitwi', 'mathi'] and regs(jj) == (write, [write]):
+                    value += ((names[jj], args[jj][3], arg(jj, 4)),)
+                    jj += 1
+                if known.get(write) == value:
+                    keep[ii:jj] = [False]*(jj-ii)
+                known[write] = value
+                ii = jj
+                continue
+            if write is not None:
+                if names[ii] in ['mathi', 'bitwi'] and reads[0] in known:
+                    known[write] = known[reads[0]] + ((names[ii], args[ii][3], arg(ii, 4)),)
+                else:
+                    known.pop(write, None)
+            ii += 1
+
+        # backward pass: remove writes which are overwritten before they are read
+        dead = set()
+        for ii in reversed(range(n)):
+            if not keep[ii]:
+                continue
+            usage_ii = regs(ii)
+            if usage_ii is None:
+                dead = set()
+                continue
+            write, reads = usage_ii
+            if write is not None:
+                if write in dead and names[ii] in pure:
+                    keep[ii] = False
+                    continue
+                dead.add(write)
+            dead.difference_update(reads)
+
+        kept = [ii for ii in range(n) if keep[ii]]
+        nremoved = n - len(kept)
+        if nremoved > 0:
+            # each label moves to the first kept instruction at or after its old address
+            newaddr = np.cumsum([0] + keep)
+            self.labels = {label: int(newaddr[addr]) for label, addr in self.labels.items()}
+            self.patch_points = {name: [(int(newaddr[addr]), iArg, x) for addr, iArg, x in points if keep[addr]]
+                                 for name, points in self.patch_points.items()}
+            store.take(kept)
+        return nremoved
+
+    def _used_registers(self):
+        """
+        Find the registers which the program uses, as (page, register) tuples.
+        The register arguments of each instruction are the ones marked with "$" in its 'repr' string, and the page is the argument in the field at bit 53.
+
+        :return: Registers used by any instruction
+        :rtype: set
+        """
+        store = self._store
+        opcodes, nargs, args = store.columns()
+        used = set()
+        for code in np.unique(opcodes).tolist():
+            idef = self.__class__.instructions[store.names[code]]
+            fields = dict([(pos, iArg) for iArg, pos in idef['fmt']])
+            reg_args = [int(x[0]) for x in idef['repr'].split("${")[1:]]
+            reg_args = [iArg for iArg in reg_args if iArg in dict(idef['fmt'])]
+            if 53 not in fields or not reg_args:
+                continue
+            rows = args[opcodes == code]
+            for iArg in reg_args:
+                used.update(zip(rows[:, fields[53]].tolist(), rows[:, iArg].tolist()))
+        return used
+
+    def _reserved_registers(self):
+        """
+        Find the registers which are reserved: register 0 in each page, the loop counter and trigger registers in page 0, and the pulse registers of each generator (see sreg()).
+
+        :return: Reserved registers, as (page, register) tuples
+        :rtype: set
+        """
+        reserved = {(page, 0) for page in range(8)} | {(0, reg) for reg in [13, 14, 15, 31]}
+        for ch in range(len(self.soccfg['gens'])):
+            reserved.update([(self.ch_page(ch), self.sreg(ch, name)) for name in self.pulse_registers])
+        return reserved
+
+    def _free_registers(self):
+        """
+        Find the registers which the program doesn't use, which are not reserved (see _reserved_registers()),
+        and which are not allocated with new_reg().
+
+        :return: Free registers in each page, keyed by page
+        :rtype: dict
+        """
+        taken = self._used_registers() | self._live_regs | self._reserved_registers()
+        return {page: [reg for reg in range(1, 32) if (page, reg) not in taken]
+                for page in range(8)}
+
+    def roll_loops(self, min_repeats=2, max_block=64):
+        """
+        Compress the program by rolling repeated blocks of instructions into loops.
+        This finds runs of a block of instructions repeated back to back, where the repetitions are identical except for regwi instructions whose values step by a constant amount from one repetition to the next (e.g. pulse times).
+        Each run is replaced by one copy of the block inside a loopnz loop: the loop counter, and a register holding each stepping value, use registers which the program doesn't use.
+        Each stepping regwi becomes a mathi which copies the value register, and a mathi at the end of the block steps it.
+
+        Blocks can't contain jumps or labels, or parameters (see param()).
+        The loop adds two instructions (plus one per stepping value) to each repetition, which the tProc must have time to execute before the pulses it schedules.
+        Call this after the program is complete, since later instructions may use the registers it picked.
+
+        :param min_repeats: Minimum number of repetitions to roll
+        :type min_repeats: int
+        :param max_block: Maximum number of instructions in a block
+        :type max_block: int
+        :return: Number of loops, and the program length before and after
+        :rtype: dict
+        """
+        store = self._store
+        n = len(store)
+        opcodes, nargs, args = store.columns()
+        names = [store.names[code] for code in opcodes.tolist()]
+        regwi = opcodes == store.name_index['regwi']
+        values = np.where(regwi, args[:, 2], 0)
+
+        # instruction signatures: instructions which match apart from regwi values get the same signature
+        keys = np.column_stack([opcodes, nargs, np.where(regwi[:, np.newaxis] & (np.arange(args.shape[1]) == 2), 0, args)])
+        sig = np.unique(keys, axis=0, return_inverse=True)[1].reshape(-1)
+        barrier = np.array([name in self.__class__.label_args or name == 'end' for name in names], dtype=bool)
+        for points in self.patch_points.values():
+            barrier[[addr for addr, iArg, x in points]] = True
+        sig = np.where(barrier, -1 - np.arange(n), sig)
+
+        # a block can't run past a label
+        targets = sorted(set([addr for addr in self.labels.values() if 0 < addr <= n] + [n]))
+        next_target = np.array(targets)[np.searchsorted(targets, np.arange(n), side='right')]
+
+        def run_lengths(match):
+            # number of consecutive True values starting at each position
+            pos = np.arange(len(match))
+            next_false = np.minimum.accumulate(np.where(match, len(match), pos)[::-1])[::-1]
+            return next_false - pos
+
+        # for each block length, the number of repetitions and the number of stepping values of a block starting at each address
+        best_saving = np.zeros(n, dtype=np.int64)
+        best = np.zeros((n, 3), dtype=np.int64)
+        for L in range(1, min(max_block, n//2)+1):
+            same = np.append(sig[:-L] == sig[L:], np.zeros(L, dtype=bool))
+            step = np.append(values[L:] - values[:-L], np.zeros(L, dtype=np.int64))
+            stepping = regwi & same & (step != 0)
+            # stepping values must be in [0, 2**30), since the tProc sign-extends a regwi value but not a mathi sum,
+            # and must step by the same amount in each repetition
+            next_values = np.append(values[L:], np.zeros(L, dtype=np.int64))
+            same &= ~(stepping & ((values < 0) | (values >= 2**30) | (next_values < 0) | (next_values >= 2**30)))
+            same_step = np.append(step[:-L] == step[L:], np.zeros(L, dtype=bool)) | ~regwi
+            reps = np.minimum(run_lengths(same)//L + 1, run_lengths(same_step)//L + 2)
+            reps = np.minimum(reps, (next_target - np.arange(n))//L)
+            nstep = np.cumsum(np.append(0, stepping))
+            nstep = nstep[np.minimum(np.arange(n)+L, n)] - nstep[:n]
+            saving = reps*L - (L + 2 + 2*nstep)
+            better = (reps >= min_repeats) & (saving > best_saving)
+            best_saving[better] = saving[better]
+            best[better] = np.column_stack([np.full(n, L), reps, nstep])[better]
+
+        # pick loops from the start of the program, and assign registers
+        free = self._free_registers()
+        counter = next(((page, reg) for page in range(8) for reg in free[page]), None)
+        loops = []
+        ii = 0
+        while ii < n:
+            if best_saving[ii] <= 0:
+                ii += 1
+                continue
+            L, reps, nstep = best[ii].tolist()
+            if counter is None:
+                raise RuntimeError("no free register for a loop counter")
+            steps = [(jj, int(step)) for jj in range(ii, ii+L) for step in [args[jj+L, 2] - args[jj, 2]] if regwi[jj] and step != 0]
+            pool = {page: [reg for reg in regs if (page, reg) != counter] for page, regs in free.items()}
+            try:
+                regs = [pool[args[jj, 0]].pop(0) for jj, step in steps]
+            except IndexError:
+                ii += 1
+                continue
+            loops.append((ii, L, reps, list(zip(steps, regs))))
+            ii += L*reps
+        if not loops:
+            return {'loops': 0, 'old_length': n, 'new_length': n}
+
+        # rewrite the program
+        insts = [(name, store.get_args(ii)) for ii, name in enumerate(names)]
+        newinsts = []
+        newaddr = np.zeros(n+1, dtype=np.int64)
+        labels = {}
+        prev = 0
+        for start, L, reps, steps in loops:
+            newaddr[prev:start+1] = len(newinsts) + np.arange(start-prev+1)
+            newinsts.extend(insts[prev:start])
+            body = insts[start:start+L]
+            loop_label = "roll_%d" % (start)
+            while loop_label in self.labels or loop_label in labels:
+                loop_label += "_"
+            newinsts.append(('regwi', (counter[0], counter[1], reps-1)))
+            for (jj, step), reg in steps:
+                newinsts.append(('regwi', (args[jj, 0], reg, args[jj, 2])))
+                body[jj-start] = ('mathi', (args[jj, 0], args[jj, 1], reg, '+', 0))
+            labels[loop_label] = len(newinsts)
+            newinsts.extend(body)
+            for (jj, step), reg in steps:
+                newinsts.append(('mathi', (args[jj, 0], reg, reg, '+' if step > 0 else '-', abs(step))))
+            newinsts.append(('loopnz', (counter[0], counter[1], loop_label)))
+            prev = start + L*reps
+        newaddr[prev:] = len(newinsts) + np.arange(n-prev+1)
+        newinsts.extend(insts[prev:])
+
+        self.labels = {label: int(newaddr[addr]) for label, addr in self.labels.items()}
+        self.labels.update(labels)
+        self.patch_points = {name: [(int(newaddr[addr]), iArg, x) for addr, iArg, x in points]
+                             for name, points in self.patch_points.items()}
+        self.prog_list = [{'name': name, 'args': a} for name, a in newinsts]
+        return {'loops': len(loops), 'old_length': n, 'new_length': len(newinsts)}
+
+    def cost_report(self):
+        """
+        Estimate the resources and run time of the program, without a QICK board (the soccfg can be loaded from JSON).
+
+        The report has the program length and the program memory size (None if the soccfg doesn't give it),
+        and the number of registers in each page which the program uses, which are reserved (register 0, the page 0 loop counter and trigger registers, and the pulse registers of each channel, see sreg()), and which are neither.
+
+        For each loop (a loopnz and the label it jumps to), it has the number of repetitions (if the counter is set by a regwi just before the loop, otherwise None) and an estimate of the tProc cycles per repetition.
+        The estimate is the time the loop body advances the time reference (the sum of its synci times, with inner loops multiplied by their repetitions), plus the latest waiti time after the body's last synci.
+        For the last loop in the program, pulses and readouts since the last sync_all() (tracked in dac_ts and adc_ts) are added too.
+        If the body executes more instructions than that, the instruction count is used instead, since the tProc executes about one instruction per cycle.
+
+        :return: Program cost
+        :rtype: ProgramCost
+        """
+        store = self._store
+        n = len(store)
+        names = [store.names[code] for code in store.columns()[0].tolist()]
+        args = [store.get_args(ii) for ii in range(n)]
+
+        # registers
+        used = self._used_registers()
+        reserved = self._reserved_registers()
+        regs_used = {page: len([reg for reg in range(1, 32) if (page, reg) in used]) for page in range(8)}
+        regs_reserved = {page: len([reg for reg in range(1, 32) if (page, reg) in reserved]) for page in range(8)}
+        regs_free = {page: len([reg for reg in range(1, 32) if (page, reg) not in used | reserved]) for page in range(8)}
+
+        # loops, innermost first
+        addr_labels = {}
+        for label, addr in self.labels.items():
+            addr_labels.setdefault(addr, label)
+        loops = sorted([(self.labels[args[ii][2]], ii) for ii in range(n) if names[ii] == 'loopnz' and args[ii][2] in self.labels],
+                       key=lambda x: x[1]-x[0])
+        syncs = [ii for ii in range(n) if names[ii] == 'synci']
+        results = {}
+        for start, end in loops:
+            # the repetition count comes from a regwi to the counter before the loop
+            reps = None
+            counter = args[end][:2]
+            for ii in reversed(range(start)):
+                if names[ii] == 'regwi' and args[ii][:2] == counter:
+                    reps = args[ii][2] + 1
+                    break
+                if names[ii] in self.__class__.label_args or (ii+1) in addr_labels and ii+1 != start:
+                    break
+            sync_time = 0
+            tail = 0
+            ninst = 0
+            ii = start
+            while ii <= end:
+                inner = results.get(ii)
+                if inner is not None and inner.end <= end and ii != start:
+                    inner_reps = inner.reps if inner.reps is not None else 1
+                    sync_time += inner_reps*inner.cycles
+                    ninst += inner_reps*(inner.end - inner.start + 1)
+                    tail = 0
+                    ii = inner.end + 1
+                    continue
+                if names[ii] == 'synci':
+                    sync_time += args[ii][0]
+                    tail = 0
+                elif names[ii] == 'waiti':
+                    tail = max(tail, args[ii][1])
+                ninst += 1
+                ii += 1
+            if end == max([e for s, e in loops]) and not [ii for ii in syncs if ii > end]:
+                tail = max([tail] + self.dac_ts + self.adc_ts)
+            cycles = max(int(np.ceil(sync_time + tail)), ninst)
+            results[start] = LoopCost(addr_labels.get(start), start, end, reps, cycles, self.soccfg.cycles2us(cycles))
+
+        pmem_size = self.soccfg['tprocs'][0].get('pmem_size')
+        return ProgramCost(n, pmem_size, regs_used, regs_reserved, regs_free, sorted(results.values(), key=lambda x: x.start))
 
     def load_program(self, soc, debug=False):
         """
@@ -1213,7 +2459,50 @@ class QickProgram:
         :param debug: If True, debug mode is on
         :type debug: bool
         """
-        soc.tproc.load_bin_program(self.compile(debug=debug))
+        pmem_size = self.soccfg['tprocs'][0].get('pmem_size')
+        if pmem_size is not None and len(self) > pmem_size:
+            raise RuntimeError("program has %d instructions, but the tProc program memory only holds %d" % (len(self), pmem_size))
+        soc.tproc.load_bin_program(self.compile_image(debug=debug))
+
+    def param(self, name, value):
+        """
+        Declare a named parameter, which can be used in place of a register value (e.g. the freq, phase or gain of set_pulse_registers()) and changed after the program is compiled with patch().
+        Registers which pack several values together (e.g. on the axis_sg_int4_v1 generator) can't use parameters.
+
+        :param name: Parameter name
+        :type name: str
+        :param value: Initial register value
+        :type value: int
+        :return: Parameter value, to pass to the instruction or macro
+        :rtype: ParamValue
+        """
+        self.template_params[name] = value
+        return ParamValue(name, value)
+
+    def patch(self, soc=None, **values):
+        """
+        Change the values of named parameters (see param()) in the compiled program.
+        Only the instructions which use the parameters are encoded again.
+        If a QickSoc is given, the program is loaded with a delta load, which only writes the changed words to the tProc program memory.
+
+        :param soc: Qick object
+        :type soc: QickSoc
+        :param values: New register values, keyed by parameter name
+        :type values: int
+        :return: Program image
+        :rtype: numpy.ndarray
+        """
+        for name, value in values.items():
+            if name not in self.template_params:
+                raise RuntimeError("unknown parameter %s" % (name))
+        for name, value in values.items():
+            for addr, iArg, param in self.patch_points.get(name, []):
+                self._store.set_arg(addr, iArg, param.apply(value))
+            self.template_params[name] = value
+        image = self._cached_image()
+        if soc is not None:
+            soc.tproc.load_bin_program(image, delta=True)
+        return image.copy()
 
     def get_mode_code(self, length, mode=None, outsel=None, stdysel=None, phrst=None):
         """
@@ -1248,10 +2537,16 @@ class QickProgram:
 
         :param name: Instruction name
         :type name: str
-        :param *args: Instruction arguments
-        :type *args: *args object
-        """
-        self.prog_list.append({'name': name, 'args': args})
+        :param args: Instruction arguments
+        :type args: tuple
+        """
+        if self.template_params:
+            points = [(iArg, x) for iArg, x in enumerate(args) if isinstance(x, ParamValue)]
+            self._store.add(name, args)
+            for iArg, x in points:
+                self.patch_points.setdefault(x.name, []).append((len(self._store)-1, iArg, x))
+        else:
+            self._store.add(name, args)
 
     def label(self, name):
         """
@@ -1260,7 +2555,7 @@ class QickProgram:
         :param name: Instruction name
         :type name: str
         """
-        self.labels[name] = len(self.prog_list)
+        self.labels[name] = len(self._store)
 
     def comment(self, comment):
         """
@@ -1271,24 +2566,29 @@ class QickProgram:
         """
         pass
 
-    def __getattr__(self, a):
+    def __init_subclass__(cls, **kwargs):
         """
-        Uses instructions dictionary to automatically generate methods for the standard instruction set.
+        Generate the instruction and soccfg methods for subclasses which change the instruction set or the soccfg method list.
+        """
+        super().__init_subclass__(**kwargs)
+        if 'instructions' in cls.__dict__ or 'soccfg_methods' in cls.__dict__:
+            cls._add_methods()
+
+    @classmethod
+    def _add_methods(cls):
+        """
+        Uses instructions dictionary to generate methods for the standard instruction set.
 
         Also include all QickConfig methods as methods of the QickProgram.
         This allows e.g. this.freq2reg(f) instead of this.soccfg.freq2reg(f).
-
-        :param a: Instruction name
-        :type a: str
-        :return: Instruction arguments
-        :rtype: *args object
+        Methods defined in the class itself are not replaced.
         """
-        if a in self.__class__.instructions:
-            return lambda *args: self.append_instruction(a, *args)
-        elif a in self.__class__.soccfg_methods:
-            return getattr(self.soccfg, a)
-        else:
-            return object.__getattribute__(self, a)
+        for name, idef in cls.instructions.items():
+            if name not in cls.__dict__:
+                setattr(cls, name, _make_instruction_method(cls, name, idef))
+        for name in cls.soccfg_methods:
+            if name not in cls.__dict__:
+                setattr(cls, name, _make_soccfg_method(cls, name))
 
     def hex(self):
         """
@@ -1297,7 +2597,7 @@ class QickProgram:
         :return: Compiled program in hex format
         :rtype: str
         """
-        return "\n".join([format(mc, '#018x') for mc in self.compile()])
+        return "\n".join(self._text_lines('#018x'))
 
     def bin(self):
         """
@@ -1306,7 +2606,7 @@ class QickProgram:
         :return: Compiled program in binary format
         :rtype: str
         """
-        return "\n".join([format(mc, '#066b') for mc in self.compile()])
+        return "\n".join(self._text_lines('#066b'))
 
     def asm(self):
         """
@@ -1321,14 +2621,16 @@ class QickProgram:
             max_label_len = max([len(label) for label in self.labels.keys()])
         lines = []
         s = "\n// Program\n\n"
-        for ii, inst in enumerate(self.prog_list):
-            # print(inst)
-            template = inst['name'] + " " + \
-                self.__class__.instructions[inst['name']]['repr'] + ";"
-            num_args = len(self.__class__.instructions[inst['name']]['fmt'])
-            line = " "*(max_label_len+2) + template.format(*inst['args'])
-            if len(inst['args']) > num_args:
-                line += " "*(48-len(line)) + "//" + inst['args'][-1]
+        store = self._store
+        for ii in range(len(store)):
+            name = store.get_name(ii)
+            args = store.get_args(ii)
+            template = name + " " + \
+                self.__class__.instructions[name]['repr'] + ";"
+            num_args = len(self.__class__.instructions[name]['fmt'])
+            line = " "*(max_label_len+2) + template.format(*args)
+            if len(args) > num_args:
+                line += " "*(48-len(line)) + "//" + args[-1]
             lines.append(line)
 
         for label, jj in self.labels.items():
@@ -1344,6 +2646,7 @@ class QickProgram:
         :return: True if programs are identical; False otherwise
         :rtype: bool
         """
+        from parserdemo import parse_prog
         match = True
         pns = [int(n, 2) for n in self.bin().split('\n')]
         fns = [int(n, 2)
@@ -1362,7 +2665,7 @@ class QickProgram:
         :return: number of instructions in the program
         :rtype: int
         """
-        return len(self.prog_list)
+        return len(self._store)
 
     def __str__(self):
         """
@@ -1373,6 +2676,22 @@ class QickProgram:
         """
         return self.asm()
 
+    @property
+    def prog_list(self):
+        """
+        The program's instructions, as a sequence of {'name': ..., 'args': ...} dicts.
+
+        :return: Instruction store
+        :rtype: InstructionStore
+        """
+        return self._store
+
+    @prog_list.setter
+    def prog_list(self, insts):
+        self._store = InstructionStore(self.__class__.instructions, self.__class__.label_args, self.__class__.op_args)
+        for inst in insts:
+            self._store.append(inst)
+
     def __enter__(self):
         """
         Enter the runtime context related to this object.
@@ -1394,3 +2713,560 @@ class QickProgram:
         :type traceback: str
         """
         pass
+
+
+class PulseSchedule():
+    """
+    A block of pulses and triggers whose start times are computed together, instead of by hand with pulse(t=...), trigger(t=...) and sync_all().
+    Each call adds an item and returns its number, which later items can refer to: "after" starts an item when other items end (plus a delay), and "align" starts it at the same time as another item.
+    Nothing is written to the program until the block ends.
+
+    When the block ends, every item gets the earliest start time which meets its constraints, and which doesn't overlap the previous use of the same generator, readout or trigger output
+    (in the block, or before the block: the start times are relative to the last sync, as tracked in dac_ts and adc_ts).
+    The items are then written in order of start time, using as few time register writes as possible: a pulse at time 0 uses register 0, and pulses at the same time on generators that share a register page share a time register.
+    The block ends with at most one synci (see the sync parameter), so a sequence of pulses needs no sync_all() between them.
+
+    Pulse parameters can be given to pulse() as for set_pulse_registers(), in which case the registers are set just before the pulse is played, and a generator can play several pulses in one block.
+    Otherwise the pulse uses the registers as they were last set; the generator's registers must then not be changed again until the block ends.
+
+    ::
+
+        with prog.schedule(sync=100) as blk:
+            drive = blk.pulse(ch=0, style='const', freq=f, phase=0, gain=1000, length=20)
+            readout = blk.measure(adcs=[0], pulse_ch=1, after=drive, delay=5)
+
+    :param prog: Program to add the pulses to
+    :type prog: QickProgram
+    :param sync: If not None, sync_all() with this time offset at the end of the block
+    :type sync: int
+    :param wait: If True, wait_all() at the end of the block (before the sync)
+    :type wait: bool
+    """
+    def __init__(self, prog, sync=None, wait=False):
+        """
+        Constructor method
+        """
+        self.prog = prog
+        self.sync = sync
+        self.wait = wait
+        self.items = []
+        # start and end times of the items, filled in when the block ends
+        self.starts = None
+        self.ends = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.emit()
+
+    def _add(self, item, t, after, align, delay):
+        """
+        Add an item to the block.
+
+        :param item: Item contents, including its 'kind' and the 'resources' it occupies as (resource, offset, duration) tuples
+        :type item: dict
+        :param t: Earliest start time
+        :type t: int
+        :param after: Items which must end before this one starts
+        :type after: int or list
+        :param align: Item which this one must start together with
+        :type align: int
+        :param delay: Time between the end of the "after" items and the start of this one
+        :type delay: int
+        :return: Item number
+        :rtype: int
+        """
+        if after is None:
+            after = []
+        elif not isinstance(after, (list, tuple)):
+            after = [after]
+        for x in list(after) + ([] if align is None else [align]):
+            if not 0 <= x < len(self.items):
+                raise RuntimeError("item %s is not an earlier item of this schedule" % (repr(x)))
+        item.update(t=t, after=list(after), align=align, delay=delay)
+        self.items.append(item)
+        return len(self.items) - 1
+
+    def pulse(self, ch, t=0, after=None, align=None, delay=0, style=None, **kwargs):
+        """
+        Add a pulse.
+
+        :param ch: DAC channel (index in 'gens' list)
+        :type ch: int
+        :param t: Earliest start time (in tProc clock ticks, since the last sync)
+        :type t: int
+        :param after: Items which must end before the pulse starts
+        :type after: int or list
+        :param align: Item which the pulse must start together with
+        :type align: int
+        :param delay: Time between the end of the "after" items and the start of the pulse
+        :type delay: int
+        :param style: Pulse style ("const", "arb", "flat_top"); if None, the pulse registers as last set are used
+        :type style: string
+        :param kwargs: Pulse parameters, as for set_pulse_registers()
+        :type kwargs: dict
+        :return: Item number
+        :rtype: int
+        """
+        prog = self.prog
+        reprogrammed = [x for x in self.items if x['kind'] == 'pulse' and x['ch'] == ch and x['insts'] is not None]
+        if style is None:
+            if reprogrammed:
+                raise RuntimeError("DAC channel %d plays a pulse with its own parameters earlier in this schedule, so its registers are not available" % (ch))
+            last_pulse = prog.channels[ch]['last_pulse']
+            if last_pulse is None:
+                raise RuntimeError("no pulse has been configured for DAC channel %d" % (ch))
+            insts = None
+        else:
+            insts, last_pulse = self._capture(ch, style, kwargs)
+        length = last_pulse['length']*prog.soccfg['fs_proc']/prog.soccfg['gens'][ch]['f_fabric']
+        item = {'kind': 'pulse', 'ch': ch, 'last_pulse': last_pulse, 'insts': insts,
+                'resources': [(('gen', ch), 0, length)]}
+        return self._add(item, t, after, align, delay)
+
+    def _capture(self, ch, style, kwargs):
+        """
+        Record the instructions which set_pulse_registers() writes for a pulse, without adding them to the program.
+
+        :param ch: DAC channel (index in 'gens' list)
+        :type ch: int
+        :param style: Pulse style
+        :type style: string
+        :param kwargs: Pulse parameters
+        :type kwargs: dict
+        :return: Instructions, as (name, args) tuples with parameters restored as ParamValue; and the pulse description (as in the 'last_pulse' of the channel)
+        :rtype: tuple
+        """
+        prog = self.prog
+        store, points, last_pulse = prog._store, prog.patch_points, prog.channels[ch]['last_pulse']
+        prog._store = InstructionStore(prog.__class__.instructions, prog.__class__.label_args, prog.__class__.op_args)
+        prog.patch_points = {}
+        try:
+            prog.set_pulse_registers(ch, style, **kwargs)
+            captured, captured_points, pulse = prog._store, prog.patch_points, prog.channels[ch]['last_pulse']
+        finally:
+            prog._store, prog.patch_points = store, points
+            prog.channels[ch]['last_pulse'] = last_pulse
+        insts = [(inst['name'], list(inst['args'])) for inst in captured]
+        for name, x in captured_points.items():
+            for addr, iArg, param in x:
+                insts[addr][1][iArg] = param
+        return insts, pulse
+
+    def trigger(self, adcs=None, pins=None, adc_trig_offset=270, t=0, after=None, align=None, delay=0, width=10, rp=0, r_out=31):
+        """
+        Add a trigger of ADC(s) and marker pin(s), as in QickProgram.trigger().
+        The item's start time is the trigger time before adc_trig_offset is applied, so a trigger aligned with a pulse gives the same timing as measure().
+
+        :param adcs: List of ADC channels to trigger.
+        :type adcs: list
+        :param pins: List of marker pins to pulse.
+        :type pins: list
+        :param adc_trig_offset: Offset time at which the ADC is triggered (in clock ticks)
+        :type adc_trig_offset: int
+        :param t: Earliest start time (in tProc clock ticks, since the last sync)
+        :type t: int
+        :param after: Items which must end before the trigger starts
+        :type after: int or list
+        :param align: Item which the trigger must start together with
+        :type align: int
+        :param delay: Time between the end of the "after" items and the start of the trigger
+        :type delay: int
+        :param width: The width of the trigger pulse, in clock ticks
+        :type width: int
+        :param rp: Register page
+        :type rp: int
+        :param r_out: Register number
+        :type r_out: int
+        :return: Item number
+        :rtype: int
+        """
+        prog = self.prog
+        adcs = [] if adcs is None else list(adcs)
+        pins = [] if pins is None else list(pins)
+        if not adcs and not pins:
+            raise RuntimeError("must pulse at least one ADC or pin")
+        out = 0
+        for adc in adcs:
+            out |= (1 << prog.soccfg['readouts'][adc]['trigger_bit'])
+        for pin in pins:
+            out |= (1 << pin)
+        offset = adc_trig_offset if adcs else 0
+        resources = [(('trig',), offset, width)]
+        for adc in adcs:
+            # convert from readout clock to tProc clock
+            ro_length = prog.ro_chs[adc].length*prog.soccfg['fs_proc']/prog.soccfg['readouts'][adc]['f_fabric']
+            resources.append((('ro', adc), offset, ro_length))
+        item = {'kind': 'trigger', 'out': out, 'offset': offset, 'width': width, 'rp': rp, 'r_out': r_out,
+                'resources': resources}
+        return self._add(item, t, after, align, delay)
+
+    def measure(self, adcs, pulse_ch, pins=None, adc_trig_offset=270, t=0, after=None, align=None, delay=0, style=None, **kwargs):
+        """
+        Add a pulse, and a trigger of the ADC(s) aligned with it, as in QickProgram.measure().
+
+        :param adcs: ADC channels
+        :type adcs: list
+        :param pulse_ch: DAC channel
+        :type pulse_ch: int
+        :param pins: List of marker pins to pulse.
+        :type pins: list
+        :param adc_trig_offset: Offset time at which the ADC is triggered (in clock ticks)
+        :type adc_trig_offset: int
+        :param t: Earliest start time (in tProc clock ticks, since the last sync)
+        :type t: int
+        :param after: Items which must end before the pulse starts
+        :type after: int or list
+        :param align: Item which the pulse must start together with
+        :type align: int
+        :param delay: Time between the end of the "after" items and the start of the pulse
+        :type delay: int
+        :param style: Pulse style, if the pulse parameters are given (see pulse())
+        :type style: string
+        :param kwargs: Pulse parameters, as for set_pulse_registers()
+        :type kwargs: dict
+        :return: Item number of the pulse
+        :rtype: int
+        """
+        item = self.pulse(pulse_ch, t=t, after=after, align=align, delay=delay, style=style, **kwargs)
+        self.trigger(adcs, pins=pins, adc_trig_offset=adc_trig_offset, align=item)
+        return item
+
+    def resolve(self):
+        """
+        Compute the earliest start time of each item.
+        The constraints only push start times later, so they are relaxed in passes over the items until nothing changes.
+
+        :return: Start and end times of the items (in tProc clock ticks, since the last sync)
+        :rtype: tuple
+        """
+        prog = self.prog
+        items = self.items
+        n = len(items)
+        # each item is aligned with the first item of its group
+        group = list(range(n))
+        for i, item in enumerate(items):
+            if item['align'] is not None:
+                group[i] = group[item['align']]
+        initial = {}
+        initial.update({('gen', ch): ts for ch, ts in enumerate(prog.dac_ts)})
+        initial.update({('ro', adc): ts for adc, ts in enumerate(prog.adc_ts)})
+
+        starts = [int(np.ceil(item['t'])) for item in items]
+
+        def end(i):
+            return starts[i] + max([off + dur for res, off, dur in items[i]['resources']])
+
+        for npass in range(2*n + 2):
+            changed = False
+            free = dict(initial)
+            for i, item in enumerate(items):
+                lb = starts[i]
+                for j in item['after']:
+                    lb = max(lb, end(j) + item['delay'])
+                for res, off, dur in item['resources']:
+                    lb = max(lb, free.get(res, 0) - off)
+                lb = int(np.ceil(lb))
+                if lb > starts[i]:
+                    starts[i] = lb
+                    changed = True
+                for res, off, dur in item['resources']:
+                    free[res] = starts[i] + off + dur
+            latest = {}
+            for i in range(n):
+                latest[group[i]] = max(latest.get(group[i], 0), starts[i])
+            for i in range(n):
+                if starts[i] < latest[group[i]]:
+                    starts[i] = latest[group[i]]
+                    changed = True
+            if not changed:
+                break
+        else:
+            raise RuntimeError("the schedule's after and align constraints contradict each other")
+        return starts, [end(i) for i in range(n)]
+
+    def emit(self):
+        """
+        Schedule the items and write them to the program.
+        This is called when the with block ends.
+        """
+        prog = self.prog
+        for item in self.items:
+            if item['kind'] == 'pulse' and item['insts'] is None and prog.channels[item['ch']]['last_pulse'] is not item['last_pulse']:
+                raise RuntimeError("the registers of DAC channel %d were changed after its pulse was added to the schedule; give the pulse parameters to the schedule's pulse() instead" % (item['ch']))
+        self.starts, self.ends = self.resolve()
+
+        # registers holding a known time in each page, and the known trigger output values
+        time_regs = {}
+        out_regs = {}
+        trig_output = prog.soccfg['tprocs'][0]['trig_output']
+        # in order of output time, which keeps the outputs of each generator and trigger in order
+        order = sorted(range(len(self.items)), key=lambda i: self.starts[i] + self.items[i]['resources'][0][1])
+        for i in order:
+            item = self.items[i]
+            t = self.starts[i]
+            if item['kind'] == 'pulse':
+                ch = item['ch']
+                rp = prog.ch_page(ch)
+                tproc_ch = prog.soccfg['gens'][ch]['tproc_ch']
+                if item['insts'] is not None:
+                    for name, args in item['insts']:
+                        prog.append_instruction(name, *args)
+                    prog.channels[ch]['last_pulse'] = item['last_pulse']
+                if t == 0:
+                    r_t = 0
+                elif (rp, t) in time_regs:
+                    r_t = time_regs[(rp, t)]
+                else:
+                    r_t = prog.sreg(ch, 't')
+                    prog.safe_regwi(rp, r_t, t, f't = {t}')
+                    time_regs = {k: v for k, v in time_regs.items() if v != r_t or k[0] != rp}
+                    time_regs[(rp, t)] = r_t
+                for regs in item['last_pulse']['regs']:
+                    prog.set(tproc_ch, rp, *regs, r_t, f"ch = {ch}, pulse @t = ${r_t}")
+                prog.dac_ts[ch] = max(prog.dac_ts[ch], self.ends[i])
+            else:
+                rp, r_out, out = item['rp'], item['r_out'], item['out']
+                t_start = t + item['offset']
+                if out_regs.get((rp, r_out)) != out:
+                    prog.regwi(rp, r_out, out, f'out = 0b{out:>016b}')
+                    out_regs[(rp, r_out)] = out
+                prog.seti(trig_output, rp, r_out, t_start, f'ch =0 out = ${r_out} @t = {t}')
+                prog.seti(trig_output, rp, 0, t_start + item['width'], f'ch =0 out = 0 @t = {t}')
+                for res, off, dur in item['resources']:
+                    if res[0] == 'ro':
+                        prog.adc_ts[res[1]] = max(prog.adc_ts[res[1]], t + off + dur)
+        if self.wait:
+            prog.wait_all()
+        if self.sync is not None:
+            prog.sync_all(self.sync)
+
+
+class CompiledProgram():
+    """
+    Everything a QickSoc needs to run a compiled program: the program image, the pulse envelopes and their addresses,
+    the declared readout and generator channels, and the fingerprint of the configuration it was compiled for (see QickConfig.fingerprint()).
+
+    A CompiledProgram can be saved to a single .npz file (or file-like object) and loaded on the board, which then doesn't need to build the program.
+    The file holds only NumPy arrays and strings (no pickled objects), so it's safe to load from an untrusted source.
+
+    :param image: Program image, one 64-bit word per instruction
+    :type image: numpy.ndarray
+    :param pulses: Pulse envelopes, as (DAC channel, name, address, I data, Q data) tuples
+    :type pulses: list
+    :param ro_chs: Readout channels, as in QickProgram
+    :type ro_chs: OrderedDict
+    :param gen_chs: Signal generator channels, as in QickProgram
+    :type gen_chs: OrderedDict
+    :param fingerprint: Fingerprint of the configuration
+    :type fingerprint: str
+    """
+    # version of the file format, incremented when the arrays in the file change
+    FORMAT_VERSION = 1
+
+    def __init__(self, image, pulses, ro_chs, gen_chs, fingerprint):
+        """
+        Constructor method
+        """
+        self.image = np.asarray(image, dtype=np.uint64)
+        self.pulses = pulses
+        self.ro_chs = ro_chs
+        self.gen_chs = gen_chs
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_program(cls, prog):
+        """
+        Compile a program.
+
+        :param prog: Program
+        :type prog: QickProgram
+        :return: Compiled program
+        :rtype: CompiledProgram
+        """
+        pulses = []
+        for ch, chcfg in prog.channels.items():
+            for name, pulse in chcfg['pulses'].items():
+                data = []
+                for x in [pulse['idata'], pulse['qdata']]:
+                    x = np.asarray(x)
+                    if len(x) and (np.max(x) > np.iinfo(np.int16).max or np.min(x) < np.iinfo(np.int16).min):
+                        raise RuntimeError("envelope %s of DAC channel %d exceeds the limits of the int16 datatype" % (name, ch))
+                    # truncate like the signal generator driver does
+                    data.append(x.astype(np.int32).astype(np.int16))
+                pulses.append((ch, name, pulse['addr'], data[0], data[1]))
+        return cls(prog.compile_image(), pulses, OrderedDict(prog.ro_chs), OrderedDict(prog.gen_chs), prog.soccfg.fingerprint())
+
+    def save(self, file):
+        """
+        Save the compiled program as a compressed .npz file.
+
+        :param file: File name or file-like object
+        :type file: str or file
+        """
+        mux_freqs = np.full((len(self.gen_chs), 4), np.nan)
+        for i, cfg in enumerate(self.gen_chs.values()):
+            if cfg.mux_freqs is not None:
+                mux_freqs[i, :len(cfg.mux_freqs)] = cfg.mux_freqs
+        np.savez_compressed(file,
+                            format_version=np.int64(self.FORMAT_VERSION),
+                            fingerprint=np.array(self.fingerprint),
+                            image=self.image,
+                            pulse_ch=np.array([x[0] for x in self.pulses], dtype=np.int64),
+                            pulse_name=np.array([x[1] for x in self.pulses], dtype=str),
+                            pulse_addr=np.array([x[2] for x in self.pulses], dtype=np.int64),
+                            pulse_length=np.array([len(x[3]) for x in self.pulses], dtype=np.int64),
+                            pulse_idata=np.concatenate([x[3] for x in self.pulses] + [np.zeros(0, dtype=np.int16)]),
+                            pulse_qdata=np.concatenate([x[4] for x in self.pulses] + [np.zeros(0, dtype=np.int16)]),
+                            ro_ch=np.array(list(self.ro_chs.keys()), dtype=np.int64),
+                            ro_freq=np.array([x.freq for x in self.ro_chs.values()], dtype=float),
+                            ro_length=np.array([x.length for x in self.ro_chs.values()], dtype=np.int64),
+                            ro_sel=np.array([x.sel for x in self.ro_chs.values()], dtype=str),
+                            ro_gen_ch=np.array([-1 if x.gen_ch is None else x.gen_ch for x in self.ro_chs.values()], dtype=np.int64),
+                            gen_ch=np.array(list(self.gen_chs.keys()), dtype=np.int64),
+                            gen_nqz=np.array([x.nqz for x in self.gen_chs.values()], dtype=np.int64),
+                            gen_mixer_freq=np.array([x.mixer_freq for x in self.gen_chs.values()], dtype=float),
+                            gen_mux_freqs=mux_freqs,
+                            gen_has_mux=np.array([x.mux_freqs is not None for x in self.gen_chs.values()], dtype=bool),
+                            gen_ro_ch=np.array([-1 if x.ro_ch is None else x.ro_ch for x in self.gen_chs.values()], dtype=np.int64))
+
+    @classmethod
+    def load(cls, file):
+        """
+        Load a compiled program saved with save().
+
+        :param file: File name or file-like object
+        :type file: str or file
+        :return: Compiled program
+        :rtype: CompiledProgram
+        """
+        with np.load(file, allow_pickle=False) as f:
+            version = int(f['format_version'])
+            if version != cls.FORMAT_VERSION:
+                raise RuntimeError("compiled program has format version %d, but this version of the library reads version %d" % (version, cls.FORMAT_VERSION))
+            ends = np.cumsum(f['pulse_length'])
+            starts = ends - f['pulse_length']
+            idata, qdata = f['pulse_idata'], f['pulse_qdata']
+            pulses = [(ch, name, addr, idata[start:end], qdata[start:end]) for ch, name, addr, start, end
+                      in zip(f['pulse_ch'].tolist(), f['pulse_name'].tolist(), f['pulse_addr'].tolist(), starts.tolist(), ends.tolist())]
+            ro_chs = OrderedDict()
+            for ch, freq, length, sel, gen_ch in zip(f['ro_ch'].tolist(), f['ro_freq'].tolist(), f['ro_length'].tolist(),
+                                                     f['ro_sel'].tolist(), f['ro_gen_ch'].tolist()):
+                ro_chs[ch] = ReadoutConfig(freq, length, sel, None if gen_ch < 0 else gen_ch)
+            gen_chs = OrderedDict()
+            for ch, nqz, mixer_freq, mux_freqs, has_mux, ro_ch in zip(f['gen_ch'].tolist(), f['gen_nqz'].tolist(), f['gen_mixer_freq'].tolist(),
+                                                                      f['gen_mux_freqs'], f['gen_has_mux'].tolist(), f['gen_ro_ch'].tolist()):
+                mux_freqs = mux_freqs[~np.isnan(mux_freqs)].tolist() if has_mux else None
+                gen_chs[ch] = GeneratorConfig(nqz, mixer_freq, mux_freqs, None if ro_ch < 0 else ro_ch)
+            return cls(f['image'], pulses, ro_chs, gen_chs, str(f['fingerprint']))
+
+    def check(self, soccfg):
+        """
+        Check that the program was compiled for this configuration.
+
+        :param soccfg: QICK firmware configuration
+        :type soccfg: QickConfig
+        """
+        if soccfg.fingerprint() != self.fingerprint:
+            raise RuntimeError("program was compiled for a different QICK configuration (fingerprint %s, this configuration is %s)" % (self.fingerprint, soccfg.fingerprint()))
+
+    def load_pulses(self, soc):
+        """
+        Load the pulse envelopes into the signal generators.
+
+        :param soc: the QickSoc that will execute this program
+        :type soc: QickSoc
+        """
+        for ch, name, addr, idata, qdata in self.pulses:
+            soc.load_pulse_data(ch, idata=idata, qdata=qdata, addr=addr)
+
+    # the channel declarations are stored as in QickProgram, so they are applied the same way
+    config_readouts = QickProgram.config_readouts
+    config_bufs = QickProgram.config_bufs
+    config_gens = QickProgram.config_gens
+
+    def load_program(self, soc):
+        """
+        Load the program image into the tProcessor.
+
+        :param soc: the QickSoc that will execute this program
+        :type soc: QickSoc
+        """
+        soc.tproc.load_bin_program(self.image)
+
+    def config_all(self, soc, load_pulses=True, enable_avg=True, enable_buf=True):
+        """
+        Check the configuration fingerprint, then load the pulses, configure the generators, readouts and buffers, and load the program,
+        as the acquire methods of the averager programs do.
+        The tProc is not started.
+
+        :param soc: the QickSoc that will execute this program
+        :type soc: QickSoc
+        :param load_pulses: If True, load the pulse envelopes
+        :type load_pulses: bool
+        :param enable_avg: enable the accumulated (averaging) buffer
+        :type enable_avg: bool
+        :param enable_buf: enable the decimated (waveform) buffer
+        :type enable_buf: bool
+        """
+        self.check(soc)
+        if load_pulses:
+            self.load_pulses(soc)
+        self.config_gens(soc)
+        self.config_readouts(soc)
+        self.config_bufs(soc, enable_avg=enable_avg, enable_buf=enable_buf)
+        self.load_program(soc)
+
+
+def _make_instruction_method(cls, name, idef):
+    """
+    Make a method which appends an instruction to the program.
+
+    :param cls: Class the method is for
+    :type cls: class
+    :param name: Instruction name
+    :type name: str
+    :param idef: Instruction definition, from the instructions dictionary
+    :type idef: dict
+    :return: Method
+    :rtype: function
+    """
+    nargs = max([field[0]+1 for field in idef['fmt']], default=0)
+
+    def method(self, *args):
+        if len(args) != nargs and len(args) != nargs+1:
+            raise TypeError("%s() takes %d arguments (plus an optional comment) but %d were given" % (name, nargs, len(args)))
+        self.append_instruction(name, *args)
+    method.__name__ = name
+    method.__qualname__ = cls.__qualname__ + "." + name
+    method.__doc__ = """
+        Append a %s instruction: ``%s``
+
+        :param args: Instruction arguments (%d, plus an optional comment)
+        :type args: tuple
+        """ % (name, (name + " " + idef['repr']).strip(), nargs)
+    return method
+
+
+def _make_soccfg_method(cls, name):
+    """
+    Make a method which calls the QickConfig method of the same name on the program's soccfg.
+
+    :param cls: Class the method is for
+    :type cls: class
+    :param name: QickConfig method name
+    :type name: str
+    :return: Method
+    :rtype: function
+    """
+    def method(self, *args, **kwargs):
+        return getattr(self.soccfg, name)(*args, **kwargs)
+    method.__name__ = name
+    method.__qualname__ = cls.__qualname__ + "." + name
+    method.__doc__ = getattr(QickConfig, name).__doc__
+    return method
+
+
+QickProgram._add_methods()
@@ -0,0 +1,210 @@
+"""
+Renders the output of the tProc-controlled signal generators from the pulses a program plays, without a QICK board.
+"""
+import numpy as np
+
+
+class GenRenderer():
+    """
+    Synthesizes the sampled output of the signal generators from the "set" events of a tProc event log (see the emulator module),
+    using the program's pulse library and generator declarations.
+
+    Pulses are decoded from the register values that pulse() writes, for the axis_signal_gen_v4/v5, axis_sg_int4_v1 and axis_sg_mux4_v1 generators.
+    Each pulse starts at its scheduled time, or when the previous pulse on the generator ends if that is later (so the segments of a flat_top pulse play back to back).
+    Every output sample is computed in bulk: the active pulse is found by a sorted search, then the DDS phase, envelope and gain are looked up with array indexing.
+
+    The output is the complex generator output (before any mixer), scaled so full scale is 1; the DAC plays the real part.
+    The DDS phase accumulator runs continuously from sample 0, unless a pulse resets it (phrst).
+    The x4 envelope interpolation of the axis_sg_int4_v1 is approximated by linear interpolation.
+    The tones of the axis_sg_mux4_v1 are set by the mux_freqs given to declare_gen(), and each tone has an amplitude of 1/4.
+
+    :param prog: Program which defines the pulses
+    :type prog: QickProgram
+    """
+    # bit positions of the flags in the mode register, see QickProgram.get_mode_code()
+    MODE_PHRST = 0b10000
+    MODE_STDYSEL_ZERO = 0b01000
+    MODE_PERIODIC = 0b00100
+
+    def __init__(self, prog):
+        """
+        Constructor method
+        """
+        self.prog = prog
+        self.soccfg = prog.soccfg
+        self.tproc_chs = {gen['tproc_ch']: ch for ch, gen in enumerate(self.soccfg['gens'])}
+
+    def envelope_table(self, ch):
+        """
+        Build the envelope memory of a generator from the pulse library.
+
+        :param ch: DAC channel (index in 'gens' list)
+        :type ch: int
+        :return: Envelope samples, as complex values in DAC units
+        :rtype: numpy.ndarray
+        """
+        pulses = self.prog.channels[ch]['pulses']
+        table = np.zeros(self.prog.channels[ch]['addr'], dtype=complex)
+        for pulse in pulses.values():
+            table[pulse['addr']:pulse['addr']+len(pulse['idata'])] = np.asarray(pulse['idata']) + 1j*np.asarray(pulse['qdata'])
+        return table
+
+    def decode_pulses(self, events, ch):
+        """
+        Decode the pulses played on a generator from an event log.
+
+        :param events: Event log, as returned by TProcEmulator.run()
+        :type events: list
+        :param ch: DAC channel (index in 'gens' list)
+        :type ch: int
+        :return: Pulse parameters, as arrays with one element per pulse: start and length (in output samples), freq, phase, gain, addr (in envelope samples), outsel and flags; and mask for a muxed generator
+        :rtype: dict
+        """
+        gencfg = self.soccfg['gens'][ch]
+        gen_type = gencfg['type']
+        tproc_ch = gencfg['tproc_ch']
+        sets = [e for e in events if e.kind == 'set' and e.ch == tproc_ch]
+        values = np.array([e.values for e in sets], dtype=np.int64).reshape((-1, 5))
+        times = np.array([e.time for e in sets], dtype=np.int64)
+
+        # output samples per fabric clock, and envelope samples per fabric clock
+        spc = int(round(gencfg['fs']/gencfg['f_fabric']))
+        table_spc = gencfg['samps_per_clk']
+
+        pulses = {}
+        if gen_type in ['axis_signal_gen_v4', 'axis_signal_gen_v5']:
+            pulses['freq'] = values[:, 0]
+            pulses['phase'] = values[:, 1]
+            pulses['addr'] = values[:, 2]*table_spc
+            gain = values[:, 3]
+            mode = values[:, 4]
+        elif gen_type == 'axis_sg_int4_v1':
+            pulses['freq'] = values[:, 0] & 0xffff
+            pulses['phase'] = (values[:, 0] >> 16) & 0xffff
+            pulses['addr'] = (values[:, 1] & 0xffff)*table_spc
+            gain = (values[:, 1] >> 16) & 0xffff
+            mode = values[:, 2]
+        elif gen_type == 'axis_sg_mux4_v1':
+            n = len(values)
+            pulses['freq'] = pulses['phase'] = pulses['addr'] = np.zeros(n, dtype=np.int64)
+            pulses['mask'] = values[:, 1] & 0xf
+            gain = np.full(n, 32767, dtype=np.int64)
+            # mux pulses are always "dds", oneshot, and return to zero
+            mode = ((self.MODE_STDYSEL_ZERO | 1) << 16) | (values[:, 0] & 0xffff)
+        else:
+            raise RuntimeError("this is not a tProc-controlled signal generator:", gen_type)
+        # gains are signed 16-bit
+        pulses['gain'] = ((gain & 0xffff) ^ 0x8000) - 0x8000
+        pulses['outsel'] = (mode >> 16) & 0b11
+        pulses['flags'] = (mode >> 16) & 0b11100
+        pulses['length'] = (mode & 0xffff)*spc
+
+        # start when scheduled, or when the previous pulse ends (a max-plus scan: start = C + running max of (t - C), C = cumulative length)
+        sched = np.round(times*gencfg['f_fabric']/self.soccfg['fs_proc']).astype(np.int64)*spc
+        order = np.argsort(sched, kind='stable')
+        for key in pulses:
+            pulses[key] = pulses[key][order]
+        sched = sched[order]
+        cum = np.concatenate([[0], np.cumsum(pulses['length'])[:-1]]).astype(np.int64)
+        pulses['start'] = cum + np.maximum.accumulate(sched - cum) if len(sched) else sched
+        return pulses
+
+    def render(self, events, ch, start=0, stop=None):
+        """
+        Render the output of a generator.
+
+        :param events: Event log, as returned by TProcEmulator.run()
+        :type events: list
+        :param ch: DAC channel (index in 'gens' list)
+        :type ch: int
+        :param start: First output sample to render
+        :type start: int
+        :param stop: Output sample to stop at (if None, the end of the last pulse)
+        :type stop: int
+        :return: Times (us) and complex output samples
+        :rtype: tuple
+        """
+        gencfg = self.soccfg['gens'][ch]
+        pulses = self.decode_pulses(events, ch)
+        p_start = pulses['start']
+        p_len = pulses['length']
+        if stop is None:
+            stop = int(np.max(p_start + p_len)) if len(p_start) else start
+        n = np.arange(start, stop, dtype=np.int64)
+        t = n/gencfg['fs']
+        out = np.zeros(len(n), dtype=complex)
+        if len(p_start) == 0:
+            return t, out
+
+        # the pulse which is playing (or last played) at each sample
+        ip = np.searchsorted(p_start, n, side='right') - 1
+        flags = pulses['flags'][ip]
+        k = n - p_start[ip]
+        # periodic pulses repeat until the next pulse; oneshot pulses hold the last sample or go to zero
+        periodic = (flags & self.MODE_PERIODIC) != 0
+        active = (ip >= 0) & (periodic | (k < p_len[ip]) | ((flags & self.MODE_STDYSEL_ZERO) == 0))
+        n, ip, k, flags, periodic = n[active], ip[active], k[active], flags[active], periodic[active]
+        length = np.maximum(p_len[ip], 1)
+        k = np.where(periodic, k % length, np.minimum(k, length - 1))
+        n_eff = p_start[ip] + k
+
+        # DDS
+        b_dds = gencfg['b_dds']
+        if gencfg['type'] == 'axis_sg_mux4_v1':
+            dds = np.zeros(len(n), dtype=complex)
+            mux_freqs = self.prog.gen_chs[ch].mux_freqs if ch in self.prog.gen_chs else None
+            ro_ch = self.prog.gen_chs[ch].ro_ch if ch in self.prog.gen_chs else None
+            for tone, f in enumerate(mux_freqs or []):
+                pinc = np.uint64(self.soccfg.freq2reg(f, gen_ch=ch, ro_ch=ro_ch))
+                acc = (n_eff.astype(np.uint64)*pinc) % np.uint64(2**b_dds)
+                enabled = (pulses['mask'][ip] >> tone) & 1
+                dds += enabled*np.exp(2j*np.pi*acc/2**b_dds)/4
+        else:
+            origin = np.where((flags & self.MODE_PHRST) != 0, p_start[ip], 0)
+            acc = ((n_eff - origin).astype(np.uint64)*pulses['freq'][ip].astype(np.uint64)
+                   + pulses['phase'][ip].astype(np.uint64)) % np.uint64(2**b_dds)
+            dds = np.exp(2j*np.pi*acc/2**b_dds)
+
+        # envelope
+        outsel = pulses['outsel'][ip]
+        env = np.ones(len(n), dtype=complex)
+        uses_table = (outsel == 0) | (outsel == 2)
+        if np.any(uses_table):
+            table = self.envelope_table(ch)
+            # envelope samples per output sample
+            ratio = gencfg['samps_per_clk']/(gencfg['fs']/gencfg['f_fabric'])
+            pos = pulses['addr'][ip] + k*ratio
+            i0 = np.floor(pos).astype(np.int64)
+            frac = pos - i0
+            padded = np.concatenate([table, [0, 0]])
+            valid = (i0 >= 0) & (i0 < len(table))
+            i0 = np.where(valid, i0, len(table))
+            env = np.where(valid, padded[i0]*(1-frac) + padded[np.minimum(i0+1, len(table))]*frac, 0)/32767
+
+        gain = pulses['gain'][ip]/32767
+        y = np.select([outsel == 0, outsel == 1, outsel == 2], [env*dds, dds, env.real + 0j], 0)
+        out[active] = gain*y
+        return t, out
+
+
+def render_program(prog, events=None, chs=None):
+    """
+    Render the outputs of a program's generators.
+
+    :param prog: Program
+    :type prog: QickProgram
+    :param events: Event log (if None, the program is run in the emulator)
+    :type events: list
+    :param chs: DAC channels to render (if None, all tProc-controlled generators which play a pulse)
+    :type chs: list
+    :return: Times (us) and complex output samples, keyed by DAC channel
+    :rtype: dict
+    """
+    if events is None:
+        from emulatordemo import emulate
+        events = emulate(prog).events
+    renderer = GenRenderer(prog)
+    if chs is None:
+        tproc_chs = set([e.ch for e in events if e.kind == 'set'])
+        chs = [renderer.tproc_chs[x] for x in sorted(tproc_chs) if x in renderer.tproc_chs]
+    return {ch: renderer.render(events, ch) for ch in chs}
@@ -16,6 +16,9 @@ class DataStreamer():
     :type soc: QickSoc
     """
 
+    # fraction of the average buffer to transfer at a time
+    STRIDE_FRACTION = 0.1
+
     def __init__(self, soc):
         self.soc = soc
 
@@ -114,6 +117,40 @@ class DataStreamer():
                 break
         return new_data
 
+    def measure_throughput(self, ch=0, lengths=None, repeats=5):
+        """
+        Measure the speed of the transfers that the streaming readout makes: reading the counter from the tProc data memory, and reading the average buffer.
+        The buffer read time is fit as a fixed overhead plus a time per sample.
+        Don't run this while a readout is in progress.
+
+        :param ch: ADC channel to read
+        :type ch: int
+        :param lengths: Transfer lengths to time (if None, lengths up to the stride used by the streaming readout)
+        :type lengths: list
+        :param repeats: Number of times to repeat each transfer
+        :type repeats: int
+        :return: Time per counter read ('poll', in seconds), overhead per buffer transfer ('overhead', in seconds) and transfer rate ('rate', in samples per second)
+        :rtype: dict
+        """
+        if lengths is None:
+            stride = int(self.STRIDE_FRACTION * self.soc.get_avg_max_length(0))
+            lengths = [max(2, stride//8), max(4, stride//2), max(6, stride)]
+        lengths = [length - length % 2 for length in lengths]
+
+        t_start = time.time()
+        for i in range(repeats):
+            self.soc.tproc.single_read(addr=1)
+        poll = (time.time() - t_start)/repeats
+
+        times = []
+        for length in lengths:
+            t_start = time.time()
+            for i in range(repeats):
+                self.soc.get_accumulated(ch=ch, address=0, length=length)
+            times.append((time.time() - t_start)/repeats)
+        slope, overhead = np.polyfit(lengths, times, 1)
+        return {'poll': poll, 'overhead': max(float(overhead), 0.0), 'rate': 1/float(slope) if slope > 0 else np.inf}
+
     def _run_readout(self, total_count, counter_addr, ch_list, reads_per_count):
         """
         Worker process for the streaming readout
@@ -131,7 +168,7 @@ class DataStreamer():
             count = 0
             last_count = 0
             # how many measurements to transfer at a time
-            stride = int(0.1 * self.soc.get_avg_max_length(0))
+            stride = int(self.STRIDE_FRACTION * self.soc.get_avg_max_length(0))
             # bigger stride is more efficient, but the transfer size must never exceed AVG_MAX_LENGTH, so the stride should be set with some safety margin
 
             # make sure count variable is reset to 0 before starting processor
@@ -157,7 +194,7 @@ class DataStreamer():
                     if length >= self.soc.get_avg_max_length(0):
                         raise RuntimeError("Overflowed the averages buffer (%d unread samples >= buffer size %d)."
                                            % (length, self.soc.get_avg_max_length(0)) +
-                                           "\nYou need to slow down the tProc by increasing relax_delay." +
+                                           "\nYou need to slow down the tProc by increasing relax_delay (averager_program.analyze_streaming() can estimate a safe value)." +
                                            "\nIf the TQDM progress bar is enabled, disabling it may help.")
 
                     # buffer for each channel
@@ -0,0 +1,68 @@
+"""
+Make the library modules importable under the names they use for each other (e.g. "qick_asmdemo").
+Where the board-side packages (pynq, xrfclk, xrfdc, bitfile_path, tqdm) aren't installed, minimal stand-ins are registered,
+so the drivers can be tested with fake memories.
+"""
+import os
+import sys
+import types
+import importlib
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+
+class _DefaultIP:
+    """
+    Stand-in for pynq.DefaultIP, with registers kept in a dict.
+    """
+    def __init__(self, description):
+        self._regs = {}
+
+    def write(self, offset, value):
+        self._regs[offset] = value
+
+    def read(self, offset):
+        return self._regs.get(offset, 0)
+
+
+def _stub_module(name, **attrs):
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        sys.modules[name] = module
+
+
+_stub_module('pynq', DefaultIP=_DefaultIP, Overlay=type('Overlay', (), {}),
+             allocate=lambda shape, dtype: np.zeros(shape, dtype=dtype))
+_stub_module('xrfclk')
+_stub_module('xrfdc', RFdc=type('RFdc', (), {}))
+_stub_module('bitfile_path')
+_stub_module('tqdm')
+_stub_module('tqdm.notebook', tqdm=lambda *args, **kwargs: None)
+
+for _name in ['helpers', 'qick_asm', 'parser', 'streamer', 'emulator']:
+    sys.modules.setdefault(_name + 'demo', importlib.import_module(_name))
+
+
+@pytest.fixture
+def soccfg():
+    """
+    Firmware configuration with five full-speed generators, two interpolated generators and two readouts.
+    """
+    from qick_asm import QickConfig
+    gens = []
+    for ch in range(7):
+        if ch < 5:
+            gen = dict(type='axis_signal_gen_v5', maxlen=65536, b_dds=32, fs=6144.0, f_fabric=384.0, samps_per_clk=16)
+        else:
+            gen = dict(type='axis_sg_int4_v1', maxlen=4096, b_dds=16, fs=1536.0, f_fabric=384.0, samps_per_clk=1)
+        gen.update(switch_ch=ch, tproc_ch=ch, dac='%d%d' % (ch//4, ch%4))
+        gens.append(gen)
+    readouts = [dict(avg_maxlen=16384, buf_maxlen=1024, b_dds=32, adc='0%d' % (ch), fs=3072.0, f_fabric=384.0,
+                     trigger_bit=14+ch, tproc_ch=ch) for ch in range(2)]
+    return QickConfig(dict(board='ZCU216', refclk_freq=245.76, fs_proc=384.0, gens=gens, readouts=readouts, iqs=[],
+                           tprocs=[dict(trig_output=7, dmem_size=1024)]))
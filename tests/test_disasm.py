@@ -0,0 +1,54 @@
+import numpy as np
+from qick_asm import QickConfig, QickProgram
+
+# arguments for one instance of each instruction
+EXAMPLE_ARGS = {'pushi': (0, 1, 2, 3),
+                'popi': (0, 1),
+                'mathi': (0, 1, 2, '+', 4),
+                'seti': (0, 1, 2, 3),
+                'synci': (100,),
+                'waiti': (0, 100),
+                'bitwi': (0, 1, 2, '<<', 4),
+                'memri': (0, 1, 2),
+                'memwi': (0, 1, 2),
+                'regwi': (0, 1, 2),
+                'setbi': (0, 1, 2),
+                'loopnz': (0, 1, 'target'),
+                'end': (),
+                'condj': (0, 1, '<', 3, 'target'),
+                'math': (0, 1, 2, '-', 4),
+                'set': (0, 1, 2, 3, 4, 5, 6, 7),
+                'sync': (0, 1),
+                'read': (0, 1, 'upper', 3),
+                'wait': (0, 1),
+                'bitw': (0, 1, 2, '|', 4),
+                'memr': (0, 1, 2),
+                'memw': (0, 1, 2),
+                'setb': (0, 1, 2)}
+
+
+def make_program():
+    prog = QickProgram(QickConfig({'gens': [], 'readouts': []}))
+    prog.label('target')
+    for name in QickProgram.instructions:
+        getattr(prog, name)(*EXAMPLE_ARGS[name])
+    return prog
+
+
+def test_example_args_cover_every_instruction():
+    assert set(EXAMPLE_ARGS) == set(QickProgram.instructions)
+
+
+def test_disasm_lines():
+    prog = make_program()
+    lines = QickProgram.disasm_lines(prog.compile_image())
+    assert [line.split()[0].rstrip(';') for line in lines] == list(QickProgram.instructions)
+    assert lines[list(QickProgram.instructions).index('wait')] == "wait 0, $1;"
+
+
+def test_disassemble_roundtrip():
+    prog = make_program()
+    image = prog.compile_image()
+    decoded = QickProgram.disassemble(prog.soccfg, image, labels=prog.labels)
+    assert np.array_equal(decoded.compile_image(), image)
+    assert str(decoded) == str(prog)
@@ -0,0 +1,144 @@
+import pytest
+from qick_asm import QickConfig, QickProgram
+from averager_program import AveragerProgram
+from emulator import TProcEmulator, emulate
+
+
+def bare_program():
+    return QickProgram(QickConfig({'gens': [], 'readouts': [], 'tprocs': [{'dmem_size': 64}]}))
+
+
+class PulseProgram(AveragerProgram):
+    def initialize(self):
+        self.declare_gen(ch=0, nqz=1)
+        self.declare_readout(ch=0, freq=100, length=100)
+        self.set_pulse_registers(ch=0, style="const", freq=self.freq2reg(100, gen_ch=0), phase=0, gain=1000, length=50)
+        self.synci(200)
+
+    def body(self):
+        self.trigger(adcs=[0], adc_trig_offset=30)
+        self.pulse(ch=0, t=10)
+        self.sync_all(100)
+
+
+def test_averager_program(soccfg):
+    reps = 5
+    prog = PulseProgram(soccfg, {'reps': reps})
+    emu = emulate(prog)
+    pulses = [e for e in emu.events if e.kind == 'set']
+    triggers = [e for e in emu.events if e.kind == 'seti']
+    # one pulse, and a trigger on and off, in each repetition
+    assert len(pulses) == reps
+    assert len(triggers) == 2*reps
+    assert len(emu.events) == 3*reps
+    assert [e.ch for e in pulses] == [soccfg['gens'][0]['tproc_ch']]*reps
+    # sync_all() waits for the end of the readout (trigger offset plus readout length), plus 100 cycles
+    period = 30 + 100 + 100
+    assert [e.time for e in pulses] == [200 + 10 + period*i for i in range(reps)]
+    assert [e.time for e in triggers[::2]] == [200 + 30 + period*i for i in range(reps)]
+    # the template's shot counter, written to data memory
+    assert emu.dmem[1] == reps
+    assert all(e.clock <= e.time for e in emu.events)
+
+
+def test_loopnz_condj():
+    prog = bare_program()
+    prog.regwi(0, 1, 3)
+    prog.regwi(0, 2, 0)
+    prog.regwi(0, 3, 2)
+    prog.label("LOOP")
+    prog.mathi(0, 2, 2, "+", 1)
+    # skip the seti when the count is odd
+    prog.bitwi(0, 4, 2, "&", 1)
+    prog.condj(0, 4, "!=", 0, "SKIP")
+    prog.seti(1, 0, 2, 0)
+    prog.label("SKIP")
+    prog.synci(10)
+    prog.loopnz(0, 1, "LOOP")
+    # count down with condj
+    prog.label("DOWN")
+    prog.seti(2, 0, 3, 0)
+    prog.mathi(0, 3, 3, "-", 1)
+    prog.condj(0, 3, ">", 0, "DOWN")
+    prog.end()
+    emu = emulate(prog)
+    assert [(e.ch, e.values, e.time) for e in emu.events] == [(1, (2,), 10), (1, (4,), 30),
+                                                                  (2, (2,), 40), (2, (1,), 40)]
+    assert emu.regs[2] == 4
+
+
+def test_memory():
+    prog = bare_program()
+    prog.regwi(0, 1, 1234)
+    prog.memwi(0, 1, 5)
+    prog.memri(0, 2, 5)
+    prog.regwi(0, 3, 6)
+    prog.memw(0, 2, 3)
+    prog.memr(0, 4, 3)
+    prog.end()
+    emu = emulate(prog)
+    assert emu.dmem[5] == emu.dmem[6] == 1234
+    assert emu.regs[2] == emu.regs[4] == 1234
+
+
+@pytest.mark.parametrize("insts, message", [
+    ([('memwi', 0, 1, 64)], r"instruction 0 \(memwi\): data memory address 64 out of range"),
+    ([('memri', 0, 1, -1)], r"instruction 0 \(memri\): data memory address -1 out of range"),
+    ([('regwi', 0, 2, 100), ('memr', 0, 1, 2)], r"instruction 1 \(memr\): data memory address 100 out of range"),
+    ([('regwi', 0, 2, -1), ('memw', 0, 1, 2)], r"instruction 1 \(memw\): data memory address 4294967295 out of range"),
+])
+def test_memory_bounds(insts, message):
+    prog = bare_program()
+    for inst in insts:
+        getattr(prog, inst[0])(*inst[1:])
+    prog.end()
+    with pytest.raises(RuntimeError, match=message):
+        emulate(prog)
+
+
+def test_stack():
+    prog = bare_program()
+    prog.regwi(0, 1, 7)
+    prog.pushi(0, 2, 1, 8)
+    prog.popi(0, 3)
+    prog.end()
+    emu = emulate(prog)
+    assert emu.regs[2] == 8
+    assert emu.regs[3] == 7
+
+    prog = bare_program()
+    prog.pushi(0, 1, 1, 0)
+    prog.pushi(0, 1, 1, 0)
+    prog.pushi(0, 1, 1, 0)
+    prog.end()
+    with pytest.raises(RuntimeError, match=r"instruction 2 \(pushi\): stack overflow"):
+        emulate(prog, stack_size=2)
+
+    prog = bare_program()
+    prog.popi(0, 1)
+    prog.end()
+    with pytest.raises(RuntimeError, match=r"instruction 0 \(popi\): stack underflow"):
+        emulate(prog)
+
+
+def test_sign_extension():
+    prog = bare_program()
+    prog.regwi(0, 1, 2**30 - 1)
+    prog.regwi(0, 2, 2**30)
+    prog.regwi(0, 3, 2**31 - 1)
+    prog.regwi(0, 4, -5)
+    prog.mathi(0, 5, 4, "+", -1)
+    prog.end()
+    emu = emulate(prog)
+    assert emu.regs[1:6] == [2**30 - 1, 2**32 - 2**30, 2**32 - 1, 2**32 - 5, 2**32 - 6]
+
+
+def test_max_steps():
+    prog = bare_program()
+    prog.label("FOREVER")
+    prog.condj(0, 0, "==", 0, "FOREVER")
+    prog.end()
+    emu = TProcEmulator()
+    emu.load_program(prog)
+    with pytest.raises(RuntimeError, match="didn't end"):
+        emu.run(max_steps=100)
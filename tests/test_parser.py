@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from qick_asm import QickConfig, QickProgram
+import parser
+
+# one or more lines of each instruction, with the QickProgram arguments that give the same machine code
+# (None for the instructions whose assembly syntax has a different field layout from QickProgram)
+ASM_LINES = [("LOOP: pushi 0, $1, $2, -3;", ('pushi', 0, 2, 1, -3)),
+             ("popi 1, $4;", ('popi', 1, 4)),
+             ("mathi 0, $1, $2 + 0x10;", ('mathi', 0, 1, 2, '+', 0x10)),
+             ("mathi 0, $1, $2 * -5;", ('mathi', 0, 1, 2, '*', -5)),
+             ("seti 7, 0, $3, 100;", ('seti', 7, 0, 3, 100)),
+             ("synci 1000;", ('synci', 1000)),
+             ("waiti 0, 2000;", ('waiti', 0, 2000)),
+             ("bitwi 1, $2, $3 << 4;", ('bitwi', 1, 2, 3, '<<', 4)),
+             ("bitwi 1, $2, ~ 5;", ('bitwi', 1, 2, 0, '~', 5)),
+             ("memri 0, $5, 12;", ('memri', 0, 5, 12)),
+             ("memwi 0, $5, 13;", ('memwi', 0, 5, 13)),
+             ("regwi 2, $6, 123456;", ('regwi', 2, 6, 123456)),
+             ("regwi 2, $6, 0xfffffff;", ('regwi', 2, 6, 0xfffffff)),
+             ("setbi 1, 0, $2, 5;", None),
+             ("loopnz 0, $14, @LOOP;", ('loopnz', 0, 14, 'LOOP')),
+             ("condj 0, $1 >= $2, @END;", ('condj', 0, 1, '>=', 2, 'END')),
+             ("math 1, $2, $3 - $4;", ('math', 1, 2, 3, '-', 4)),
+             ("set 3, 1, $1, $2, $3, $4, $5, $6;", ('set', 3, 1, 1, 2, 3, 4, 5, 6)),
+             ("sync 0, $7;", ('sync', 0, 7)),
+             ("read 1, 0, lower $3;", ('read', 1, 0, 'lower', 3)),
+             ("wait 1, 2, $3;", None),
+             ("bitw 0, $1, $2 ^ $3;", ('bitw', 0, 1, 2, '^', 3)),
+             ("bitw 0, $1, ~ $3;", ('bitw', 0, 1, 0, '~', 3)),
+             ("memr 0, $1, $2;", ('memr', 0, 1, 2)),
+             ("END: memw 0, $1, $2;", ('memw', 0, 1, 2)),
+             ("setb 2, 1, $1, $2, $3, $4, $5, $6;", None),
+             ("end;", ('end',))]
+
+# machine code for the instructions with their own field layouts, see parser._asm_fmt
+ASM_ONLY = {'setbi': (0b00011010 << 56) | (0 << 53) | (1 << 50) | (2 << 36) | 5,
+            'wait': (0b01010100 << 56) | (2 << 53) | (1 << 50) | (3 << 31),
+            'setb': (0b01011000 << 56) | (1 << 53) | (2 << 50) | (1 << 36) | (6 << 31)
+                    | (2 << 26) | (3 << 21) | (4 << 16) | (5 << 11)}
+
+
+def asm_source():
+    return "// test program\n" + "\n".join([line for line, call in ASM_LINES]) + "\n"
+
+
+def test_lines_cover_every_instruction():
+    names = {line.split(':')[-1].split()[0].rstrip(';') for line, call in ASM_LINES}
+    assert names == set(QickProgram.instructions)
+
+
+def test_assemble_matches_qickprogram():
+    image = parser.assemble_source(asm_source())
+    prog = QickProgram(QickConfig({'gens': [], 'readouts': []}))
+    expected = []
+    for line, call in ASM_LINES:
+        if ':' in line:
+            prog.label(line.split(':')[0])
+        if call is None:
+            name = line.split()[0]
+            expected.append(ASM_ONLY[name])
+            # placeholder, so the addresses of the labels stay the same
+            prog.end()
+        else:
+            getattr(prog, call[0])(*call[1:])
+    prog_image = prog.compile_image()
+    for addr, (line, call) in enumerate(ASM_LINES):
+        if call is None:
+            prog_image[addr] = expected.pop(0)
+    assert image.dtype == np.uint64
+    assert image.tolist() == prog_image.tolist()
+
+
+def test_file_entry_points(tmp_path):
+    fname = tmp_path / "prog.asm"
+    fname.write_text(asm_source())
+    image = parser.assemble_source(asm_source())
+    assert parser.assemble(str(fname)).tolist() == image.tolist()
+    assert parser.parse_prog(str(fname), "bin") == {i: "{:064b}".format(x) for i, x in enumerate(image.tolist())}
+    hexprog = parser.parse_prog(str(fname), "hex")
+    assert hexprog[0].startswith("{:016x} -> pushi".format(image[0]))
+    assert parser.parse_to_bin(str(fname), cache=False) == image.tolist()
+
+
+@pytest.mark.parametrize("line, message", [
+    ("regwi 0, 3, 5;", "bad format on instruction @1"),
+    ("condj 0, $1 < $2, @NOWHERE;", "could not resolve symbol NOWHERE"),
+    ("regwi 0, $3, 2000000000;", "out of range"),
+    ("regwi 0, $300, 1;", "is bigger than"),
+    ("math 0, $1, $2 / $3;", "bad format"),
+])
+def test_errors(line, message):
+    with pytest.raises(RuntimeError, match=message):
+        parser.assemble_source("regwi 0, $1, 0;\n" + line + "\nend;\n")
+
+
+def test_cache(tmp_path):
+    cache = parser.AsmCache(path=str(tmp_path))
+    source = asm_source()
+    assert cache.get(source) is None
+    image = parser.assemble_source(source)
+    cache.put(source, image)
+    assert cache.get(source).tolist() == image.tolist()
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_key_follows_instruction_tables(tmp_path, monkeypatch):
+    cache = parser.AsmCache(path=str(tmp_path))
+    source = asm_source()
+    fname = cache.filename(source)
+    regwi = dict(QickProgram.instructions['regwi'], bin=0b00011011)
+    monkeypatch.setitem(QickProgram.instructions, 'regwi', regwi)
+    monkeypatch.setattr(parser, '_digest', None)
+    assert cache.filename(source) != fname
@@ -0,0 +1,63 @@
+import pytest
+from qick_asm import QickConfig, QickProgram, Register
+
+
+def make_program(n_gens=3):
+    return QickProgram(QickConfig({'gens': [{}]*n_gens, 'readouts': []}))
+
+
+def test_new_reg_avoids_reserved_and_used():
+    prog = make_program()
+    prog.regwi(0, 1, 5)
+    assert prog.new_reg() == Register(0, 2)
+    assert prog.new_reg(page=1) == Register(1, 1)
+    reserved = prog._reserved_registers()
+    with prog.reg_scope():
+        regs = [prog.new_reg(page=1) for i in range(12)]
+        assert not reserved & set(regs)
+        with pytest.raises(RuntimeError, match="no free registers in page 1"):
+            prog.new_reg(page=1)
+    assert prog.new_reg(page=1) == Register(1, 2)
+
+
+def test_free_reg():
+    prog = make_program()
+    reg = prog.new_reg()
+    prog.free_reg(reg)
+    assert prog.new_reg() == reg
+    with pytest.raises(RuntimeError, match="not allocated"):
+        prog.free_reg(Register(3, 4))
+
+
+@pytest.mark.parametrize("page", [-1, 8, 9])
+def test_new_reg_bad_page(page):
+    with pytest.raises(RuntimeError, match="doesn't exist"):
+        make_program().new_reg(page=page)
+
+
+def test_free_registers_exclude_pulse_registers():
+    prog = make_program()
+    free = prog._free_registers()
+    reserved = prog._reserved_registers()
+    for page in range(8):
+        assert free[page] == [reg for reg in range(1, 32) if (page, reg) not in reserved]
+    # page 1 has the pulse registers of generators 1 and 2
+    assert free[1] == list(range(1, 13)) + [31]
+
+
+def test_roll_loops_uses_free_registers():
+    prog = make_program()
+    # use all the unreserved registers of page 0, so the loop counter must come from another page
+    reserved = prog._reserved_registers()
+    for reg in range(1, 32):
+        if (0, reg) not in reserved:
+            prog.regwi(0, reg, 0)
+    for i in range(6):
+        prog.regwi(1, 1, 100*i)
+        prog.seti(1, 1, 1, 0)
+    prog.end()
+    used = prog._used_registers()
+    assert prog.roll_loops()['loops'] == 1
+    new = prog._used_registers() - used
+    assert new
+    assert not new & prog._reserved_registers()
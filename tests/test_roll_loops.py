@@ -0,0 +1,35 @@
+import pytest
+from qick_asm import QickConfig, QickProgram
+from emulator import emulate
+
+
+def make_program(values):
+    prog = QickProgram(QickConfig({'gens': [], 'readouts': [], 'tprocs': [{}]}))
+    for value in values:
+        prog.regwi(1, 3, value)
+        prog.seti(2, 1, 3, 10)
+    prog.end()
+    return prog
+
+
+def outputs(prog):
+    # the rolled program takes more tProc cycles, so compare everything but the clock
+    return [(e.time, e.kind, e.ch, e.values) for e in emulate(prog).events]
+
+
+@pytest.mark.parametrize("values, rolled", [
+    ([100 + 50*k for k in range(6)], True),
+    ([1000 - 7*k for k in range(6)], True),
+    ([2**30 - 6 + k for k in range(6)], True),
+    # values that the tProc sign-extends can't be made by stepping
+    ([2**30 - 3 + k for k in range(6)], False),
+    ([2**30 + k for k in range(6)], False),
+    ([-3 + k for k in range(6)], False),
+])
+def test_roll_loops_keeps_outputs(values, rolled):
+    prog = make_program(values)
+    before = outputs(prog)
+    result = prog.roll_loops()
+    assert (result['loops'] > 0) == rolled
+    assert result['new_length'] < result['old_length'] or not rolled
+    assert outputs(prog) == before
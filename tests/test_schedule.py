@@ -0,0 +1,123 @@
+import pytest
+from qick_asm import QickProgram
+from emulator import emulate
+
+
+def make_program(soccfg):
+    prog = QickProgram(soccfg)
+    for ch in range(5):
+        prog.declare_gen(ch=ch, nqz=1)
+    prog.declare_readout(ch=0, freq=100, length=40)
+    return prog
+
+
+def const_pulse(prog, ch, length, freq=100):
+    return dict(style='const', freq=prog.freq2reg(freq, gen_ch=ch), phase=0, gain=1000, length=length)
+
+
+def insts(prog, name):
+    return [inst['args'] for inst in prog.prog_list if inst['name'] == name]
+
+
+def test_after_align_delay(soccfg):
+    prog = make_program(soccfg)
+    with prog.schedule() as blk:
+        a = blk.pulse(ch=1, **const_pulse(prog, 1, 20))
+        b = blk.pulse(ch=3, after=a, delay=5, **const_pulse(prog, 3, 30))
+        c = blk.pulse(ch=0, align=b, **const_pulse(prog, 0, 10))
+        d = blk.pulse(ch=4, t=7, **const_pulse(prog, 4, 10))
+        e = blk.pulse(ch=2, after=[b, d], **const_pulse(prog, 2, 10))
+    assert blk.starts == [0, 25, 25, 7, 55]
+    assert blk.ends == [20, 55, 35, 17, 65]
+    assert prog.dac_ts[:5] == [35, 20, 65, 55, 17]
+    prog.end()
+    events = [(ev.time, ev.ch) for ev in emulate(prog).events]
+    assert events == [(0, 1), (7, 4), (25, 3), (25, 0), (55, 2)]
+
+
+def test_shared_page(soccfg):
+    prog = make_program(soccfg)
+    with prog.schedule() as blk:
+        a = blk.pulse(ch=0, t=10, **const_pulse(prog, 0, 20))
+        # generators 1 and 2 share page 1, so their pulses at the same time share a time register
+        blk.pulse(ch=1, align=a, **const_pulse(prog, 1, 20))
+        blk.pulse(ch=2, align=a, **const_pulse(prog, 2, 20))
+    assert blk.starts == [10, 10, 10]
+    time_writes = [args for args in insts(prog, 'regwi') if len(args) > 3 and str(args[3]).startswith('t = ')]
+    assert [args[0] for args in time_writes] == [0, 1]
+    sets = insts(prog, 'set')
+    assert len(sets) == 3
+    assert sets[1][1] == sets[2][1] == 1
+    assert sets[1][7] == sets[2][7] == time_writes[1][1]
+    prog.end()
+    assert [ev.time for ev in emulate(prog).events] == [10, 10, 10]
+
+
+def test_pulse_at_zero_uses_register_0(soccfg):
+    prog = make_program(soccfg)
+    with prog.schedule() as blk:
+        blk.pulse(ch=1, **const_pulse(prog, 1, 20))
+    assert insts(prog, 'set')[0][7] == 0
+    assert not [args for args in insts(prog, 'regwi') if len(args) > 3 and str(args[3]).startswith('t = ')]
+
+
+def test_replayed_pulse_parameters(soccfg):
+    prog = make_program(soccfg)
+    with prog.schedule() as blk:
+        blk.pulse(ch=1, **const_pulse(prog, 1, 20, freq=100))
+        blk.pulse(ch=1, **const_pulse(prog, 1, 30, freq=200))
+        blk.pulse(ch=1, delay=4, after=1, **const_pulse(prog, 1, 10, freq=300))
+    # the generator can't play two pulses at once, so each pulse waits for the last
+    assert blk.starts == [0, 20, 54]
+    assert blk.ends == [20, 50, 64]
+    prog.end()
+    events = emulate(prog).events
+    assert [ev.time for ev in events] == [0, 20, 54]
+    # the first register of each pulse is the frequency
+    assert [ev.values[0] for ev in events] == [prog.freq2reg(f, gen_ch=1) for f in [100, 200, 300]]
+
+
+def test_replayed_pulse_needs_parameters(soccfg):
+    prog = make_program(soccfg)
+    with prog.schedule() as blk:
+        blk.pulse(ch=1, **const_pulse(prog, 1, 20))
+        with pytest.raises(RuntimeError, match="its registers are not available"):
+            blk.pulse(ch=1)
+
+
+def test_triggers_share_r_out(soccfg):
+    prog = make_program(soccfg)
+    with prog.schedule(sync=10) as blk:
+        m = blk.measure(adcs=[0], pulse_ch=1, adc_trig_offset=20, **const_pulse(prog, 1, 20))
+        blk.trigger(adcs=[0], adc_trig_offset=20, after=m)
+        blk.trigger(pins=[0], adc_trig_offset=20, t=100)
+    # the second ADC trigger waits for the end of the first readout (20 + 40), less its own offset
+    assert blk.starts == [0, 0, 40, 100]
+    out_writes = [args for args in insts(prog, 'regwi') if args[1] == 31]
+    # the two ADC triggers write the same output value, the pin trigger a different one
+    assert [args[2] for args in out_writes] == [1 << 14, 1 << 0]
+    trig_output = soccfg['tprocs'][0]['trig_output']
+    setis = insts(prog, 'seti')
+    assert [(args[0], args[2], args[3]) for args in setis] == [(trig_output, 31, 20), (trig_output, 0, 30),
+                                                               (trig_output, 31, 60), (trig_output, 0, 70),
+                                                               (trig_output, 31, 100), (trig_output, 0, 110)]
+    # the block ends with a sync past the end of the last readout (40 + 20 + 40)
+    assert insts(prog, 'synci') == [(110,)]
+
+
+def test_contradictory_constraints(soccfg):
+    prog = make_program(soccfg)
+    blk = prog.schedule()
+    a = blk.pulse(ch=1, **const_pulse(prog, 1, 20))
+    b = blk.pulse(ch=3, after=a, **const_pulse(prog, 3, 20))
+    # starting with a, but after b, which starts after a ends
+    blk.pulse(ch=2, align=a, after=b, **const_pulse(prog, 2, 20))
+    with pytest.raises(RuntimeError, match="contradict"):
+        blk.resolve()
+
+
+def test_bad_item_reference(soccfg):
+    prog = make_program(soccfg)
+    blk = prog.schedule()
+    with pytest.raises(RuntimeError, match="not an earlier item"):
+        blk.pulse(ch=1, after=0, **const_pulse(prog, 1, 20))
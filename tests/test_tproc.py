@@ -0,0 +1,39 @@
+import numpy as np
+import qick
+from qick_asm import QickProgram
+
+REGWI = QickProgram.instructions['regwi']['bin'] << 56
+END = qick.AxisTProc64x32_x8.END_INST
+
+
+class FakeMMIO:
+    def __init__(self, nwords):
+        self.array = np.zeros(2*nwords, dtype=np.uint32)
+        self.length = 8*nwords
+
+
+class FakeMem:
+    def __init__(self, nwords):
+        self.mmio = FakeMMIO(nwords)
+
+
+def make_tproc(pmem_n=6):
+    tproc = qick.AxisTProc64x32_x8({'fullpath': 'tproc', 'type': 'xilinx.com:user:axis_tproc64x32_x8:1.0',
+                                    'parameters': {'DMEM_N': 10, 'PMEM_N': pmem_n}})
+    tproc.configure(FakeMem(2**pmem_n), None)
+    return tproc
+
+
+def test_delta_load_after_reset():
+    # regwi with nonzero immediates, so the low halves are nonzero
+    prog_a = [REGWI | (i << 53) | (1 << 41) | (0x1000 + i) for i in range(5)] + [END]
+    prog_b = [REGWI | (1 << 41) | 0x2000, END]
+    # regwi with zero immediates: the low halves are all 0
+    prog_c = [REGWI | (i << 53) | (2 << 41) for i in range(5)] + [END]
+
+    tproc = make_tproc()
+    tproc.load_bin_program(prog_a, delta=False)
+    tproc.load_bin_program(prog_b, delta=False)
+    tproc.load_bin_program(prog_c, delta=True)
+    tproc.verify_pmem(prog_c)
+    assert np.all(tproc.read_pmem() == tproc.pmem_shadow)